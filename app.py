@@ -29,12 +29,31 @@ from workflows import (
     find_workflow_by_name,
     execute_workflow,
 )
+from context_builder import build_context, context_budget, priority_indexes
+from persistence import flush as flush_pending_writes
+from ollama_client import configure_pool, close_session, DEFAULT_POOL_SIZE
+from backends import configure_backends, start_health_checks
+from model_residency import configure_residency, plan_residency, warm_up
+from response_cache import configure_cache, DEFAULT_TTL, DEFAULT_MAX_ENTRIES
+from inference_engine import (
+    submit_request,
+    configure_dispatch,
+    shutdown_engine,
+    DEFAULT_TIMEOUT,
+    DEFAULT_MAX_REQUESTS,
+    DEFAULT_MODEL_CONCURRENCY,
+    PRIORITY_FOLLOW_UP,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_LOW,
+)
 from transcripts import (
-    load_history,
+    get_history,
+    agent_history,
     append_message,
     clear_history,
     export_history,
     summarize_history,
+    sync_history,
 )
 from tab_chat import ChatTab
 from tab_agents import AgentsTab
@@ -46,13 +65,21 @@ from tab_metrics import MetricsTab
 from tab_finetune import FinetuneTab
 from tab_docs import DocumentationTab
 from tab_workflows import WorkflowsTab, WorkflowRunnerDialog
-from metrics import load_metrics, record_tool_usage, record_response_time
+from metrics import (
+    load_metrics, record_tool_usage, record_response_time, record_queue_wait,
+    record_cache_lookup,
+)
 from tool_utils import (
-    generate_tool_instructions_message,
     format_tool_call_html,
     format_tool_result_html,
     format_tool_block_html,
+    format_tool_running_html,
+    format_tool_results_message,
+    parse_tool_requests,
+    MAX_TOOL_REQUESTS,
 )
+from tool_executor import run_tools_async, shutdown_tool_executor
+from prompt_cache import system_prompt_for, invalidate_prompts
 from local_llm_helper import get_installed_models
 import tts
 
@@ -105,9 +132,25 @@ class AIChatApp(QMainWindow):
         self.dark_mode = True
         self.screenshot_interval = 5
         self.ollama_port = 11434
+        self.ollama_pool_size = DEFAULT_POOL_SIZE
+        # Extra Ollama servers to route requests to: {"url": ..., "models": [...]}
+        self.ollama_hosts = []
+        self.request_timeout = DEFAULT_TIMEOUT
+        self.max_concurrent_requests = DEFAULT_MAX_REQUESTS
+        self.model_concurrency = DEFAULT_MODEL_CONCURRENCY
+        # Send a chat message to every eligible agent at once instead of in turn
+        self.parallel_dispatch = False
+        # Preload agent models at startup; unload beyond this many GB (0 = no limit)
+        self.preload_models = True
+        self.model_ram_budget_gb = 0
+        self.response_cache_enabled = False
+        self.response_cache_ttl_hours = DEFAULT_TTL // 3600
+        self.response_cache_entries = DEFAULT_MAX_ENTRIES
         self.api_url = self.build_api_url()
         self.screenshot_manager = ScreenshotManager()
         self.active_worker_threads = []
+        # Chat requests running on the inference engine, keyed by worker
+        self.active_requests = {}
         self.notifications_paused = False
         self.screenshot_paused = False
         self.summarization_threshold = 20
@@ -270,6 +313,7 @@ class AIChatApp(QMainWindow):
         # Load settings and agents
         self.load_settings()
         self.populate_agents()
+        self.prepare_models()
         self.update_send_button_state()
         self.update_screenshot_timer()
         
@@ -609,13 +653,49 @@ class AIChatApp(QMainWindow):
                 "summarization_threshold", self.summarization_threshold
             )
             self.ollama_port = settings_data.get("ollama_port", self.ollama_port)
+            self.ollama_pool_size = settings_data.get("ollama_pool_size", self.ollama_pool_size)
+            self.ollama_hosts = settings_data.get("ollama_hosts", self.ollama_hosts)
+            self.request_timeout = settings_data.get("request_timeout", self.request_timeout)
+            self.max_concurrent_requests = settings_data.get(
+                "max_concurrent_requests", self.max_concurrent_requests
+            )
+            self.model_concurrency = settings_data.get("model_concurrency", self.model_concurrency)
+            self.parallel_dispatch = settings_data.get("parallel_dispatch", self.parallel_dispatch)
+            self.preload_models = settings_data.get("preload_models", self.preload_models)
+            self.model_ram_budget_gb = settings_data.get(
+                "model_ram_budget_gb", self.model_ram_budget_gb
+            )
+            self.response_cache_enabled = settings_data.get(
+                "response_cache_enabled", self.response_cache_enabled
+            )
+            self.response_cache_ttl_hours = settings_data.get(
+                "response_cache_ttl_hours", self.response_cache_ttl_hours
+            )
+            self.response_cache_entries = settings_data.get(
+                "response_cache_entries", self.response_cache_entries
+            )
+            configure_pool(self.ollama_pool_size, debug_enabled=self.debug_enabled)
+            configure_dispatch(
+                self.max_concurrent_requests, self.model_concurrency, self.debug_enabled
+            )
+            self.apply_cache_settings()
+            configure_residency(self.model_ram_budget_gb, self.debug_enabled)
             self.api_url = self.build_api_url()
+            self.apply_backend_settings()
             self.apply_updated_styles()
             self.agents_tab.update_model_dropdown()
             self.update_screenshot_timer()
             self.save_settings()
             self.show_notification("Settings updated successfully")
 
+    def apply_cache_settings(self):
+        configure_cache(
+            self.response_cache_enabled,
+            self.response_cache_ttl_hours * 3600,
+            self.response_cache_entries,
+            self.debug_enabled,
+        )
+
     def apply_updated_styles(self):
         if self.dark_mode:
             self.apply_dark_mode_style()
@@ -626,6 +706,13 @@ class AIChatApp(QMainWindow):
         """Return the Ollama API URL based on the configured port."""
         return f"http://localhost:{self.ollama_port}/api/chat"
 
+    def apply_backend_settings(self):
+        """Route agent requests between the local server and extra hosts."""
+        hosts = [f"http://localhost:{self.ollama_port}"] + list(self.ollama_hosts)
+        configure_backends(hosts, self.debug_enabled)
+        if self.ollama_hosts:
+            start_health_checks(self.debug_enabled)
+
     # -------------------------------------------------------------------------
     # Chat / UI Utility
     # -------------------------------------------------------------------------
@@ -689,14 +776,14 @@ class AIChatApp(QMainWindow):
         # The problematic 'else' block has been removed.
         # 'enabled_agents' is now correctly populated by the if/else logic above.
 
-        def process_next_agent(index):
-            if index is None or index >= len(enabled_agents):
-                self.chat_tab.send_button.setEnabled(True)  # Re-enable send button after all agents have responded
-                self.chat_tab.hide_typing_indicator()
-                if self.chat_tab.last_user_message_id:
-                    self.chat_tab.update_message_status(self.chat_tab.last_user_message_id, "read")
-                return
+        def finish_turn():
+            self.chat_tab.send_button.setEnabled(True)  # Re-enable send button after all agents have responded
+            self.chat_tab.hide_typing_indicator()
+            if self.chat_tab.last_user_message_id:
+                self.chat_tab.update_message_status(self.chat_tab.last_user_message_id, "read")
 
+        def start_agent(index, on_done):
+            """Submit a request for agent ``index``; return False if it was skipped."""
             agent_name, agent_settings = enabled_agents[index]
             if self.debug_enabled:
                 print(f"[Debug] Processing agent: {agent_name}")
@@ -704,8 +791,7 @@ class AIChatApp(QMainWindow):
             model_name = agent_settings.get("model", "llama3.2-vision").strip()
             if not model_name:
                 QMessageBox.warning(self, "Invalid Model Name", f"Agent '{agent_name}' has no valid model name.")
-                process_next_agent(index + 1)
-                return
+                return False
 
             temperature = agent_settings.get("temperature", 0.7)
             max_tokens = agent_settings.get("max_tokens", 512)
@@ -718,29 +804,68 @@ class AIChatApp(QMainWindow):
             else: # Default to old behavior for Assistant agents
                 chat_history = self.build_agent_chat_history(agent_name)
             
-            thread = QThread()
             # Pass the agents_data to the AIWorker
-            worker = AIWorker(model_name, chat_history, temperature, max_tokens, self.debug_enabled, agent_name, self.agents_data, self.api_url)
-            worker.moveToThread(thread)
-            self.active_worker_threads.append((worker, thread))
+            worker = AIWorker(model_name, chat_history, temperature, max_tokens, self.debug_enabled, agent_name, self.agents_data)
 
             def on_finished():
-                self.worker_finished_sequential(worker, thread, agent_name, index, process_next_agent)
+                on_done(worker, request, agent_name)
 
             worker.response_received.connect(self.handle_ai_response_chunk)
+            worker.thought_received.connect(self.handle_thought_chunk)
             worker.error_occurred.connect(self.handle_worker_error)
             worker.finished.connect(on_finished)
 
-            thread.started.connect(worker.run)
-            thread.start()
+            request = submit_request(worker, self.request_timeout, self.debug_enabled, PRIORITY_INTERACTIVE)
+            self.active_requests[worker] = request
             self.response_start_times[worker] = time.time()
+            self.chat_tab.stop_button.setEnabled(True)
+            return True
 
-        process_next_agent(0)
+        def process_next_agent(index):
+            if index is None or index >= len(enabled_agents):
+                finish_turn()
+                return
+
+            def on_done(worker, request, agent_name):
+                self.worker_finished_sequential(worker, request, agent_name, index, process_next_agent)
+
+            if not start_agent(index, on_done):
+                process_next_agent(index + 1)
+
+        if not self.parallel_dispatch or len(enabled_agents) < 2:
+            process_next_agent(0)
+            return
+
+        # Parallel dispatch: every agent starts now and the inference engine's
+        # limits decide how many run at once. Replies are shown and saved as
+        # they finish, each recording its place in the dispatch order.
+        turn = {"running": 0, "finished": 0}
+
+        def parallel_done(index):
+            def on_done(worker, request, agent_name):
+                turn["running"] -= 1
+                turn["finished"] += 1
+                order = {
+                    "reply_to": user_message["timestamp"],
+                    "position": index + 1,
+                    "finished": turn["finished"],
+                }
+                self.worker_finished_sequential(worker, request, agent_name, None, None, order=order)
+                if not turn["running"]:
+                    finish_turn()
+            return on_done
+
+        for index in range(len(enabled_agents)):
+            if start_agent(index, parallel_done(index)):
+                turn["running"] += 1
+        if not turn["running"]:
+            finish_turn()
 
     def clear_chat(self):
         if self.debug_enabled:
             print("[Debug] Clearing chat.")
         self.chat_tab.chat_display.clear()
+        self.chat_tab.reset_streams()
         clear_history(self.debug_enabled)
         self.chat_history = []
         self.show_notification("Chat cleared")
@@ -774,9 +899,15 @@ class AIChatApp(QMainWindow):
             QMessageBox.information(self, "Workflow Result", result)
 
     def handle_ai_response_chunk(self, chunk, agent_name):
-        if agent_name not in self.current_responses:
-            self.current_responses[agent_name] = ''
-        self.current_responses[agent_name] += chunk
+        # Collect pieces in a list; they are joined once the reply is done
+        self.current_responses.setdefault(agent_name, []).append(chunk)
+        color = self.agents_data.get(agent_name, {}).get("color", "#000000")
+        self.chat_tab.append_stream(agent_name, chunk, color)
+
+    def handle_thought_chunk(self, chunk, agent_name):
+        # Thinking steps are shown live but not kept in the reply
+        color = self.agents_data.get(agent_name, {}).get("color", "#000000")
+        self.chat_tab.append_stream(agent_name, chunk, color, thinking=True)
 
     def handle_worker_error(self, error_message):
         logging.error(error_message)
@@ -792,12 +923,20 @@ class AIChatApp(QMainWindow):
             self.chat_tab.update_message_status(self.chat_tab.last_user_message_id, "failed")
         self.show_notification(f"Error: {friendly}", "error")
 
-    def worker_finished_sequential(self, sender_worker, thread, agent_name, index, process_next_agent):
-        assistant_content = self.current_responses.get(agent_name, "")
-        if agent_name in self.current_responses:
-            del self.current_responses[agent_name]
+    def stop_responses(self):
+        """Cancel every chat request that is still running."""
+        if self.debug_enabled:
+            print(f"[Debug] Cancelling {len(self.active_requests)} request(s).")
+        for request in list(self.active_requests.values()):
+            request.cancel()
+        if self.active_requests:
+            self.show_notification("Stopped waiting for responses", "info")
+
+    def worker_finished_sequential(self, sender_worker, request, agent_name, index, process_next_agent,
+                                   order=None):
+        assistant_content = "".join(self.current_responses.pop(agent_name, []))
 
-        tool_request = None
+        tool_requests = []
         task_request = None
         content = assistant_content.strip()
 
@@ -813,10 +952,12 @@ class AIChatApp(QMainWindow):
                     content = "[Response to Coordinator] " + content
                 else:
                     # Specialist is not supposed to respond unless called by the Coordinator
+                    self.chat_tab.discard_stream(agent_name)
                     if process_next_agent is not None and index is not None:
                         process_next_agent(index + 1)
                     return
             else:
+                self.chat_tab.discard_stream(agent_name)
                 if process_next_agent is not None and index is not None:
                     process_next_agent(index + 1)
                 return
@@ -830,8 +971,8 @@ class AIChatApp(QMainWindow):
                 parsed = None
 
         if parsed is not None:
-            if "tool_request" in parsed:
-                tool_request = parsed["tool_request"]
+            if "tool_request" in parsed or "tool_requests" in parsed:
+                tool_requests = parse_tool_requests(parsed)
                 content = parsed.get("content", "").strip()
             if "task_request" in parsed:
                 task_request = parsed["task_request"]
@@ -886,7 +1027,9 @@ class AIChatApp(QMainWindow):
                 else:
                     display_content = clean_content
                 
-                self.chat_tab.append_message_html(
+                # Replace the streamed bubble with the formatted reply
+                self.chat_tab.finish_stream(
+                    agent_name,
                     f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> {display_content}"
                 )
                 if agent_settings.get('tts_enabled'):
@@ -900,6 +1043,8 @@ class AIChatApp(QMainWindow):
                     clean_content,
                     agent_name,
                     debug_enabled=self.debug_enabled,
+                    raw_content=content if thought else None,
+                    order=order,
                 )
         
         # Display the message from a Specialist if specified by Coordinator
@@ -923,7 +1068,8 @@ class AIChatApp(QMainWindow):
             else:
                 display_content = clean_content
             
-            self.chat_tab.append_message_html(
+            self.chat_tab.finish_stream(
+                agent_name,
                 f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> {display_content}"
             )
             if agent_settings.get('tts_enabled'):
@@ -937,8 +1083,12 @@ class AIChatApp(QMainWindow):
                 clean_content,
                 agent_name,
                 debug_enabled=self.debug_enabled,
+                raw_content=content if thought else None,
             )
 
+        # Drop any streamed text that was not turned into a message
+        self.chat_tab.discard_stream(agent_name)
+
         # If there's a next agent specified and it's managed by the Coordinator, process it.
         if next_agent:
             managed_agents = agent_settings.get('managed_agents', [])
@@ -957,15 +1107,23 @@ class AIChatApp(QMainWindow):
         elif process_next_agent is not None and index is not None:
             process_next_agent(index + 1)
 
-        # Handle tool request if any, only if the agent is allowed to use tools
-        if tool_request and agent_settings.get("tool_use", False):
-            tool_name = tool_request.get("name", "")
-            tool_args = tool_request.get("args", {})
-            
-            # Check if the requested tool is enabled for the agent
+        # Handle tool requests if any, only if the agent is allowed to use tools
+        if tool_requests and agent_settings.get("tool_use", False):
+            # Check that each requested tool is enabled for the agent
             enabled_tools = agent_settings.get("tools_enabled", [])
-            if tool_name not in enabled_tools:
-                error_msg = f"[{timestamp}] <span style='color:red;'>[Tool Error] Tool '{tool_name}' is not enabled for agent '{agent_name}'.</span>"
+            calls = []
+            for call in tool_requests:
+                tool_name = call["name"]
+                if tool_name not in enabled_tools:
+                    error = f"[Tool Error] Tool '{tool_name}' is not enabled for agent '{agent_name}'."
+                    notice = f"Tool Error: '{tool_name}' not enabled for agent"
+                elif len(calls) >= MAX_TOOL_REQUESTS:
+                    error = f"[Tool Error] Only {MAX_TOOL_REQUESTS} tool calls are run per reply; skipped '{tool_name}'."
+                    notice = f"Tool Error: too many tool calls from '{agent_name}'"
+                else:
+                    calls.append(call)
+                    continue
+                error_msg = f"[{timestamp}] <span style='color:red;'>{error}</span>"
                 self.chat_tab.append_message_html(error_msg)
                 append_message(
                     self.chat_history,
@@ -974,56 +1132,82 @@ class AIChatApp(QMainWindow):
                     agent_name,
                     debug_enabled=self.debug_enabled,
                 )
-                self.show_notification(f"Tool Error: '{tool_name}' not enabled for agent", "error")
-            else:
-                self.show_notification(
-                    f"Agent '{agent_name}' is using tool: {tool_name}", "info"
-                )
-                tool_result = run_tool(
-                    self.tools, tool_name, tool_args, self.debug_enabled
-                )
-                record_tool_usage(self.metrics, tool_name, self.debug_enabled)
-                self.refresh_metrics_display()
+                self.show_notification(notice, "error")
 
-                # Display tool call and result in a collapsible block
-                block_html = format_tool_block_html(tool_name, tool_args, tool_result)
-                self.chat_tab.append_message_html(
-                    f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> {block_html}"
-                )
-                append_message(
-                    self.chat_history,
-                    "assistant",
-                    f"{agent_name} called {tool_name}",
-                    agent_name,
-                    debug_enabled=self.debug_enabled,
+            if calls:
+                tool_names = ", ".join(call["name"] for call in calls)
+                self.show_notification(
+                    f"Agent '{agent_name}' is using tool: {tool_names}", "info"
                 )
-                if tool_result.startswith("[Tool Error]"):
-                    error_msg = f"[{timestamp}] <span style='color:red;'>{tool_result}</span>"
-                    self.chat_tab.append_message_html(error_msg)
-                    append_message(
-                        self.chat_history,
-                        "assistant",
-                        error_msg,
-                        agent_name,
-                        debug_enabled=self.debug_enabled,
+                block_ids = [
+                    self.chat_tab.begin_tool_block(
+                        f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> "
+                        f"{format_tool_running_html(call['name'], call['args'])}"
+                    )
+                    for call in calls
+                ]
+
+                def on_tool_done(call_index, tool_result):
+                    tool_name = calls[call_index]["name"]
+                    tool_args = calls[call_index]["args"]
+                    record_tool_usage(self.metrics, tool_name, self.debug_enabled)
+                    self.refresh_metrics_display()
+
+                    # Replace the running block with the call and its result
+                    block_html = format_tool_block_html(tool_name, tool_args, tool_result)
+                    self.chat_tab.finish_tool_block(
+                        block_ids[call_index],
+                        f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> {block_html}",
                     )
-                    self.show_notification(f"Tool Error: {tool_result}", "error")
-                else:
                     append_message(
                         self.chat_history,
                         "assistant",
-                        tool_result,
+                        f"{agent_name} called {tool_name}",
                         agent_name,
                         debug_enabled=self.debug_enabled,
                     )
-                    # Send the tool result back to the agent for a follow up
+                    if tool_result.startswith("[Tool Error]"):
+                        error_msg = f"[{timestamp}] <span style='color:red;'>{tool_result}</span>"
+                        self.chat_tab.append_message_html(error_msg)
+                        append_message(
+                            self.chat_history,
+                            "assistant",
+                            error_msg,
+                            agent_name,
+                            debug_enabled=self.debug_enabled,
+                        )
+                        self.show_notification(f"Tool Error: {tool_result}", "error")
+                    else:
+                        append_message(
+                            self.chat_history,
+                            "assistant",
+                            tool_result,
+                            agent_name,
+                            debug_enabled=self.debug_enabled,
+                            tool=tool_name,
+                        )
+                        self.show_notification(
+                            f"Tool executed successfully: {tool_name}", "info"
+                        )
+
+                def on_tools_done(tool_results):
+                    # Send the results back to the agent in one follow up,
+                    # unless every call failed
+                    if all(r.startswith("[Tool Error]") for r in tool_results):
+                        return
                     self.send_message_to_agent(
-                        agent_name, tool_result
-                    )
-                    self.show_notification(
-                        f"Tool executed successfully: {tool_name}", "info"
+                        agent_name,
+                        format_tool_results_message(
+                            [(call["name"], r) for call, r in zip(calls, tool_results)]
+                        ),
                     )
 
+                # The tools run in the background; the follow-up is sent when all finish
+                run_tools_async(
+                    self.tools, calls, on_tool_done, on_tools_done,
+                    debug_enabled=self.debug_enabled,
+                )
+
         # Handle task request if any
         if task_request:
             agent_for_task = task_request.get("agent_name", "Default Agent")
@@ -1055,24 +1239,33 @@ class AIChatApp(QMainWindow):
             record_response_time(self.metrics, agent_name, elapsed, self.debug_enabled)
             self.refresh_metrics_display()
 
-        thread.quit()
-        thread.wait()
+        waited = getattr(sender_worker, "queue_wait", None)
+        if waited is not None:
+            record_queue_wait(self.metrics, agent_name, waited, self.debug_enabled)
 
-        for i, (worker_item, thread_item) in enumerate(self.active_worker_threads):
-            if worker_item == sender_worker:
-                del self.active_worker_threads[i]
-                break
+        cache_result = getattr(sender_worker, "cache_result", None)
+        if cache_result is not None:
+            record_cache_lookup(self.metrics, agent_name, cache_result == "hit", self.debug_enabled)
+
+        self.active_requests.pop(sender_worker, None)
+        if not self.active_requests:
+            self.chat_tab.stop_button.setEnabled(False)
 
         sender_worker.deleteLater()
-        thread.deleteLater()
 
         if process_next_agent is not None and index is not None:
-            process_next_agent(index + 1)
+            # A cancelled turn stops the rest of the round as well
+            if getattr(sender_worker, "cancelled", False):
+                process_next_agent(None)
+            else:
+                process_next_agent(index + 1)
 
-    def send_message_to_agent(self, agent_name, message):
+    def send_message_to_agent(self, agent_name, message, priority=PRIORITY_FOLLOW_UP):
         """
         Sends a message to a specific agent.
-        This is used by the Coordinator to direct messages to managed agents.
+        This is used by the Coordinator to direct messages to managed agents
+        and to return tool results. ``priority`` orders the request among
+        other queued requests.
         """
         timestamp = datetime.now().strftime("%H:%M:%S")
 
@@ -1097,22 +1290,21 @@ class AIChatApp(QMainWindow):
             max_tokens = agent_settings.get("max_tokens", 512)
             chat_history = self.build_agent_chat_history(agent_name)
 
-            thread = QThread()
             # Pass the agents_data to the AIWorker
-            worker = AIWorker(model_name, chat_history, temperature, max_tokens, self.debug_enabled, agent_name, self.agents_data, self.api_url)
-            worker.moveToThread(thread)
-            self.active_worker_threads.append((worker, thread))
+            worker = AIWorker(model_name, chat_history, temperature, max_tokens, self.debug_enabled, agent_name, self.agents_data)
 
             def on_finished():
-                self.worker_finished_sequential(worker, thread, agent_name, None, process_next_agent=None)
+                self.worker_finished_sequential(worker, request, agent_name, None, process_next_agent=None)
 
             worker.response_received.connect(self.handle_ai_response_chunk)
+            worker.thought_received.connect(self.handle_thought_chunk)
             worker.error_occurred.connect(self.handle_worker_error)
             worker.finished.connect(on_finished)
 
-            thread.started.connect(worker.run)
-            thread.start()
+            request = submit_request(worker, self.request_timeout, self.debug_enabled, priority)
+            self.active_requests[worker] = request
             self.response_start_times[worker] = time.time()
+            self.chat_tab.stop_button.setEnabled(True)
         else:
             error_msg = f"[{timestamp}] <span style='color:red;'>[Error] Agent '{agent_name}' is not enabled.</span>"
             self.chat_tab.append_message_html(error_msg)
@@ -1155,6 +1347,8 @@ class AIChatApp(QMainWindow):
                 "automations_enabled": [],
                 "thinking_enabled": False,
                 "thinking_steps": 3,
+                "thinking_samples": 1,
+                "thinking_aggregation": "synthesize",
                 "tts_enabled": False,
             }
             self.agents_data["Default Agent"] = default_agent_settings
@@ -1180,16 +1374,18 @@ class AIChatApp(QMainWindow):
                     "include_image": False,
                     "desktop_history_enabled": False,
                     "screenshot_interval": 5,
-                "role": "Assistant",
-                "description": "A new assistant agent.",
-                "tool_use": False,
+                    "role": "Assistant",
+                    "description": "A new assistant agent.",
+                    "tool_use": False,
                     "tools_enabled": [],
                     "automations_enabled": [],
-                "thinking_enabled": False,
-                "thinking_steps": 3,
-                "tts_enabled": False,
-                "tts_voice": ""
-            }
+                    "thinking_enabled": False,
+                    "thinking_steps": 3,
+                    "thinking_samples": 1,
+                    "thinking_aggregation": "synthesize",
+                    "tts_enabled": False,
+                    "tts_voice": ""
+                }
                 self.save_agents()
                 if self.debug_enabled:
                     print(f"[Debug] Agent '{agent_name}' added.")
@@ -1219,11 +1415,20 @@ class AIChatApp(QMainWindow):
                 json.dump(self.agents_data, f, indent=4)
             if self.debug_enabled:
                 print("[Debug] Agents saved.")
+            invalidate_prompts(debug_enabled=self.debug_enabled)
             self.update_screenshot_timer()
+            self.prepare_models()
         except Exception as e:
             print(f"[Debug] Failed to save agents: {e}")
             self.show_notification(f"Error saving agents: {str(e)}", "error")
 
+    def prepare_models(self):
+        """Plan how long agent models stay loaded and preload them if enabled."""
+        if self.preload_models:
+            warm_up(self.agents_data, self.debug_enabled)
+        else:
+            plan_residency(self.agents_data, self.debug_enabled)
+
     def update_send_button_state(self):
         any_enabled = any(
             a.get("enabled", False)
@@ -1249,6 +1454,7 @@ class AIChatApp(QMainWindow):
     # -------------------------------------------------------------------------
     def refresh_tools_list(self):
         self.tools = load_tools(self.debug_enabled)
+        invalidate_prompts(debug_enabled=self.debug_enabled)
         if hasattr(self.tools_tab, "refresh_tools_list"):
             self.tools_tab.tools = self.tools
             self.tools_tab.refresh_tools_list()
@@ -1256,6 +1462,7 @@ class AIChatApp(QMainWindow):
 
     def refresh_automations_list(self):
         self.automations = load_automations(self.debug_enabled)
+        invalidate_prompts(debug_enabled=self.debug_enabled)
         if hasattr(self.automations_tab, "refresh_automations_list"):
             self.automations_tab.automations = self.automations
             self.automations_tab.refresh_automations_list()
@@ -1310,7 +1517,9 @@ class AIChatApp(QMainWindow):
             if now >= due_dt:
                 agent_name = t.get("agent_name", "")
                 prompt = t.get("prompt", "")
-                self.schedule_user_message(agent_name, prompt, t["id"])
+                self.schedule_user_message(
+                    agent_name, prompt, t["id"], t.get("priority", PRIORITY_LOW)
+                )
                 repeat = t.get("repeat_interval", 0)
                 if repeat:
                     new_due = (due_dt + timedelta(minutes=repeat)).isoformat()
@@ -1338,7 +1547,7 @@ class AIChatApp(QMainWindow):
         if hasattr(self, "tasks_tab"):
             self.tasks_tab.refresh_tasks_list()
 
-    def schedule_user_message(self, agent_name, prompt, task_id=None):
+    def schedule_user_message(self, agent_name, prompt, task_id=None, priority=PRIORITY_LOW):
         timestamp = datetime.now().strftime("%H:%M:%S")
         message_html = f'<span style="color:{self.user_color};">[{timestamp}] (Scheduled) {self.user_name}:</span> {prompt}'
         self.chat_tab.append_message_html(message_html)
@@ -1364,89 +1573,43 @@ class AIChatApp(QMainWindow):
         max_tokens = agent_settings.get("max_tokens", 512)
         chat_history = self.build_agent_chat_history(agent_name)
 
-        thread = QThread()
         # Pass the agents_data to the AIWorker
-        worker = AIWorker(model_name, chat_history, temperature, max_tokens, self.debug_enabled, agent_name, self.agents_data, self.api_url)
-        worker.moveToThread(thread)
-        self.active_worker_threads.append((worker, thread))
+        worker = AIWorker(model_name, chat_history, temperature, max_tokens, self.debug_enabled, agent_name, self.agents_data)
 
         def on_finished():
-            self.worker_finished_sequential(worker, thread, agent_name, None, None)
+            self.worker_finished_sequential(worker, request, agent_name, None, None)
 
         worker.response_received.connect(self.handle_ai_response_chunk)
+        worker.thought_received.connect(self.handle_thought_chunk)
         worker.error_occurred.connect(self.handle_worker_error)
         worker.finished.connect(on_finished)
 
-        thread.started.connect(worker.run)
-        thread.start()
+        request = submit_request(worker, self.request_timeout, self.debug_enabled, priority)
+        self.active_requests[worker] = request
         self.response_start_times[worker] = time.time()
+        self.chat_tab.stop_button.setEnabled(True)
 
     # -------------------------------------------------------------------------
     # Chat History Helpers
     # -------------------------------------------------------------------------
     def build_agent_chat_history(self, agent_name, user_message=None, is_screenshot=False):
-        # Reload history from disk to ensure persistence
-        self.chat_history = load_history(self.debug_enabled)
-        self.chat_history = summarize_history(
-            self.chat_history, threshold=self.summarization_threshold
-        )
+        # Use the shared history cache; it only rereads disk if another process changed it
+        self.chat_history = get_history(self.debug_enabled)
 
-        system_prompt = ""
         agent_settings = self.agents_data.get(agent_name, {})
+        # Compiled once per agent; invalidated when agents, tools or automations change
+        system_prompt = system_prompt_for(self, agent_name, self.debug_enabled)
 
-        if agent_settings:
-            # If the agent is a Coordinator, include managed agents and their descriptions in the system prompt
-            if agent_settings.get('role') == 'Coordinator':
-                managed_agents_info = []
-                for managed_agent_name in agent_settings.get('managed_agents', []):
-                    managed_agent_settings = self.agents_data.get(managed_agent_name, {})
-                    if managed_agent_settings:
-                        managed_agent_desc = managed_agent_settings.get('description', 'No description available')
-                        managed_agents_info.append(f"{managed_agent_name}: {managed_agent_desc}")
-                
-                if managed_agents_info:
-                    system_prompt += "You can choose from the following agents:\n" + "\n".join(managed_agents_info) + "\n"
-
-            # Include the agent's specific system prompt
-            system_prompt += agent_settings.get("system_prompt", "")
-
-            # Include tool instructions only if tool_use is enabled
-            if agent_settings.get("tool_use", False):
-                tool_instructions = generate_tool_instructions_message(self, agent_name)
-                system_prompt += "\n" + tool_instructions
-
-        # Build the chat history with the constructed system prompt
-        chat_history = [{"role": "system", "content": system_prompt}]
-
-        # Filter messages for the chat history
-        temp_history = []
-        for msg in self.chat_history:
-            # For user messages, include them as is
-            if msg['role'] == 'user':
-                temp_history.append(msg)
-            elif msg['role'] == 'assistant':
-                # Remove any thought tags before adding to history
-                content = msg['content']
-                if "<thought>" in content and "</thought>" in content:
-                    thought_start = content.find("<thought>")
-                    thought_end = content.find("</thought>") + len("</thought>")
-                    clean_content = content[:thought_start] + content[thought_end:]
-                    clean_content = clean_content.strip()
-                    # Create a new message with the clean content
-                    cleaned_msg = msg.copy()
-                    cleaned_msg["content"] = clean_content
-                    
-                    # Only include messages from this agent or specialists to coordinator
-                    if cleaned_msg.get('agent') == agent_name:
-                        temp_history.append(cleaned_msg)
-                    elif agent_settings.get('role') == 'Coordinator' and self.agents_data.get(cleaned_msg.get('agent'), {}).get('role') == 'Specialist':
-                        temp_history.append(cleaned_msg)
-                else:
-                    # No thought tags, include message if from this agent or specialists to coordinator
-                    if msg.get('agent') == agent_name:
-                        temp_history.append(msg)
-                    elif agent_settings.get('role') == 'Coordinator' and self.agents_data.get(msg.get('agent'), {}).get('role') == 'Specialist':
-                        temp_history.append(msg)
+        # The agent's view of the history is maintained as messages are appended,
+        # with thought tags already stripped. Coordinators also see Specialists.
+        include_agents = ()
+        if agent_settings.get('role') == 'Coordinator':
+            include_agents = [
+                name for name, settings in self.agents_data.items()
+                if settings.get('role') == 'Specialist'
+            ]
+        visible, positions = agent_history(self.chat_history, agent_name, include_agents)
+        temp_history = list(visible)
 
         # If the last message indicates a handoff to a Specialist, insert the Specialist's description AFTER the handoff message
         if temp_history:
@@ -1469,8 +1632,23 @@ class AIChatApp(QMainWindow):
         if user_message:
             temp_history.append(user_message)
 
-        chat_history.extend(temp_history)
-        return chat_history
+        # Fill the agent's token budget, newest messages first. The latest user
+        # turn, recent tool results and anything added after the stored history
+        # (handoff descriptions, screenshots) take priority; older messages that
+        # do not fit are folded into the conversation summary.
+        _, budget = context_budget(agent_settings)
+        pinned = priority_indexes(temp_history) | set(range(len(positions), len(temp_history)))
+
+        def summarize(first_index):
+            position = positions[first_index] if first_index < len(positions) else len(self.chat_history)
+            if not self.summarization_threshold or not 0 < position < len(self.chat_history):
+                return None
+            summarized = summarize_history(
+                self.chat_history, threshold=len(self.chat_history) - position, key=agent_name
+            )
+            return summarized[0] if summarized[0].get("role") == "system" else None
+
+        return build_context(system_prompt, temp_history, budget, pinned, summarize)
 
 
     # -------------------------------------------------------------------------
@@ -1489,6 +1667,17 @@ class AIChatApp(QMainWindow):
             "screenshot_interval": self.screenshot_interval,
             "summarization_threshold": self.summarization_threshold,
             "ollama_port": self.ollama_port,
+            "ollama_pool_size": self.ollama_pool_size,
+            "ollama_hosts": self.ollama_hosts,
+            "request_timeout": self.request_timeout,
+            "max_concurrent_requests": self.max_concurrent_requests,
+            "model_concurrency": self.model_concurrency,
+            "parallel_dispatch": self.parallel_dispatch,
+            "preload_models": self.preload_models,
+            "model_ram_budget_gb": self.model_ram_budget_gb,
+            "response_cache_enabled": self.response_cache_enabled,
+            "response_cache_ttl_hours": self.response_cache_ttl_hours,
+            "response_cache_entries": self.response_cache_entries,
             "agents_onboarding_complete": self.agents_onboarding_complete,
         }
         try:
@@ -1519,7 +1708,35 @@ class AIChatApp(QMainWindow):
                     "summarization_threshold", self.summarization_threshold
                 )
                 self.ollama_port = settings.get("ollama_port", self.ollama_port)
+                self.ollama_pool_size = settings.get("ollama_pool_size", self.ollama_pool_size)
+                self.ollama_hosts = settings.get("ollama_hosts", self.ollama_hosts)
+                self.request_timeout = settings.get("request_timeout", self.request_timeout)
+                self.max_concurrent_requests = settings.get(
+                    "max_concurrent_requests", self.max_concurrent_requests
+                )
+                self.model_concurrency = settings.get("model_concurrency", self.model_concurrency)
+                self.parallel_dispatch = settings.get("parallel_dispatch", self.parallel_dispatch)
+                self.preload_models = settings.get("preload_models", self.preload_models)
+                self.model_ram_budget_gb = settings.get(
+                    "model_ram_budget_gb", self.model_ram_budget_gb
+                )
+                self.response_cache_enabled = settings.get(
+                    "response_cache_enabled", self.response_cache_enabled
+                )
+                self.response_cache_ttl_hours = settings.get(
+                    "response_cache_ttl_hours", self.response_cache_ttl_hours
+                )
+                self.response_cache_entries = settings.get(
+                    "response_cache_entries", self.response_cache_entries
+                )
+                configure_pool(self.ollama_pool_size, debug_enabled=self.debug_enabled)
+                configure_dispatch(
+                    self.max_concurrent_requests, self.model_concurrency, self.debug_enabled
+                )
+                self.apply_cache_settings()
+                configure_residency(self.model_ram_budget_gb, self.debug_enabled)
                 self.api_url = self.build_api_url()
+                self.apply_backend_settings()
                 self.agents_onboarding_complete = settings.get(
                     "agents_onboarding_complete", False
                 )
@@ -1556,4 +1773,10 @@ class AIChatApp(QMainWindow):
             worker.deleteLater()
             thread.deleteLater()
         self.active_worker_threads.clear()
+        self.active_requests.clear()
+        shutdown_engine()
+        shutdown_tool_executor()
+        sync_history()
+        flush_pending_writes()
+        close_session()
         event.accept()
@@ -3,6 +3,7 @@ import os
 import time
 from typing import List, Dict, Any, Literal, Union
 from log_utils import logger  # Import logger
+from persistence import write_json, flush
 from screenshot import capture_screenshot_to_tempfile # Import for screenshot functionality
 
 # Attempt to import pyautogui globally so tests can patch it easily.
@@ -93,6 +94,7 @@ class Step(Dict):
 
 def load_automations(debug_enabled: bool = False) -> List[Dict[str, Any]]:
     """Return list of saved automations."""
+    flush(AUTOMATIONS_FILE)
     if not os.path.exists(AUTOMATIONS_FILE):
         return []
     try:
@@ -108,14 +110,9 @@ def load_automations(debug_enabled: bool = False) -> List[Dict[str, Any]]:
 
 def save_automations(automations: List[Dict[str, Any]], debug_enabled: bool = False) -> None:
     """Persist automations to disk."""
-    try:
-        with open(AUTOMATIONS_FILE, "w", encoding="utf-8") as f:
-            json.dump(automations, f, indent=2)
-        if debug_enabled:
-            logger.debug("Automations saved.")
-    except Exception as exc:
-        if debug_enabled:
-            logger.error(f"Failed to save automations: {exc}")
+    write_json(AUTOMATIONS_FILE, automations, debug_enabled=debug_enabled)
+    if debug_enabled:
+        logger.debug("Automations save queued.")
 
 def record_automation(duration: float = 5) -> List[Dict[str, Any]]:
     """Record mouse and keyboard events for the given duration."""
@@ -657,6 +654,7 @@ def is_valid_step(step_dict: Dict[str, Any]) -> bool:
 
 def load_step_automations(debug_enabled: bool = False) -> List[Dict[str, Any]]:
     """Return list of saved step-based automations."""
+    flush(STEP_AUTOMATIONS_FILE)
     if not os.path.exists(STEP_AUTOMATIONS_FILE):
         return []
     try:
@@ -672,14 +670,9 @@ def load_step_automations(debug_enabled: bool = False) -> List[Dict[str, Any]]:
 
 def save_step_automations(automations: List[Dict[str, Any]], debug_enabled: bool = False) -> None:
     """Persist step-based automations to disk."""
-    try:
-        with open(STEP_AUTOMATIONS_FILE, "w", encoding="utf-8") as f:
-            json.dump(automations, f, indent=2)
-        if debug_enabled:
-            logger.debug("Step automations saved.")
-    except Exception as exc:
-        if debug_enabled:
-            logger.error(f"Failed to save step automations: {exc}", exc_info=True)
+    write_json(STEP_AUTOMATIONS_FILE, automations, debug_enabled=debug_enabled)
+    if debug_enabled:
+        logger.debug("Step automations save queued.")
 
 
 def delete_automation(automations: List[Dict[str, Any]], name: str, debug_enabled: bool = False) -> None:
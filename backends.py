@@ -0,0 +1,182 @@
+# backends.py
+
+"""Registry of Ollama hosts that agent requests are routed between.
+
+Each :class:`Backend` is an Ollama server and the models it serves. Workers
+that are not pinned to a URL call :func:`select_backend` for every request,
+which picks the healthy host serving the model with the fewest requests in
+flight. A host that refuses a connection is marked down and the request
+fails over to the next one.
+
+A background thread probes every host's ``/api/tags`` every
+``PROBE_INTERVAL`` seconds to mark hosts up or down and, for hosts
+configured without a model list, to learn which models they have.
+"""
+
+import threading
+import time
+
+import requests
+
+from ollama_client import get_session
+
+DEFAULT_URL = "http://localhost:11434"
+PROBE_INTERVAL = 30
+PROBE_TIMEOUT = 3
+
+
+def _model_name(name):
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+class Backend:
+    """One Ollama server."""
+
+    def __init__(self, url, models=None):
+        self.url = url.rstrip("/")
+        # Models listed in the settings; empty means use what the host reports
+        self.models = [_model_name(m) for m in models or []]
+        self.discovered = []
+        self.healthy = True
+        self.inflight = 0
+        self.last_probe = None
+
+    @property
+    def chat_url(self):
+        return f"{self.url}/api/chat"
+
+    def serves(self, model):
+        models = self.models or self.discovered
+        return not models or _model_name(model or "") in models
+
+    def __repr__(self):
+        return f"Backend({self.url!r}, inflight={self.inflight}, healthy={self.healthy})"
+
+
+_lock = threading.Lock()
+_backends = [Backend(DEFAULT_URL)]
+_probe_thread = None
+
+
+def configure_backends(hosts, debug_enabled=False):
+    """Replace the host list.
+
+    ``hosts`` holds base URLs or ``{"url": ..., "models": [...]}`` dicts.
+    In-flight counts and health carry over for hosts that stay listed.
+    """
+    global _backends
+    new = []
+    with _lock:
+        old = {b.url: b for b in _backends}
+        for host in hosts or [DEFAULT_URL]:
+            if isinstance(host, str):
+                host = {"url": host}
+            url = host.get("url", "").strip()
+            if not url or any(b.url == url.rstrip("/") for b in new):
+                continue
+            backend = Backend(url, host.get("models"))
+            previous = old.get(backend.url)
+            if previous is not None:
+                backend.inflight = previous.inflight
+                backend.healthy = previous.healthy
+                backend.discovered = previous.discovered
+                backend.last_probe = previous.last_probe
+            new.append(backend)
+        _backends = new or [Backend(DEFAULT_URL)]
+    if debug_enabled:
+        print(f"[Debug] Ollama backends: {', '.join(b.url for b in _backends)}")
+
+
+def get_backends():
+    with _lock:
+        return list(_backends)
+
+
+def select_backend(model, exclude=()):
+    """Return the least loaded host for ``model``, or None if all are excluded.
+
+    Healthy hosts serving the model are preferred; if there are none, any
+    host serving it is tried in case the last probe is out of date.
+    """
+    with _lock:
+        candidates = [b for b in _backends if b not in exclude]
+        serving = [b for b in candidates if b.serves(model)] or candidates
+        healthy = [b for b in serving if b.healthy] or serving
+        if not healthy:
+            return None
+        return min(healthy, key=lambda b: b.inflight)
+
+
+def acquire(backend):
+    """Count a request as in flight on ``backend``."""
+    if backend is not None:
+        with _lock:
+            backend.inflight += 1
+
+
+def release(backend):
+    if backend is not None:
+        with _lock:
+            backend.inflight = max(backend.inflight - 1, 0)
+
+
+def mark_failed(backend, debug_enabled=False):
+    """Mark ``backend`` down until the next successful probe."""
+    if backend is None:
+        return
+    with _lock:
+        backend.healthy = False
+    if debug_enabled:
+        print(f"[Debug] Ollama backend {backend.url} is down")
+
+
+def mark_healthy(backend):
+    """Mark ``backend`` up after it answered a request."""
+    if backend is not None:
+        with _lock:
+            backend.healthy = True
+
+
+def probe_backend(backend, session=None, timeout=PROBE_TIMEOUT, debug_enabled=False):
+    """Check ``backend`` and refresh its model list. Returns its health."""
+    session = session or get_session()
+    try:
+        response = session.get(f"{backend.url}/api/tags", timeout=timeout)
+        response.raise_for_status()
+        models = [_model_name(m.get("name", "")) for m in response.json().get("models", [])]
+        healthy = True
+    except (requests.exceptions.RequestException, ValueError) as e:
+        models = None
+        healthy = False
+        if debug_enabled:
+            print(f"[Debug] Health check failed for {backend.url}: {e}")
+    with _lock:
+        backend.healthy = healthy
+        backend.last_probe = time.time()
+        if models is not None:
+            backend.discovered = models
+    return healthy
+
+
+def probe_backends(session=None, debug_enabled=False):
+    """Probe every host."""
+    for backend in get_backends():
+        probe_backend(backend, session, debug_enabled=debug_enabled)
+
+
+def _probe_loop(debug_enabled):
+    while True:
+        probe_backends(debug_enabled=debug_enabled)
+        time.sleep(PROBE_INTERVAL)
+
+
+def start_health_checks(debug_enabled=False):
+    """Start probing hosts in the background if not already running."""
+    global _probe_thread
+    with _lock:
+        if _probe_thread is not None and _probe_thread.is_alive():
+            return
+        _probe_thread = threading.Thread(
+            target=_probe_loop, args=(debug_enabled,), name="ollama-health", daemon=True
+        )
+        _probe_thread.start()
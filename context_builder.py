@@ -0,0 +1,194 @@
+# context_builder.py
+
+"""Token-budgeted prompt assembly for agent requests.
+
+Token counts are estimated locally (no model tokenizer is loaded) and cached
+per message content, so building a context for a long conversation only
+tokenizes messages that are new since the last request.
+"""
+
+import re
+
+DEFAULT_CONTEXT_TOKENS = 4096
+MIN_CONTEXT_TOKENS = 512
+
+# Approximate per-message framing added by chat templates and the cost of an
+# attached image in typical vision models.
+MESSAGE_OVERHEAD = 4
+IMAGE_TOKENS = 768
+
+TRUNCATION_NOTE = "\n...[truncated]"
+
+# Words are split into ~4 character pieces, mirroring how BPE vocabularies
+# break up longer words; punctuation counts as one token each.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_WORD_PIECE = 4
+_CACHE_LIMIT = 20000
+_token_cache = {}
+
+
+def _count_tokens(text):
+    count = 0
+    for match in _TOKEN_RE.finditer(text):
+        count += 1 + (match.end() - match.start() - 1) // _WORD_PIECE
+    return count
+
+
+def estimate_tokens(text):
+    """Return an approximate token count for ``text``."""
+    if not text:
+        return 0
+    cached = _token_cache.get(text)
+    if cached is not None:
+        return cached
+    count = _count_tokens(text)
+    if len(_token_cache) >= _CACHE_LIMIT:
+        _token_cache.clear()
+    _token_cache[text] = count
+    return count
+
+
+def message_tokens(msg):
+    """Return the approximate prompt cost of a chat message."""
+    return (
+        MESSAGE_OVERHEAD
+        + estimate_tokens(msg.get("content", ""))
+        + IMAGE_TOKENS * len(msg.get("images") or [])
+    )
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut ``text`` down to roughly ``max_tokens`` tokens."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    limit = max(max_tokens - _count_tokens(TRUNCATION_NOTE), 0)
+    count = 0
+    end = 0
+    for match in _TOKEN_RE.finditer(text):
+        count += 1 + (match.end() - match.start() - 1) // _WORD_PIECE
+        if count > limit:
+            break
+        end = match.end()
+    return text[:end].rstrip() + TRUNCATION_NOTE
+
+
+def context_budget(agent_settings):
+    """Return ``(context_tokens, prompt_budget)`` for an agent.
+
+    ``context_tokens`` is the model context size from the agent's
+    ``context_tokens`` setting. The prompt budget leaves room for the
+    response, which is bounded by ``max_tokens``.
+    """
+    try:
+        context_tokens = int(agent_settings.get("context_tokens", DEFAULT_CONTEXT_TOKENS))
+    except (TypeError, ValueError):
+        context_tokens = DEFAULT_CONTEXT_TOKENS
+    context_tokens = max(context_tokens, MIN_CONTEXT_TOKENS)
+    try:
+        max_tokens = int(agent_settings.get("max_tokens", 512))
+    except (TypeError, ValueError):
+        max_tokens = 512
+    reserve = min(max_tokens, context_tokens // 2)
+    return context_tokens, context_tokens - reserve
+
+
+def _capped(msg, cap):
+    """Return ``msg`` or a copy with its content truncated to fit ``cap``."""
+    if message_tokens(msg) <= cap:
+        return msg
+    text_cap = max(cap - MESSAGE_OVERHEAD - IMAGE_TOKENS * len(msg.get("images") or []), 1)
+    capped = msg.copy()
+    capped["content"] = truncate_to_tokens(msg.get("content", ""), text_cap)
+    return capped
+
+
+def fit_messages(messages, budget, pinned=()):
+    """Choose which ``messages`` fit in ``budget`` tokens.
+
+    Messages whose index is in ``pinned`` are kept first (newest first if
+    even they do not all fit). The remaining budget is filled with the most
+    recent other messages, stopping at the first one that does not fit so
+    the kept history has no gaps. Any single message larger than half the
+    budget is truncated.
+
+    Returns:
+        tuple: ``(kept, first_index)`` where ``kept`` is the list of selected
+        messages in their original order and ``first_index`` is the index of
+        the oldest unpinned message kept (``len(messages)`` if none).
+    """
+    cap = max(budget // 2, MESSAGE_OVERHEAD + 1)
+    capped = [_capped(msg, cap) for msg in messages]
+    costs = [message_tokens(msg) for msg in capped]
+
+    chosen = set()
+    used = 0
+    for i in sorted(pinned, reverse=True):
+        if used + costs[i] <= budget:
+            chosen.add(i)
+            used += costs[i]
+
+    first_index = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        if i in pinned:
+            continue
+        if used + costs[i] > budget:
+            break
+        chosen.add(i)
+        used += costs[i]
+        first_index = i
+
+    return [capped[i] for i in sorted(chosen)], first_index
+
+
+def priority_indexes(messages):
+    """Return indexes of messages that should be kept before older history.
+
+    These are the latest user turn and any tool results recorded since the
+    user turn before it.
+    """
+    user_turns = [i for i, msg in enumerate(messages) if msg.get("role") == "user"]
+    if not user_turns:
+        return set()
+    pinned = {user_turns[-1]}
+    since = user_turns[-2] if len(user_turns) > 1 else -1
+    for i in range(since + 1, len(messages)):
+        if messages[i].get("tool"):
+            pinned.add(i)
+    return pinned
+
+
+def build_context(system_prompt, messages, budget, pinned=(), summarize=None):
+    """Assemble a prompt of at most ``budget`` tokens.
+
+    Args:
+        system_prompt (str): Agent system prompt, always placed first.
+        messages (list): Candidate history messages, oldest first.
+        budget (int): Prompt token budget.
+        pinned (iterable): Indexes into ``messages`` that take priority, such
+            as the latest user turn and tool results.
+        summarize (callable, optional): Called with the index of the oldest
+            kept message when older messages were dropped. It should return a
+            system message summarizing them, or ``None``.
+
+    Returns:
+        list: Messages ready to send to the model.
+    """
+    pinned = set(pinned)
+    system_msg = _capped({"role": "system", "content": system_prompt}, max(budget // 2, 1))
+    remaining = budget - message_tokens(system_msg)
+
+    kept, first_index = fit_messages(messages, remaining, pinned)
+    summary = None
+    if summarize and first_index > 0 and messages:
+        summary = summarize(first_index)
+        if summary:
+            # Make room for the summary, then summarize what was dropped.
+            summary_cost = message_tokens(summary)
+            kept, first_index = fit_messages(messages, remaining - summary_cost, pinned)
+            summary = summarize(first_index) if first_index > 0 else None
+
+    context = [system_msg]
+    if summary:
+        context.append(summary)
+    context.extend(kept)
+    return context
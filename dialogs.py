@@ -332,6 +332,27 @@ class TaskDialog(QDialog):
             return
         super().accept()
 
+def parse_hosts(text):
+    """Parse ``url [model,model]`` lines into host dictionaries."""
+    hosts = []
+    for line in text.splitlines():
+        parts = line.split(None, 1)
+        if not parts:
+            continue
+        models = [m.strip() for m in parts[1].split(",") if m.strip()] if len(parts) > 1 else []
+        hosts.append({"url": parts[0], "models": models})
+    return hosts
+
+
+def format_hosts(hosts):
+    """Inverse of :func:`parse_hosts`."""
+    lines = []
+    for host in hosts:
+        models = ",".join(host.get("models", []))
+        lines.append(f"{host.get('url', '')} {models}".strip())
+    return "\n".join(lines)
+
+
 class SettingsDialog(QDialog):
     """
     A dialog to configure global application settings.
@@ -393,8 +414,8 @@ class SettingsDialog(QDialog):
         self.threshold_spin.setRange(0, 200)
         self.threshold_spin.setValue(self.parent.summarization_threshold)
         self.threshold_spin.setToolTip(
-            "Number of recent messages to keep before summarizing."
-            " Set to 0 to disable summarization."
+            "Summarize older messages that no longer fit an agent's context"
+            " token budget. Set to 0 to disable summarization."
         )
         layout.addWidget(self.threshold_spin)
 
@@ -406,6 +427,112 @@ class SettingsDialog(QDialog):
         self.port_spin.setToolTip("Port used to connect to the Ollama server.")
         layout.addWidget(self.port_spin)
 
+        # Additional Ollama hosts
+        layout.addWidget(QLabel("Additional Ollama Hosts:"))
+        self.hosts_edit = QTextEdit()
+        self.hosts_edit.setAcceptRichText(False)
+        self.hosts_edit.setMaximumHeight(70)
+        self.hosts_edit.setPlainText(format_hosts(getattr(self.parent, "ollama_hosts", [])))
+        self.hosts_edit.setToolTip(
+            "One Ollama server per line, optionally followed by the models it"
+            " serves, e.g. http://gpu-box:11434 llama3,phi4. Requests go to the"
+            " least busy healthy server with the agent's model."
+        )
+        layout.addWidget(self.hosts_edit)
+
+        # Ollama connection pool
+        layout.addWidget(QLabel("Ollama Connections:"))
+        self.pool_spin = QSpinBox()
+        self.pool_spin.setRange(1, 64)
+        self.pool_spin.setValue(getattr(self.parent, "ollama_pool_size", 8))
+        self.pool_spin.setToolTip(
+            "Maximum open connections to the Ollama server. Connections are"
+            " kept alive and reused between requests."
+        )
+        layout.addWidget(self.pool_spin)
+
+        # Request timeout
+        layout.addWidget(QLabel("Request Timeout (seconds):"))
+        self.timeout_spin = QSpinBox()
+        self.timeout_spin.setRange(10, 3600)
+        self.timeout_spin.setValue(getattr(self.parent, "request_timeout", 300))
+        self.timeout_spin.setToolTip(
+            "Cancel an agent request that has not finished after this many seconds."
+        )
+        layout.addWidget(self.timeout_spin)
+
+        # Concurrency limits
+        layout.addWidget(QLabel("Max Concurrent Requests:"))
+        self.max_requests_spin = QSpinBox()
+        self.max_requests_spin.setRange(1, 64)
+        self.max_requests_spin.setValue(getattr(self.parent, "max_concurrent_requests", 4))
+        self.max_requests_spin.setToolTip(
+            "Agent requests allowed to run at once. Extra requests wait in a queue."
+        )
+        layout.addWidget(self.max_requests_spin)
+
+        layout.addWidget(QLabel("Requests Per Model:"))
+        self.model_concurrency_spin = QSpinBox()
+        self.model_concurrency_spin.setRange(1, 16)
+        self.model_concurrency_spin.setValue(getattr(self.parent, "model_concurrency", 2))
+        self.model_concurrency_spin.setToolTip(
+            "Requests allowed to run at once against the same model. Match"
+            " Ollama's OLLAMA_NUM_PARALLEL setting."
+        )
+        layout.addWidget(self.model_concurrency_spin)
+
+        self.parallel_checkbox = QCheckBox("Ask Agents in Parallel")
+        self.parallel_checkbox.setChecked(getattr(self.parent, "parallel_dispatch", False))
+        self.parallel_checkbox.setToolTip(
+            "Send each chat message to all enabled Coordinators or Assistants"
+            " at once instead of one after another. Replies appear as they finish."
+        )
+        layout.addWidget(self.parallel_checkbox)
+
+        # Model residency
+        self.preload_checkbox = QCheckBox("Preload Agent Models")
+        self.preload_checkbox.setChecked(getattr(self.parent, "preload_models", True))
+        self.preload_checkbox.setToolTip(
+            "Load the models of enabled agents in the background at startup so"
+            " their first reply does not wait for the model to load."
+        )
+        layout.addWidget(self.preload_checkbox)
+
+        layout.addWidget(QLabel("Model Memory Budget (GB, 0 = no limit):"))
+        self.ram_budget_spin = QSpinBox()
+        self.ram_budget_spin.setRange(0, 1024)
+        self.ram_budget_spin.setValue(getattr(self.parent, "model_ram_budget_gb", 0))
+        self.ram_budget_spin.setToolTip(
+            "Unload the least recently used models when the loaded ones need"
+            " more memory than this."
+        )
+        layout.addWidget(self.ram_budget_spin)
+
+        # Response cache
+        self.cache_checkbox = QCheckBox("Cache Deterministic Responses")
+        self.cache_checkbox.setChecked(getattr(self.parent, "response_cache_enabled", False))
+        self.cache_checkbox.setToolTip(
+            "Reuse the saved reply when an agent at temperature 0 receives exactly"
+            " the same prompt again, e.g. from a repeating task."
+        )
+        layout.addWidget(self.cache_checkbox)
+
+        layout.addWidget(QLabel("Cache Lifetime (hours):"))
+        self.cache_ttl_spin = QSpinBox()
+        self.cache_ttl_spin.setRange(1, 720)
+        self.cache_ttl_spin.setValue(getattr(self.parent, "response_cache_ttl_hours", 24))
+        self.cache_ttl_spin.setToolTip("Discard cached replies older than this.")
+        layout.addWidget(self.cache_ttl_spin)
+
+        layout.addWidget(QLabel("Cached Responses:"))
+        self.cache_entries_spin = QSpinBox()
+        self.cache_entries_spin.setRange(10, 10000)
+        self.cache_entries_spin.setValue(getattr(self.parent, "response_cache_entries", 500))
+        self.cache_entries_spin.setToolTip(
+            "Maximum replies kept. The least recently used are removed first."
+        )
+        layout.addWidget(self.cache_entries_spin)
+
         # Error summary label
         self.error_label = QLabel("")
         self.error_label.setStyleSheet("color: red")
@@ -451,6 +578,13 @@ class SettingsDialog(QDialog):
         self.interval_spin.valueChanged.connect(self.validate_fields)
         self.threshold_spin.valueChanged.connect(self.validate_fields)
         self.port_spin.valueChanged.connect(self.validate_fields)
+        self.hosts_edit.textChanged.connect(self.validate_fields)
+        self.pool_spin.valueChanged.connect(self.validate_fields)
+        self.timeout_spin.valueChanged.connect(self.validate_fields)
+        self.max_requests_spin.valueChanged.connect(self.validate_fields)
+        self.model_concurrency_spin.valueChanged.connect(self.validate_fields)
+        self.cache_ttl_spin.valueChanged.connect(self.validate_fields)
+        self.cache_entries_spin.valueChanged.connect(self.validate_fields)
 
         self.validate_fields()
 
@@ -476,6 +610,17 @@ class SettingsDialog(QDialog):
             "screenshot_interval": self.interval_spin.value(),
             "summarization_threshold": self.threshold_spin.value(),
             "ollama_port": self.port_spin.value(),
+            "ollama_hosts": parse_hosts(self.hosts_edit.toPlainText()),
+            "ollama_pool_size": self.pool_spin.value(),
+            "request_timeout": self.timeout_spin.value(),
+            "max_concurrent_requests": self.max_requests_spin.value(),
+            "model_concurrency": self.model_concurrency_spin.value(),
+            "parallel_dispatch": self.parallel_checkbox.isChecked(),
+            "preload_models": self.preload_checkbox.isChecked(),
+            "model_ram_budget_gb": self.ram_budget_spin.value(),
+            "response_cache_enabled": self.cache_checkbox.isChecked(),
+            "response_cache_ttl_hours": self.cache_ttl_spin.value(),
+            "response_cache_entries": self.cache_entries_spin.value(),
         }
 
     def accept(self):
@@ -495,6 +640,21 @@ class SettingsDialog(QDialog):
             errors.append("Summarization Threshold must be 0-200.")
         if not (1 <= self.port_spin.value() <= 65535):
             errors.append("Ollama Port must be 1-65535.")
+        for host in parse_hosts(self.hosts_edit.toPlainText()):
+            if not host["url"].startswith(("http://", "https://")):
+                errors.append(f"Ollama host '{host['url']}' must start with http:// or https://.")
+        if not (1 <= self.pool_spin.value() <= 64):
+            errors.append("Ollama Connections must be 1-64.")
+        if not (10 <= self.timeout_spin.value() <= 3600):
+            errors.append("Request Timeout must be 10-3600 seconds.")
+        if not (1 <= self.max_requests_spin.value() <= 64):
+            errors.append("Max Concurrent Requests must be 1-64.")
+        if not (1 <= self.model_concurrency_spin.value() <= 16):
+            errors.append("Requests Per Model must be 1-16.")
+        if not (1 <= self.cache_ttl_spin.value() <= 720):
+            errors.append("Cache Lifetime must be 1-720 hours.")
+        if not (10 <= self.cache_entries_spin.value() <= 10000):
+            errors.append("Cached Responses must be 10-10000.")
 
         self.ok_button.setEnabled(not errors)
         self.error_label.setText("\n".join(errors))
@@ -612,39 +772,67 @@ class SearchDialog(QDialog):
 class HistorySearchDialog(QDialog):
     """Dialog for searching saved chat history."""
 
-    def __init__(self, parent, history):
+    def __init__(self, parent, history, agents=None):
         super().__init__(parent)
         self.setWindowTitle("Search Saved History")
         self.history = history
+        self.offset = 0
 
         layout = QVBoxLayout(self)
 
+        search_layout = QHBoxLayout()
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Search history...")
-        layout.addWidget(self.search_input)
+        search_layout.addWidget(self.search_input)
+
+        self.speaker_combo = QComboBox()
+        self.speaker_combo.addItem("All", (None, None))
+        self.speaker_combo.addItem("You", ("user", None))
+        for agent in agents or []:
+            self.speaker_combo.addItem(agent, ("assistant", agent))
+        search_layout.addWidget(self.speaker_combo)
+        layout.addLayout(search_layout)
 
         self.results_list = QListWidget()
         layout.addWidget(self.results_list)
 
+        self.more_button = QPushButton("Load More")
+        self.more_button.setEnabled(False)
+        self.more_button.clicked.connect(self.load_more)
+        layout.addWidget(self.more_button)
+
         button_box = QDialogButtonBox(QDialogButtonBox.Close)
         button_box.rejected.connect(self.reject)
         layout.addWidget(button_box)
 
         self.search_input.textChanged.connect(self.update_results)
+        self.speaker_combo.currentIndexChanged.connect(self.update_results)
 
     def update_results(self):
+        self.results_list.clear()
+        self.offset = 0
+        self.load_more()
+
+    def load_more(self):
         import re
+        from history_index import search, PAGE_SIZE
 
         query = self.search_input.text().strip()
-        self.results_list.clear()
         if not query:
+            self.more_button.setEnabled(False)
             return
 
+        role, agent = self.speaker_combo.currentData() or (None, None)
+        matches = search(
+            self.history, query, role=role, agent=agent,
+            limit=PAGE_SIZE, offset=self.offset,
+        )
+        self.offset += len(matches)
+        self.more_button.setEnabled(len(matches) == PAGE_SIZE)
+
         pattern = re.compile(re.escape(query), re.I)
-        for msg in self.history:
+        for msg in matches:
             content = msg.get("content", "")
-            if not pattern.search(content):
-                continue
             ts = msg.get("timestamp", "")[:19].replace("T", " ")
             speaker = "You" if msg.get("role") == "user" else msg.get("agent", "assistant")
             line = f"{ts} {speaker}: {content}"
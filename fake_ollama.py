@@ -0,0 +1,161 @@
+# fake_ollama.py
+
+"""A small stand-in for an Ollama server, for testing without a GPU.
+
+It answers ``/api/tags`` with a fixed model list, ``/api/generate`` by
+pretending to load or unload a model and ``/api/chat`` by echoing the last
+message back, streamed word by word when asked to stream. Tests can script
+the chat replies, fail requests with an HTTP status or drop the connection.
+Run several on different ports to try multi-host routing::
+
+    python fake_ollama.py --port 11435 --models llama3,phi4 --delay 0.05
+
+Tests start it on the current event loop with :func:`start_fake_server`, or
+run a worker against it with :func:`run_worker`.
+"""
+
+import argparse
+import asyncio
+import json
+
+import aiohttp
+from aiohttp import web
+
+
+class FakeOllama:
+    """Request handlers plus counters that tests can inspect."""
+
+    def __init__(self, models=None, delay=0.0, reply=None, size=2 * 1024 ** 3, statuses=None):
+        self.models = list(models or ["llama3.2-vision"])
+        self.size = size
+        self.delay = delay
+        # Text to reply with, a list of chunks to stream as they are (dict
+        # chunks are sent as raw lines, e.g. {"error": "..."}), or a callable
+        # taking the request payload and returning either
+        self.reply = reply
+        # HTTP statuses for the next chat requests; 0 drops the connection
+        self.statuses = list(statuses or [])
+        self.requests = []
+        # Load and unload requests sent to /api/generate
+        self.generate_requests = []
+        self.loaded = []
+        self.unloaded = []
+        self.inflight = 0
+        self.peak = 0
+        # Streams the client closed before the reply was finished
+        self.disconnects = 0
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get("/api/tags", self.tags)
+        app.router.add_post("/api/chat", self.chat)
+        app.router.add_post("/api/generate", self.generate)
+        return app
+
+    async def tags(self, request):
+        return web.json_response({
+            "models": [{"name": f"{m}:latest", "size": self.size} for m in self.models]
+        })
+
+    async def generate(self, request):
+        """Load or unload a model, as Ollama does for an empty prompt."""
+        payload = await request.json()
+        self.generate_requests.append(payload)
+        model = payload.get("model")
+        if model not in self.models:
+            return web.json_response({"error": f"model '{model}' not found"}, status=404)
+        if payload.get("keep_alive") == 0:
+            self.loaded = [m for m in self.loaded if m != model]
+            self.unloaded.append(model)
+        elif model not in self.loaded:
+            await asyncio.sleep(self.delay)
+            self.loaded.append(model)
+        return web.json_response({"model": model, "response": "", "done": True})
+
+    async def chat(self, request):
+        payload = await request.json()
+        self.requests.append(payload)
+        if self.statuses:
+            status = self.statuses.pop(0)
+            if not status:
+                request.transport.close()
+                return web.Response()
+            return web.json_response({"error": f"status {status}"}, status=status)
+        if payload.get("model") not in self.models:
+            return web.json_response({"error": f"model '{payload.get('model')}' not found"}, status=404)
+        messages = payload.get("messages") or [{}]
+        reply = self.reply(payload) if callable(self.reply) else self.reply
+        if reply is None:
+            reply = f"Echo: {messages[-1].get('content', '')}"
+        if isinstance(reply, str):
+            chunks = [word + " " for word in reply.split(" ")]
+        else:
+            chunks, reply = reply, "".join(c for c in reply if isinstance(c, str))
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        try:
+            if not payload.get("stream", True):
+                await asyncio.sleep(self.delay)
+                return web.json_response({"message": {"role": "assistant", "content": reply}, "done": True})
+            resp = web.StreamResponse()
+            await resp.prepare(request)
+            try:
+                for chunk in chunks:
+                    await asyncio.sleep(self.delay)
+                    if isinstance(chunk, str):
+                        chunk = {"message": {"role": "assistant", "content": chunk}}
+                    await resp.write((json.dumps(chunk) + "\n").encode())
+                await resp.write(b'{"done": true}\n')
+            except ConnectionResetError:
+                # Ollama stops generating when the client goes away
+                self.disconnects += 1
+            return resp
+        finally:
+            self.inflight -= 1
+
+
+async def start_fake_server(fake, host="127.0.0.1", port=0):
+    """Serve ``fake`` and return ``(runner, base_url)``; call ``runner.cleanup()`` to stop."""
+    runner = web.AppRunner(fake.make_app(), shutdown_timeout=0.1)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{port}"
+
+
+def run_worker(make_worker, *fakes):
+    """Serve ``fakes`` and run the worker returned by ``make_worker(*urls)``.
+
+    The worker's ``run_async`` runs to completion on a new event loop in the
+    calling thread, so its signals are delivered before this returns the
+    worker.
+    """
+    async def run():
+        servers = [await start_fake_server(fake) for fake in fakes]
+        try:
+            async with aiohttp.ClientSession() as session:
+                worker = make_worker(*[url for _, url in servers])
+                await worker.run_async(session)
+                return worker
+        finally:
+            for runner, _ in servers:
+                await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--models", default="llama3.2-vision", help="Comma separated model names")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds between streamed words")
+    args = parser.parse_args()
+    fake = FakeOllama(args.models.split(","), args.delay)
+    print(f"Fake Ollama serving {', '.join(fake.models)} on http://{args.host}:{args.port}")
+    web.run_app(fake.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+# history_index.py
+
+"""SQLite full-text index over the chat history.
+
+The JSON snapshot and journal written by :mod:`transcripts` remain the source
+of truth. This module mirrors them into ``chat_history.db``, which has an FTS5
+table over message content and ordinary indexes on role, agent and timestamp,
+so saved-history search does not have to scan every message in Python.
+
+The index is brought up to date at search time: new messages are inserted
+incrementally and the index is rebuilt if any indexed message was edited,
+removed or reordered. A count and checksum of the indexed rows detect that;
+the checksum is only recomputed over the whole history once per process and
+after :func:`transcripts.history_rewrites` changes, otherwise it is extended
+over the appended messages. When SQLite lacks FTS5 support, :func:`search`
+falls back to :func:`transcripts.search_history`.
+"""
+
+import os
+import sqlite3
+import threading
+import zlib
+
+from transcripts import history_rewrites, search_history
+
+INDEX_FILE = "chat_history.db"
+PAGE_SIZE = 50
+
+# The trigram tokenizer matches arbitrary substrings case-insensitively, which
+# keeps results consistent with the previous substring search. It needs at
+# least three characters; shorter queries use LIKE against the messages table.
+MIN_FTS_QUERY = 3
+
+_lock = threading.RLock()
+_conn = None
+_conn_path = None
+_fts_available = None
+# history_rewrites() when the indexed rows were last checked against the
+# whole history, or None if they have not been since the index was opened
+_checked_rewrites = None
+
+
+def _connect(debug_enabled=False):
+    """Return a connection to INDEX_FILE, creating the schema if needed."""
+    global _conn, _conn_path, _fts_available
+    if _conn is not None and _conn_path == INDEX_FILE:
+        return _conn
+    close_index()
+    conn = sqlite3.connect(INDEX_FILE, check_same_thread=False)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "id INTEGER PRIMARY KEY, timestamp TEXT, role TEXT, agent TEXT, content TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_role ON messages(role)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_agent ON messages(agent)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)")
+    # Count and checksum of the indexed rows, to notice a rewritten history
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+            "content, content='messages', content_rowid='id', tokenize='trigram')"
+        )
+        _fts_available = True
+    except sqlite3.OperationalError as e:
+        _fts_available = False
+        if debug_enabled:
+            print(f"[Debug] FTS5 unavailable, using plain search: {e}")
+    conn.commit()
+    _conn = conn
+    _conn_path = INDEX_FILE
+    return conn
+
+
+def close_index():
+    """Close the cached index connection."""
+    global _conn, _conn_path, _checked_rewrites
+    with _lock:
+        if _conn is not None:
+            try:
+                _conn.close()
+            except sqlite3.Error:
+                pass
+        _conn = None
+        _conn_path = None
+        _checked_rewrites = None
+
+
+def _row_values(msg):
+    return (
+        msg.get("timestamp", ""),
+        msg.get("role", ""),
+        msg.get("agent"),
+        msg.get("content", ""),
+    )
+
+
+def _checksum(history, start, end, crc=0):
+    """Extend ``crc`` over the indexed values of ``history[start:end]``."""
+    for msg in history[start:end]:
+        row = "\x1f".join(str(value) for value in _row_values(msg))
+        crc = zlib.crc32(row.encode("utf-8", "surrogatepass"), crc)
+    return crc
+
+
+def _read_meta(conn):
+    return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+
+def _write_meta(conn, count, checksum):
+    conn.executemany(
+        "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+        [("count", count), ("checksum", checksum)],
+    )
+
+
+def _insert(conn, history, start):
+    rows = [(i + 1,) + _row_values(msg) for i, msg in enumerate(history[start:], start)]
+    if not rows:
+        return
+    conn.executemany(
+        "INSERT INTO messages (id, timestamp, role, agent, content) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    if _fts_available:
+        conn.execute(
+            "INSERT INTO messages_fts (rowid, content) SELECT id, content FROM messages WHERE id > ?",
+            (start,),
+        )
+
+
+def sync_index(history, debug_enabled=False):
+    """Bring the index up to date with ``history``.
+
+    Rows are keyed by position in the history, so appended messages are
+    inserted incrementally. The indexed rows must still match the start of
+    the history, by count and checksum; if any was edited or removed (after
+    a clear, a rewrite or a reload from the archive) the index is rebuilt.
+    Unless the history may have been rewritten since the last check, only
+    the count is compared, so a search does not re-read every message.
+    """
+    global _checked_rewrites
+    with _lock:
+        conn = _connect(debug_enabled)
+        rewrites = history_rewrites()
+        indexed = conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+        start = indexed
+        checksum = 0
+        if indexed:
+            meta = _read_meta(conn)
+            checksum = meta.get("checksum")
+            valid = indexed <= len(history) and meta.get("count") == indexed
+            if valid and rewrites != _checked_rewrites:
+                valid = _checksum(history, 0, indexed) == checksum
+            if not valid:
+                conn.execute("DELETE FROM messages")
+                if _fts_available:
+                    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('delete-all')")
+                start = 0
+                checksum = 0
+                if debug_enabled:
+                    print("[Debug] History index out of date, rebuilding")
+        if start < len(history):
+            _insert(conn, history, start)
+            _write_meta(conn, len(history), _checksum(history, start, len(history), checksum))
+            if debug_enabled:
+                print(f"[Debug] Indexed {len(history) - start} history messages")
+        conn.commit()
+        _checked_rewrites = rewrites
+
+
+def search(history, query, role=None, agent=None, limit=PAGE_SIZE, offset=0, debug_enabled=False):
+    """Return up to ``limit`` messages from ``history`` matching ``query``.
+
+    Full-text matches are ranked by relevance and short queries are ordered
+    newest first. ``role`` and ``agent`` filter the results, and ``offset``
+    selects later pages.
+    """
+    query = (query or "").strip()
+    if not query:
+        return []
+    try:
+        with _lock:
+            sync_index(history, debug_enabled)
+            if not _fts_available:
+                raise sqlite3.OperationalError("FTS5 not available")
+            filters = ""
+            params = []
+            if role:
+                filters += " AND m.role = ?"
+                params.append(role)
+            if agent:
+                filters += " AND m.agent = ?"
+                params.append(agent)
+            if len(query) >= MIN_FTS_QUERY:
+                phrase = '"' + query.replace('"', '""') + '"'
+                sql = (
+                    "SELECT m.id FROM messages_fts f JOIN messages m ON m.id = f.rowid "
+                    "WHERE messages_fts MATCH ?" + filters +
+                    " ORDER BY bm25(messages_fts), m.id DESC LIMIT ? OFFSET ?"
+                )
+                params = [phrase] + params
+            else:
+                escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+                sql = (
+                    "SELECT m.id FROM messages m WHERE m.content LIKE ? ESCAPE '\\'" + filters +
+                    " ORDER BY m.id DESC LIMIT ? OFFSET ?"
+                )
+                params = [f"%{escaped}%"] + params
+            rows = _conn.execute(sql, params + [limit, offset]).fetchall()
+        return [history[row[0] - 1] for row in rows]
+    except (sqlite3.Error, OSError) as e:
+        if debug_enabled:
+            print(f"[Debug] History index search failed, scanning instead: {e}")
+        results = search_history(history, query, role=role, agent=agent)
+        return results[offset:offset + limit]
+
+
+def clear_index(debug_enabled=False):
+    """Delete the index file; it is rebuilt on the next search."""
+    with _lock:
+        close_index()
+        try:
+            if os.path.exists(INDEX_FILE):
+                os.remove(INDEX_FILE)
+            if debug_enabled:
+                print("[Debug] History index cleared")
+        except Exception as e:
+            print(f"[Error] Failed to clear history index: {e}")
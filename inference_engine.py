@@ -0,0 +1,352 @@
+# inference_engine.py
+
+"""One asyncio event loop for every Ollama chat request.
+
+Instead of a ``QThread`` per request, workers are scheduled as coroutines on
+a single event loop running in a background thread. All requests share one
+``aiohttp`` session, so many streams are multiplexed over pooled
+connections without an OS thread blocking on each socket.
+
+Workers stay in the GUI thread as ``QObject`` instances and emit their
+signals from the loop thread; Qt queues those signals back to the GUI
+thread. :func:`submit_request` returns an :class:`InferenceRequest` that
+can be cancelled, and every request has a timeout.
+
+Requests are admitted by a dispatcher: at most ``max_requests`` run at once
+and no more than ``model_concurrency`` per model. A request that fans out, such as thinking with
+several samples, takes whatever extra slots are free when it fans out
+through the worker's ``extra_slots`` and runs the rest of its calls in the
+slots it holds; it never waits for a slot while holding one, so such
+requests cannot deadlock each other. Excess requests wait in a queue ordered by
+priority: interactive chat turns first, then tool and delegation follow-ups,
+then scheduled tasks by their own priority. Requests gain priority the longer
+they wait, so background work is never starved; ties run oldest first.
+
+Workers pick their Ollama host after admission, when each call is routed,
+so the dispatcher does not limit requests per host. The session's connector
+does: it opens at most the configured pool size of connections per host and
+holds further calls until one is free. That wait is not counted in the
+dispatcher's queue stats.
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import logging
+import threading
+import time
+from collections import Counter
+
+import aiohttp
+
+from ollama_client import pool_limits
+
+# Seconds a whole request (including thinking steps) may take before it is
+# cancelled, and seconds allowed to open a connection to Ollama.
+DEFAULT_TIMEOUT = 300
+CONNECT_TIMEOUT = 10
+
+# Requests running at once in total and per model. Ollama serves a model's
+# parallel requests from one set of weights (``OLLAMA_NUM_PARALLEL``), so
+# going beyond that only makes every response slower.
+DEFAULT_MAX_REQUESTS = 4
+DEFAULT_MODEL_CONCURRENCY = 2
+
+# Queue priorities. Task priorities (1 Low, 2 Medium, 3 High) are used as-is.
+PRIORITY_LOW = 1
+PRIORITY_MEDIUM = 2
+PRIORITY_HIGH = 3
+PRIORITY_FOLLOW_UP = 5
+PRIORITY_INTERACTIVE = 10
+# A queued request gains one priority level for every AGING_SECONDS it waits.
+AGING_SECONDS = 30
+
+
+class InferenceRequest:
+    """Handle for a worker submitted to the engine."""
+
+    def __init__(self, worker, future):
+        self.worker = worker
+        self._future = future
+
+    def cancel(self):
+        """Stop the request. The worker still emits ``finished``."""
+        return self._future.cancel()
+
+    def done(self):
+        return self._future.done()
+
+    def wait(self, timeout=None):
+        """Block until the request completes or ``timeout`` seconds pass."""
+        concurrent.futures.wait([self._future], timeout=timeout)
+        return self._future.done()
+
+
+class InferenceEngine:
+    """Runs worker coroutines on a dedicated event loop thread."""
+
+    def __init__(self, debug_enabled=False, max_requests=DEFAULT_MAX_REQUESTS,
+                 model_concurrency=DEFAULT_MODEL_CONCURRENCY):
+        self.debug_enabled = debug_enabled
+        self.max_requests = max_requests
+        self.model_concurrency = model_concurrency
+        # Dispatcher state, only touched on the loop thread
+        self._queue = []  # (worker, model, priority, enqueued, future)
+        self._running = 0
+        self._running_models = Counter()
+        self._stats = {"running": 0, "queued": 0, "total_wait": 0.0, "waited": 0, "max_wait": 0.0}
+        self.loop = asyncio.new_event_loop()
+        self._session = None
+        self._session_limits = None
+        self._retired_sessions = []
+        self._thread = threading.Thread(
+            target=self._run_loop, name="inference", daemon=True
+        )
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _get_session(self):
+        """Return the shared client session, sized to the current pool limits."""
+        limits = pool_limits()
+        if self._session is None or self._session.closed or limits != self._session_limits:
+            if self._session is not None and not self._session.closed:
+                # Requests in flight keep their connections; close it at shutdown.
+                self._retired_sessions.append(self._session)
+            pool_size, pool_hosts = limits
+            connector = aiohttp.TCPConnector(
+                limit=pool_size * pool_hosts, limit_per_host=pool_size
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT),
+            )
+            self._session_limits = limits
+        return self._session
+
+    def _can_start(self, model):
+        return (
+            self._running < self.max_requests
+            and self._running_models[model] < self.model_concurrency
+        )
+
+    def _start(self, model):
+        self._running += 1
+        self._running_models[model] += 1
+
+    def _release(self, model):
+        self._running -= 1
+        self._running_models[model] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Start queued requests, highest effective priority first."""
+        now = time.monotonic()
+
+        def order(entry):
+            priority, enqueued = entry[2], entry[3]
+            return (-(priority + (now - enqueued) / AGING_SECONDS), enqueued)
+
+        waiting = []
+        for entry in sorted(self._queue, key=order):
+            worker, model, priority, enqueued, future = entry
+            if future.done():
+                continue  # cancelled while queued
+            if self._can_start(model):
+                self._start(model)
+                future.set_result(now - enqueued)
+            else:
+                waiting.append(entry)
+        self._queue = waiting
+        self._update_stats()
+
+    def _update_stats(self):
+        self._stats["running"] = self._running
+        self._stats["queued"] = len(self._queue)
+
+    async def _admit(self, worker, model, priority):
+        """Wait for a slot and return the seconds spent queued."""
+        future = self.loop.create_future()
+        self._queue.append((worker, model, priority, time.monotonic(), future))
+        self._dispatch()
+        if self.debug_enabled and not future.done():
+            print(
+                f"[Debug] Queued request for '{getattr(worker, 'agent_name', None)}'"
+                f" at priority {priority} ({len(self._queue)} waiting)."
+            )
+        try:
+            return await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just before the cancellation arrived
+                self._release(model)
+            else:
+                self._dispatch()
+            raise
+
+    @contextlib.contextmanager
+    def _extra_slots(self, model, count):
+        """Take up to ``count`` free slots for a running request and yield how many.
+
+        Nothing waits: slots are only taken while no request is queued, so
+        queued requests are not passed over, and the slots are released
+        when the block ends.
+        """
+        taken = 0
+        while taken < count and not self._queue and self._can_start(model):
+            self._start(model)
+            taken += 1
+        self._update_stats()
+        try:
+            yield taken
+        finally:
+            for _ in range(taken):
+                self._release(model)
+
+    async def _run(self, worker, timeout, priority):
+        name = getattr(worker, "agent_name", None)
+        model = getattr(worker, "model_name", None)
+        try:
+            waited = await self._admit(worker, model, priority)
+        except asyncio.CancelledError:
+            worker.cancelled = True
+            worker.finished.emit()
+            raise
+        worker.queue_wait = waited
+        worker.extra_slots = lambda count: self._extra_slots(model, count)
+        self._stats["waited"] += 1
+        self._stats["total_wait"] += waited
+        self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+        try:
+            await asyncio.wait_for(worker.run_async(self._get_session()), timeout)
+        except asyncio.TimeoutError:
+            error_msg = f"[Error] Request for '{name}' timed out after {timeout} seconds"
+            logging.error(error_msg)
+            if self.debug_enabled:
+                print(error_msg)
+            worker.error_occurred.emit(error_msg)
+            worker.finished.emit()
+        except asyncio.CancelledError:
+            if self.debug_enabled:
+                print(f"[Debug] Request for '{name}' cancelled.")
+            worker.cancelled = True
+            worker.finished.emit()
+            raise
+        except Exception as e:
+            # run_async reports its own errors; this only catches bugs.
+            error_msg = f"[Error] Inference engine failed to run worker: {e}"
+            logging.error(error_msg)
+            print(error_msg)
+            worker.error_occurred.emit(error_msg)
+            worker.finished.emit()
+        finally:
+            self._release(model)
+
+    def stats(self):
+        """Return a snapshot of dispatcher counters.
+
+        ``running`` and ``queued`` are current counts; ``average_wait`` and
+        ``max_wait`` are seconds requests spent queued since startup.
+        """
+        stats = dict(self._stats)
+        waited = stats.pop("waited")
+        total = stats.pop("total_wait")
+        stats["average_wait"] = total / waited if waited else 0.0
+        return stats
+
+    def configure(self, max_requests=None, model_concurrency=None):
+        """Change the dispatcher limits; queued requests start if now allowed."""
+        if max_requests:
+            self.max_requests = max(int(max_requests), 1)
+        if model_concurrency:
+            self.model_concurrency = max(int(model_concurrency), 1)
+        self.loop.call_soon_threadsafe(self._dispatch)
+
+    def submit(self, worker, timeout=DEFAULT_TIMEOUT, priority=PRIORITY_INTERACTIVE):
+        """Schedule ``worker.run_async`` and return an :class:`InferenceRequest`.
+
+        ``priority`` orders the request in the queue when the dispatcher
+        limits are reached; higher values run first.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(worker, timeout or None, priority), self.loop
+        )
+        if self.debug_enabled:
+            print(f"[Debug] Submitted request for '{getattr(worker, 'agent_name', None)}'.")
+        return InferenceRequest(worker, future)
+
+    async def _close(self):
+        sessions = self._retired_sessions + [self._session]
+        self._session = None
+        self._retired_sessions = []
+        for session in sessions:
+            if session is not None and not session.closed:
+                await session.close()
+
+    def shutdown(self, timeout=5):
+        """Cancel outstanding requests, close connections and stop the loop."""
+        async def stop():
+            current = asyncio.current_task()
+            tasks = [t for t in asyncio.all_tasks() if t is not current]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._close()
+
+        if self.loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(stop(), self.loop)
+            try:
+                future.result(timeout)
+            except Exception as e:
+                print(f"[Error] Failed to stop inference engine cleanly: {e}")
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+
+
+_lock = threading.Lock()
+_engine = None
+
+
+def get_engine(debug_enabled=False):
+    """Return the process-wide engine, starting its loop on first use."""
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = InferenceEngine(debug_enabled)
+        return _engine
+
+
+def submit_request(worker, timeout=DEFAULT_TIMEOUT, debug_enabled=False,
+                   priority=PRIORITY_INTERACTIVE):
+    """Run ``worker`` on the shared engine. See :meth:`InferenceEngine.submit`."""
+    return get_engine(debug_enabled).submit(worker, timeout, priority)
+
+
+def configure_dispatch(max_requests=None, model_concurrency=None, debug_enabled=False):
+    """Set the dispatcher limits of the shared engine."""
+    get_engine(debug_enabled).configure(max_requests, model_concurrency)
+    if debug_enabled:
+        print(
+            f"[Debug] Inference dispatcher limits: {max_requests} total,"
+            f" {model_concurrency} per model"
+        )
+
+
+def dispatch_stats():
+    """Return the shared engine's dispatcher stats, or zeros if not started."""
+    with _lock:
+        engine = _engine
+    if engine is None:
+        return {"running": 0, "queued": 0, "average_wait": 0.0, "max_wait": 0.0}
+    return engine.stats()
+
+
+def shutdown_engine():
+    """Stop the shared engine if it was started."""
+    global _engine
+    with _lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.shutdown()
@@ -35,6 +35,9 @@ def format_user_friendly(error_msg: str, api_url: str | None = None) -> str:
             message += f" Ensure the service at {api_url} is running."
         return message
 
+    if "is unavailable; trying again" in msg_lower:
+        return "The AI service is down. Requests will resume once it responds again."
+
     if "timeout" in msg_lower:
         return "The request to the AI service timed out."
 
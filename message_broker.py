@@ -1,18 +1,29 @@
 # message_broker.py
 import json
 from datetime import datetime
-from PyQt5.QtCore import QThread
 from worker import AIWorker
-from tools import run_tool
+from inference_engine import (
+    submit_request,
+    DEFAULT_TIMEOUT,
+    PRIORITY_FOLLOW_UP,
+    PRIORITY_INTERACTIVE,
+)
+from tool_executor import run_tools_async
+from prompt_cache import system_prompt_for
 from tool_utils import (
-    generate_tool_instructions_message,
     format_tool_call_html,
     format_tool_result_html,
     format_tool_block_html,
+    format_tool_running_html,
+    format_tool_results_message,
+    parse_tool_requests,
+    MAX_TOOL_REQUESTS,
 )
 from tasks import add_task, delete_task, save_tasks
+from context_builder import build_context, context_budget, priority_indexes
 from transcripts import (
-    load_history,
+    get_history,
+    agent_history,
     append_message,
     clear_history,
     export_history,
@@ -26,8 +37,9 @@ class MessageBroker:
     """
     def __init__(self, app):
         self.app = app  # Reference to the main application
-        self.chat_history = load_history(app.debug_enabled if app else False)
-        self.active_worker_threads = []
+        self.chat_history = get_history(app.debug_enabled if app else False)
+        # Requests running on the inference engine, keyed by worker
+        self.active_requests = {}
 
     def send_message(self, sender, recipient, message):
         """
@@ -136,7 +148,6 @@ class MessageBroker:
         max_tokens = agent_settings.get("max_tokens", 512)
         chat_history = self.build_agent_chat_history(recipient)
 
-        thread = QThread()
         worker = AIWorker(
             model_name,
             chat_history,
@@ -146,38 +157,47 @@ class MessageBroker:
             recipient,
             self.app.agents_data if self.app else {}
         )
-        worker.moveToThread(thread)
-        self.active_worker_threads.append((worker, thread))
 
         def on_finished():
-            self.worker_finished_sequential(worker, thread, recipient)
+            self.worker_finished_sequential(worker, request, recipient)
 
         worker.response_received.connect(self.app.handle_ai_response_chunk)
+        worker.thought_received.connect(self.app.handle_thought_chunk)
         worker.error_occurred.connect(self.app.handle_worker_error)
         worker.finished.connect(on_finished)
 
-        thread.started.connect(worker.run)
         if self.app and self.app.debug_enabled:
             print(
                 f"[Debug] Starting worker for '{recipient}' using model '{model_name}'"
                 f" (temp={temperature}, max_tokens={max_tokens})"
             )
-        thread.start()
+        # Messages typed by the user go ahead of queued background work
+        priority = PRIORITY_INTERACTIVE if sender == "user" else PRIORITY_FOLLOW_UP
+        request = self._submit(worker, priority)
+
+    def _submit(self, worker, priority=PRIORITY_FOLLOW_UP):
+        """Run ``worker`` on the inference engine and track its request."""
+        request = submit_request(
+            worker,
+            getattr(self.app, "request_timeout", DEFAULT_TIMEOUT),
+            self.app.debug_enabled if self.app else False,
+            priority,
+        )
+        self.active_requests[worker] = request
+        return request
 
-    def worker_finished_sequential(self, sender_worker, thread, agent_name):
+    def worker_finished_sequential(self, sender_worker, request, agent_name):
         """
-        Handles the completion of a worker thread in sequential mode.
+        Handles the completion of a worker in sequential mode.
 
         Args:
             sender_worker (AIWorker): The worker that finished.
-            thread (QThread): The thread the worker was running in.
+            request (InferenceRequest): The engine request that ran the worker.
             agent_name (str): The name of the agent the worker was processing.
         """
-        assistant_content = self.app.current_responses.get(agent_name, "")
-        if agent_name in self.app.current_responses:
-            del self.app.current_responses[agent_name]
+        assistant_content = "".join(self.app.current_responses.pop(agent_name, []))
 
-        tool_request = None
+        tool_requests = []
         task_request = None
         content = assistant_content.strip()
 
@@ -186,10 +206,12 @@ class MessageBroker:
         # Specialist agent response condition check
         if agent_settings.get('role') == 'Specialist':
             if not self.chat_history:
+                self.app.chat_tab.discard_stream(agent_name)
                 return
             last_message = self.chat_history[-1]['content']
 
             if not last_message.endswith(f"Next Response By: {agent_name}"):
+                self.app.chat_tab.discard_stream(agent_name)
                 return
 
         # Attempt to parse JSON responses for any agent when tool use is enabled
@@ -201,8 +223,8 @@ class MessageBroker:
                 parsed = None
 
         if parsed is not None:
-            if "tool_request" in parsed:
-                tool_request = parsed["tool_request"]
+            if "tool_request" in parsed or "tool_requests" in parsed:
+                tool_requests = parse_tool_requests(parsed)
                 content = parsed.get("content", "").strip()
             if "task_request" in parsed:
                 task_request = parsed["task_request"]
@@ -221,7 +243,9 @@ class MessageBroker:
         # Display in the UI if there's content
         if agent_settings.get('role') in ['Coordinator', 'Assistant', 'Specialist']:
             if content:
-                self.app.chat_tab.append_message_html(
+                # Replace the streamed bubble with the formatted reply
+                self.app.chat_tab.finish_stream(
+                    agent_name,
                     f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> {content}"
                 )
                 if agent_settings.get('tts_enabled'):
@@ -235,6 +259,9 @@ class MessageBroker:
                     debug_enabled=self.app.debug_enabled if self.app else False,
                 )
 
+        # Drop any streamed text that was not turned into a message
+        self.app.chat_tab.discard_stream(agent_name)
+
         # If there's a next agent specified and it's managed by the coordinator
         if next_agent and agent_settings.get('role') == 'Coordinator':
             managed_agents = agent_settings.get('managed_agents', [])
@@ -244,54 +271,85 @@ class MessageBroker:
                 error_msg = f"[{timestamp}] <span style='color:red;'>[Error] Agent '{next_agent}' is not managed by Coordinator '{agent_name}'.</span>"
                 self.app.chat_tab.append_message_html(error_msg)
 
-        # Handle any tool request
-        if tool_request and agent_settings.get("tool_use", False):
-            tool_name = tool_request.get("name", "")
-            tool_args = tool_request.get("args", {})
-
+        # Handle any tool requests
+        if tool_requests and agent_settings.get("tool_use", False):
+            debug = self.app.debug_enabled if self.app else False
             enabled_tools = agent_settings.get("tools_enabled", [])
-            if tool_name not in enabled_tools:
-                error_msg = f"[{timestamp}] <span style='color:red;'>[Tool Error] Tool '{tool_name}' is not enabled for agent '{agent_name}'.</span>"
+            calls = []
+            for call in tool_requests:
+                tool_name = call["name"]
+                if tool_name not in enabled_tools:
+                    error = f"[Tool Error] Tool '{tool_name}' is not enabled for agent '{agent_name}'."
+                elif len(calls) >= MAX_TOOL_REQUESTS:
+                    error = f"[Tool Error] Only {MAX_TOOL_REQUESTS} tool calls are run per reply; skipped '{tool_name}'."
+                else:
+                    calls.append(call)
+                    continue
+                error_msg = f"[{timestamp}] <span style='color:red;'>{error}</span>"
                 self.app.chat_tab.append_message_html(error_msg)
                 append_message(
                     self.chat_history,
                     "assistant",
                     error_msg,
                     agent_name,
-                    debug_enabled=self.app.debug_enabled if self.app else False,
-                )
-            else:
-                tool_result = run_tool(self.app.tools, tool_name, tool_args, self.app.debug_enabled)
-                block_html = format_tool_block_html(tool_name, tool_args, tool_result)
-                self.app.chat_tab.append_message_html(
-                    f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> {block_html}"
-                )
-                append_message(
-                    self.chat_history,
-                    "assistant",
-                    f"{agent_name} called {tool_name}",
-                    agent_name,
-                    debug_enabled=self.app.debug_enabled if self.app else False,
+                    debug_enabled=debug,
                 )
-                append_message(
-                    self.chat_history,
-                    "assistant",
-                    tool_result,
-                    agent_name,
-                    debug_enabled=self.app.debug_enabled if self.app else False,
-                )
-                if tool_result.startswith("[Tool Error]"):
-                    error_msg = f"[{timestamp}] <span style='color:red;'>{tool_result}</span>"
-                    self.app.chat_tab.append_message_html(error_msg)
+
+            if calls:
+                block_ids = [
+                    self.app.chat_tab.begin_tool_block(
+                        f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> "
+                        f"{format_tool_running_html(call['name'], call['args'])}"
+                    )
+                    for call in calls
+                ]
+
+                def on_tool_done(call_index, tool_result):
+                    tool_name = calls[call_index]["name"]
+                    tool_args = calls[call_index]["args"]
+                    block_html = format_tool_block_html(tool_name, tool_args, tool_result)
+                    self.app.chat_tab.finish_tool_block(
+                        block_ids[call_index],
+                        f"\n[{timestamp}] <span style='color:{agent_color};'>{agent_name}:</span> {block_html}",
+                    )
                     append_message(
                         self.chat_history,
                         "assistant",
-                        error_msg,
+                        f"{agent_name} called {tool_name}",
                         agent_name,
-                        debug_enabled=self.app.debug_enabled if self.app else False,
+                        debug_enabled=debug,
+                    )
+                    append_message(
+                        self.chat_history,
+                        "assistant",
+                        tool_result,
+                        agent_name,
+                        debug_enabled=debug,
+                        tool=tool_name,
+                    )
+                    if tool_result.startswith("[Tool Error]"):
+                        error_msg = f"[{timestamp}] <span style='color:red;'>{tool_result}</span>"
+                        self.app.chat_tab.append_message_html(error_msg)
+                        append_message(
+                            self.chat_history,
+                            "assistant",
+                            error_msg,
+                            agent_name,
+                            debug_enabled=debug,
+                        )
+
+                def on_tools_done(tool_results):
+                    # Send all results back to the agent in one follow-up response
+                    self.deliver_tool_result(
+                        agent_name,
+                        ", ".join(call["name"] for call in calls),
+                        format_tool_results_message(
+                            [(call["name"], r) for call, r in zip(calls, tool_results)]
+                        ),
                     )
-                # Send the tool result back to the agent for a follow-up response
-                self.deliver_tool_result(agent_name, tool_name, tool_result)
+
+                # The tools run in the background; the follow-up is sent when all finish
+                run_tools_async(self.app.tools, calls, on_tool_done, on_tools_done, debug_enabled=debug)
 
         # Handle any task request
         if task_request:
@@ -317,17 +375,9 @@ class MessageBroker:
         if self.app.debug_enabled and agent_name:
             print(f"[Debug] Worker for agent '{agent_name}' finished.")
 
-        thread.quit()
-        thread.wait()
-
-        # Remove the worker-thread pair
-        for i, (worker_item, thread_item) in enumerate(self.active_worker_threads):
-            if worker_item == sender_worker:
-                del self.active_worker_threads[i]
-                break
+        self.active_requests.pop(sender_worker, None)
 
         sender_worker.deleteLater()
-        thread.deleteLater()
 
     def get_chat_history(self, agent_name=None):
         """
@@ -364,51 +414,27 @@ class MessageBroker:
         Returns:
             list: The chat history for the agent.
         """
-        self.chat_history = load_history(
+        self.chat_history = get_history(
             self.app.debug_enabled if self.app else False
         )
         threshold = getattr(self.app, "summarization_threshold", 20)
-        self.chat_history = summarize_history(self.chat_history, threshold=threshold)
-        system_prompt = ""
         agent_settings = self.app.agents_data.get(agent_name, {}) if self.app else {}
-
-        if agent_settings:
-            # If coordinator, include managed agents info
-            if agent_settings.get('role') == 'Coordinator':
-                managed_agents_info = []
-                for managed_agent_name in agent_settings.get('managed_agents', []):
-                    managed_agent_settings = self.app.agents_data.get(managed_agent_name, {})
-                    if managed_agent_settings:
-                        desc = managed_agent_settings.get('description', 'No description available')
-                        managed_agents_info.append(f"{managed_agent_name}: {desc}")
-                if managed_agents_info:
-                    system_prompt += "You can choose from the following agents:\n" + "\n".join(managed_agents_info) + "\n"
-
-            system_prompt += agent_settings.get("system_prompt", "")
-
-            # If the agent can use tools, add the instructions
-            if agent_settings.get("tool_use", False):
-                tool_instructions = generate_tool_instructions_message(self.app, agent_name)
-                system_prompt += "\n" + tool_instructions
-
-        chat_history = [{"role": "system", "content": system_prompt}]
-
-        # Filter messages for relevant roles
-        for msg in self.chat_history:
-            if msg['role'] == 'user':
-                chat_history.append(msg)
-            elif msg['role'] == 'assistant':
-                # Include messages from this agent
-                if msg.get('agent') == agent_name:
-                    chat_history.append(msg)
-                # If agent_name is coordinator, also see specialist responses
-                elif (agent_settings.get('role') == 'Coordinator'
-                      and self.app.agents_data.get(msg.get('agent'), {}).get('role') == 'Specialist'):
-                    chat_history.append(msg)
+        system_prompt = system_prompt_for(self.app, agent_name, self.app.debug_enabled) if self.app else ""
+
+        # Messages this agent can see, maintained incrementally on append.
+        # Coordinators also see Specialist responses.
+        include_agents = ()
+        if agent_settings.get('role') == 'Coordinator':
+            include_agents = [
+                name for name, settings in self.app.agents_data.items()
+                if settings.get('role') == 'Specialist'
+            ]
+        visible, positions = agent_history(self.chat_history, agent_name, include_agents)
+        chat_history = list(visible)
 
         # If last message indicates a handoff to a Specialist, insert that specialist's
         # description if relevant
-        if len(chat_history) > 1:
+        if chat_history:
             last_msg = chat_history[-1]
             if last_msg['role'] == 'assistant' and "Next Response By:" in last_msg['content']:
                 next_agent_name = last_msg['content'].split("Next Response By:")[1].strip()
@@ -421,18 +447,29 @@ class MessageBroker:
         if user_message:
             chat_history.append(user_message)
 
-        return chat_history
+        # Fill the agent's token budget; older messages that do not fit are
+        # summarized instead of sent verbatim.
+        _, budget = context_budget(agent_settings)
+        pinned = priority_indexes(chat_history) | set(range(len(positions), len(chat_history)))
+
+        def summarize(first_index):
+            position = positions[first_index] if first_index < len(positions) else len(self.chat_history)
+            if not threshold or not 0 < position < len(self.chat_history):
+                return None
+            summarized = summarize_history(
+                self.chat_history, threshold=len(self.chat_history) - position, key=agent_name
+            )
+            return summarized[0] if summarized[0].get("role") == "system" else None
+
+        return build_context(system_prompt, chat_history, budget, pinned, summarize)
 
     def close_all_threads(self):
         """
-        Stops all worker threads.
+        Cancels all running requests.
         """
-        for worker, thread in self.active_worker_threads:
-            thread.quit()
-            thread.wait()
-            worker.deleteLater()
-            thread.deleteLater()
-        self.active_worker_threads.clear()
+        for request in self.active_requests.values():
+            request.cancel()
+        self.active_requests.clear()
 
     def clear_chat(self):
         """Clears the chat history."""
@@ -497,7 +534,6 @@ class MessageBroker:
         max_tokens = agent_settings.get("max_tokens", 512)
         chat_history = self.build_agent_chat_history(agent_name)
 
-        thread = QThread()
         worker = AIWorker(
             model_name,
             chat_history,
@@ -512,18 +548,16 @@ class MessageBroker:
                 f"[Debug] Starting worker for '{agent_name}' using model '{model_name}'"
                 f" (temp={temperature}, max_tokens={max_tokens})"
             )
-        worker.moveToThread(thread)
-        self.active_worker_threads.append((worker, thread))
 
         def on_finished():
-            self.worker_finished_sequential(worker, thread, agent_name)
+            self.worker_finished_sequential(worker, request, agent_name)
 
         worker.response_received.connect(self.app.handle_ai_response_chunk)
+        worker.thought_received.connect(self.app.handle_thought_chunk)
         worker.error_occurred.connect(self.app.handle_worker_error)
         worker.finished.connect(on_finished)
 
-        thread.started.connect(worker.run)
-        thread.start()
+        request = self._submit(worker)
 
     def deliver_tool_result(self, agent_name, tool_name, result):
         """Send a tool's output back to the requesting agent."""
@@ -1,11 +1,13 @@
 import json
 import os
+from persistence import write_json, flush
 
 METRICS_FILE = "metrics.json"
 
 
 def load_metrics(debug_enabled=False):
     """Load metrics from disk."""
+    flush(METRICS_FILE)
     if not os.path.exists(METRICS_FILE):
         return {"tool_usage": {}, "task_completion_counts": {}, "response_times": {}}
     try:
@@ -20,14 +22,14 @@ def load_metrics(debug_enabled=False):
 
 
 def save_metrics(metrics, debug_enabled=False):
-    """Save metrics to disk."""
-    try:
-        with open(METRICS_FILE, "w", encoding="utf-8") as f:
-            json.dump(metrics, f, indent=2)
-        if debug_enabled:
-            print("[Debug] Metrics saved")
-    except Exception as e:
-        print(f"[Error] Failed to save metrics: {e}")
+    """Save metrics to disk.
+
+    Writes are queued and coalesced, so recording a metric after every
+    response costs at most one write per flush interval.
+    """
+    write_json(METRICS_FILE, metrics, debug_enabled=debug_enabled)
+    if debug_enabled:
+        print("[Debug] Metrics save queued")
 
 
 def record_tool_usage(metrics, tool_name, debug_enabled=False):
@@ -53,6 +55,31 @@ def record_response_time(metrics, agent_name, elapsed, debug_enabled=False):
     save_metrics(metrics, debug_enabled)
 
 
+def record_queue_wait(metrics, agent_name, waited, debug_enabled=False):
+    """Record how long an agent's request waited for a dispatcher slot."""
+    metrics.setdefault("queue_waits", {})
+    entry = metrics["queue_waits"].setdefault(agent_name, {"total_time": 0.0, "count": 0})
+    entry["total_time"] += waited
+    entry["count"] += 1
+    save_metrics(metrics, debug_enabled)
+
+
+def average_queue_wait(metrics, agent_name):
+    """Return the average time an agent's requests spent queued."""
+    entry = metrics.get("queue_waits", {}).get(agent_name)
+    if entry and entry.get("count"):
+        return entry["total_time"] / entry["count"]
+    return 0.0
+
+
+def record_cache_lookup(metrics, agent_name, hit, debug_enabled=False):
+    """Count a response cache hit or miss for an agent."""
+    metrics.setdefault("response_cache", {})
+    entry = metrics["response_cache"].setdefault(agent_name, {"hits": 0, "misses": 0})
+    entry["hits" if hit else "misses"] += 1
+    save_metrics(metrics, debug_enabled)
+
+
 def average_response_time(metrics, agent_name):
     """Return the average response time for an agent."""
     entry = metrics.get("response_times", {}).get(agent_name)
@@ -0,0 +1,264 @@
+# model_residency.py
+
+"""Keep the models agents use loaded in Ollama.
+
+Ollama loads a model on its first request and unloads it after
+``keep_alive`` of idle time, so the first turn of each agent, and a
+Specialist answering after a long Coordinator turn, can wait for a cold
+load. This module:
+
+* plans a ``keep_alive`` per model from ``agents_data``: models used by a
+  Coordinator and its managed Specialists, or by several enabled agents,
+  are kept for ``TEAM_KEEP_ALIVE``; others for ``DEFAULT_KEEP_ALIVE``;
+* preloads the enabled agents' models in the background after startup,
+  with the context size (``num_ctx``) their agents ask for, since Ollama
+  reloads a model whose runner was started with another context size;
+* loads a Coordinator's Specialist models while the Coordinator is
+  answering, and the named Specialist's model as soon as the handoff line
+  streams in, so the handoff finds them warm;
+* tracks which models are loaded, most recently used last, and unloads the
+  least recently used when their total size exceeds the RAM budget.
+
+Load and unload requests run on one background thread.
+"""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from backends import get_backends, select_backend
+from context_builder import context_budget
+from ollama_client import get_session
+
+DEFAULT_KEEP_ALIVE = "5m"
+TEAM_KEEP_ALIVE = "30m"
+# Seconds allowed to load a model
+LOAD_TIMEOUT = 300
+
+_lock = threading.Lock()
+_keep_alive = {}  # model -> keep_alive
+_num_ctx = {}  # model -> context size its agents request
+_teams = {}  # coordinator agent -> models of its managed agents
+_sizes = {}  # model -> bytes, from /api/tags
+_resident = OrderedDict()  # model -> last use, least recently used first
+_budget = 0  # bytes; 0 means no limit
+_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix="residency")
+
+
+def _agent_model(settings):
+    return settings.get("model", "").strip()
+
+
+def plan_residency(agents_data, debug_enabled=False):
+    """Work out keep_alive values, context sizes and Coordinator teams from
+    ``agents_data``.
+
+    A model used by agents with different context sizes is loaded with the
+    one most of them use, the larger on a tie.
+    """
+    enabled = {
+        name: settings for name, settings in agents_data.items()
+        if settings.get("enabled", True) and _agent_model(settings)
+    }
+    users = {}
+    contexts = {}
+    for name, settings in enabled.items():
+        users.setdefault(_agent_model(settings), set()).add(name)
+        contexts.setdefault(_agent_model(settings), []).append(context_budget(settings)[0])
+    num_ctx = {
+        model: max(set(sizes), key=lambda size: (sizes.count(size), size))
+        for model, sizes in contexts.items()
+    }
+    teams = {}
+    for name, settings in enabled.items():
+        if settings.get("role") == "Coordinator":
+            managed = [m for m in settings.get("managed_agents", []) if m in enabled]
+            teams[name] = sorted({_agent_model(enabled[m]) for m in managed})
+    team_models = {m for models in teams.values() for m in models}
+    team_models.update(_agent_model(enabled[c]) for c in teams)
+    keep_alive = {
+        model: TEAM_KEEP_ALIVE if model in team_models or len(names) > 1 else DEFAULT_KEEP_ALIVE
+        for model, names in users.items()
+    }
+    with _lock:
+        _keep_alive.clear()
+        _keep_alive.update(keep_alive)
+        _num_ctx.clear()
+        _num_ctx.update(num_ctx)
+        _teams.clear()
+        _teams.update(teams)
+    if debug_enabled:
+        print(f"[Debug] Model keep_alive plan: {keep_alive}")
+    return keep_alive
+
+
+def configure_residency(budget_gb=None, debug_enabled=False):
+    """Set the RAM budget for loaded models in GB (0 for no limit)."""
+    global _budget
+    with _lock:
+        _budget = int(float(budget_gb or 0) * 1024 ** 3)
+    if debug_enabled:
+        print(f"[Debug] Model RAM budget: {budget_gb or 'unlimited'} GB")
+    _submit(_enforce_budget, debug_enabled)
+
+
+def keep_alive_for(model):
+    """Return the keep_alive to send with a request for ``model``."""
+    with _lock:
+        return _keep_alive.get(model, DEFAULT_KEEP_ALIVE)
+
+
+def resident_models():
+    """Return the models believed loaded, least recently used first."""
+    with _lock:
+        return list(_resident)
+
+
+def note_request(agent_name, model, debug_enabled=False):
+    """Record that ``agent_name`` is about to use ``model``.
+
+    Marks the model as recently used and, for a Coordinator, starts loading
+    its team's models in the background.
+    """
+    with _lock:
+        _expire()
+        _touch(model)
+        team = [m for m in _teams.get(agent_name, []) if m not in _resident]
+    for team_model in team:
+        _submit(_load, team_model, debug_enabled)
+    _submit(_enforce_budget, debug_enabled)
+
+
+def prefetch(model, debug_enabled=False):
+    """Start loading ``model`` in the background unless it is loaded already."""
+    with _lock:
+        _expire()
+        if model in _resident:
+            return
+    _submit(_load, model, debug_enabled)
+
+
+def warm_up(agents_data, debug_enabled=False):
+    """Plan residency and preload the enabled agents' models in the background.
+
+    Team models are loaded first. Loading stops once the budget is full.
+    """
+    keep_alive = plan_residency(agents_data, debug_enabled)
+    order = sorted(keep_alive, key=lambda m: keep_alive[m] != TEAM_KEEP_ALIVE)
+    _submit(_refresh_sizes, debug_enabled)
+    for model in order:
+        _submit(_load, model, debug_enabled, True)
+
+
+def _submit(fn, *args):
+    try:
+        _jobs.submit(fn, *args)
+    except RuntimeError:
+        pass  # interpreter shutting down
+
+
+def _seconds(keep_alive):
+    units = {"s": 1, "m": 60, "h": 3600}
+    keep_alive = str(keep_alive)
+    if keep_alive[-1:] in units:
+        return float(keep_alive[:-1]) * units[keep_alive[-1]]
+    return float(keep_alive)
+
+
+def _expire():
+    """Forget models Ollama will have unloaded by now; callers hold ``_lock``."""
+    now = time.monotonic()
+    for model, used in list(_resident.items()):
+        if now - used > _seconds(_keep_alive.get(model, DEFAULT_KEEP_ALIVE)):
+            del _resident[model]
+
+
+def _touch(model):
+    """Mark ``model`` loaded and most recently used; callers hold ``_lock``."""
+    _resident[model] = time.monotonic()
+    _resident.move_to_end(model)
+
+
+def _used_bytes():
+    return sum(_sizes.get(m, 0) for m in _resident)
+
+
+def _refresh_sizes(debug_enabled=False):
+    for backend in get_backends():
+        try:
+            response = get_session().get(f"{backend.url}/api/tags", timeout=5)
+            response.raise_for_status()
+            for entry in response.json().get("models", []):
+                name = entry.get("name", "")
+                size = entry.get("size", 0)
+                with _lock:
+                    _sizes[name] = size
+                    if name.endswith(":latest"):
+                        _sizes[name[:-len(":latest")]] = size
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if debug_enabled:
+                print(f"[Debug] Could not read model sizes from {backend.url}: {e}")
+
+
+def _load(model, debug_enabled=False, within_budget=False):
+    """Ask Ollama to load ``model`` with its planned keep_alive and context size."""
+    with _lock:
+        _expire()
+        if model in _resident:
+            return
+        if within_budget and _budget and _used_bytes() + _sizes.get(model, 0) > _budget:
+            if debug_enabled:
+                print(f"[Debug] Not preloading '{model}': over the model RAM budget")
+            return
+    backend = select_backend(model)
+    if backend is None:
+        return
+    payload = {"model": model, "keep_alive": keep_alive_for(model)}
+    with _lock:
+        if model in _num_ctx:
+            payload["options"] = {"num_ctx": _num_ctx[model]}
+    start = time.monotonic()
+    try:
+        response = get_session().post(f"{backend.url}/api/generate", json=payload, timeout=LOAD_TIMEOUT)
+        response.raise_for_status()
+        response.close()
+    except requests.exceptions.RequestException as e:
+        logging.warning(f"Could not preload model '{model}': {e}")
+        if debug_enabled:
+            print(f"[Debug] Could not preload model '{model}': {e}")
+        return
+    with _lock:
+        _touch(model)
+    if debug_enabled:
+        print(f"[Debug] Loaded '{model}' on {backend.url} in {time.monotonic() - start:.1f}s")
+    _enforce_budget(debug_enabled)
+
+
+def _enforce_budget(debug_enabled=False):
+    """Unload least recently used models until the loaded ones fit the budget."""
+    evicted = []
+    with _lock:
+        while _budget and len(_resident) > 1 and _used_bytes() > _budget:
+            model, _ = _resident.popitem(last=False)
+            evicted.append(model)
+    for model in evicted:
+        _unload(model, debug_enabled)
+
+
+def _unload(model, debug_enabled=False):
+    payload = {"model": model, "keep_alive": 0}
+    for backend in get_backends():
+        if not backend.healthy or not backend.serves(model):
+            continue
+        try:
+            response = get_session().post(f"{backend.url}/api/generate", json=payload, timeout=30)
+            response.close()
+        except requests.exceptions.RequestException as e:
+            if debug_enabled:
+                print(f"[Debug] Could not unload '{model}' from {backend.url}: {e}")
+    if debug_enabled:
+        print(f"[Debug] Unloaded '{model}' to stay within the model RAM budget")
@@ -0,0 +1,80 @@
+# ollama_client.py
+
+"""Shared HTTP session for talking to Ollama.
+
+Ollama helpers outside the inference engine (model lists, health probes,
+model loading) use one ``requests.Session`` so connections to the server are
+kept alive and reused instead of opening a new TCP connection for every
+request. Chat requests use the engine's ``aiohttp`` session, sized from the
+same :func:`pool_limits`.
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Number of distinct hosts to keep connection pools for, and the maximum
+# number of open connections to any single host. Requests beyond the
+# per-host limit wait for a connection to be returned to the pool.
+DEFAULT_POOL_HOSTS = 4
+DEFAULT_POOL_SIZE = 8
+
+_lock = threading.Lock()
+_session = None
+_pool_hosts = DEFAULT_POOL_HOSTS
+_pool_size = DEFAULT_POOL_SIZE
+
+
+def _build_session(pool_hosts, pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_hosts,
+        pool_maxsize=pool_size,
+        pool_block=True,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            _session = _build_session(_pool_hosts, _pool_size)
+        return _session
+
+
+def pool_limits():
+    """Return ``(pool_size, pool_hosts)`` currently configured."""
+    with _lock:
+        return _pool_size, _pool_hosts
+
+
+def configure_pool(pool_size=None, pool_hosts=None, debug_enabled=False):
+    """Change the connection pool limits.
+
+    The shared session is replaced if the limits change. Requests already in
+    flight keep using the old session until they finish.
+    """
+    global _session, _pool_hosts, _pool_size
+    pool_size = max(int(pool_size or _pool_size), 1)
+    pool_hosts = max(int(pool_hosts or _pool_hosts), 1)
+    with _lock:
+        if (pool_size, pool_hosts) == (_pool_size, _pool_hosts) and _session is not None:
+            return
+        _pool_size, _pool_hosts = pool_size, pool_hosts
+        _session = _build_session(pool_hosts, pool_size)
+    if debug_enabled:
+        print(f"[Debug] Ollama connection pool set to {pool_size} per host")
+
+
+def close_session():
+    """Close pooled connections, e.g. on application shutdown."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session = None
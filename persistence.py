@@ -0,0 +1,118 @@
+# persistence.py
+
+"""Write-behind persistence for Cerebro's JSON stores.
+
+``write_json`` serializes the data and returns immediately. A background
+thread writes each path at most once per ``FLUSH_DELAY`` seconds, so a burst
+of saves to the same file becomes a single write of the latest data. Files are
+replaced atomically via a temporary file and ``os.replace``.
+
+Call :func:`flush` before reading a file that may have a pending write (the
+``load_*`` helpers do this) and on shutdown. It is also registered with
+``atexit``.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+
+FLUSH_DELAY = 0.5
+
+_lock = threading.Condition()
+# Serializes actual file writes so flush() never returns while the
+# background thread is still writing the same path.
+_write_lock = threading.Lock()
+_pending = {}  # path -> (JSON text, debug_enabled, due time)
+_thread = None
+
+
+def _write(path, text, debug_enabled):
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        if debug_enabled:
+            print(f"[Debug] Wrote {path}")
+    except Exception as e:
+        print(f"[Error] Failed to write {path}: {e}")
+
+
+def _run():
+    while True:
+        with _lock:
+            while not _pending:
+                _lock.wait()
+            due = min(item[2] for item in _pending.values())
+            delay = due - time.monotonic()
+            if delay > 0:
+                _lock.wait(delay)
+                continue
+        with _write_lock:
+            with _lock:
+                now = time.monotonic()
+                ready = [path for path, item in _pending.items() if item[2] <= now]
+                batch = [(path, _pending.pop(path)) for path in ready]
+            for path, (text, debug_enabled, _) in batch:
+                _write(path, text, debug_enabled)
+
+
+def _ensure_thread():
+    global _thread
+    if _thread is None or not _thread.is_alive():
+        _thread = threading.Thread(target=_run, name="persistence", daemon=True)
+        _thread.start()
+
+
+def write_json(path, data, indent=2, debug_enabled=False):
+    """Schedule ``data`` to be written to ``path`` as JSON.
+
+    ``data`` is serialized now, in the caller's thread, so it may be changed
+    as soon as this returns. Repeated calls for the same path before the
+    write happens are coalesced into one write of the latest data. If
+    ``data`` cannot be serialized, an error is printed and any earlier
+    pending data for the path is still written.
+    """
+    try:
+        text = json.dumps(data, indent=indent)
+    except (RuntimeError, TypeError, ValueError) as e:
+        print(f"[Error] Failed to serialize {path}: {e}")
+        return
+    with _lock:
+        previous = _pending.get(path)
+        due = previous[2] if previous else time.monotonic() + FLUSH_DELAY
+        _pending[path] = (text, debug_enabled, due)
+        _ensure_thread()
+        _lock.notify()
+
+
+def pending(path=None):
+    """Return True if ``path`` (or any path) has an unwritten update."""
+    with _lock:
+        return path in _pending if path is not None else bool(_pending)
+
+
+def flush(path=None):
+    """Write pending data now, for ``path`` only or for every file."""
+    with _write_lock:
+        with _lock:
+            if path is None:
+                batch = list(_pending.items())
+                _pending.clear()
+            elif path in _pending:
+                batch = [(path, _pending.pop(path))]
+            else:
+                batch = []
+        for item_path, (text, debug_enabled, _) in batch:
+            _write(item_path, text, debug_enabled)
+
+
+def discard(path):
+    """Drop any pending write for ``path``, e.g. before deleting the file."""
+    with _lock:
+        _pending.pop(path, None)
+
+
+atexit.register(flush)
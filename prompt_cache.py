@@ -0,0 +1,89 @@
+# prompt_cache.py
+
+"""System prompts compiled once per agent and reused until something changes.
+
+Building an agent's system prompt means collecting its managed agents'
+descriptions and scanning every tool and automation for the ones it may
+use. The result only changes when agents, tools, plugins or automations are
+edited, so :func:`system_prompt_for` caches it per agent and the code that
+makes those edits calls :func:`invalidate_prompts`.
+
+Ollama reuses the work done on the longest prefix a prompt shares with the
+previous request to the same model, so prompts are laid out with the parts
+that change least first:
+
+1. the tool protocol, identical for every agent that uses tools;
+2. the agent's own system prompt;
+3. for a Coordinator, the agents it can hand off to;
+4. the tools and automations enabled for the agent.
+
+The conversation follows, oldest message first, so consecutive turns of an
+agent share everything up to the newest messages.
+"""
+
+import threading
+
+from tool_utils import tool_protocol_message, tool_catalog_message
+
+_lock = threading.Lock()
+_prompts = {}  # agent name -> compiled system prompt
+# Bumped by every invalidation so a prompt compiled from stale settings is
+# not stored after the cache was cleared.
+_generation = 0
+
+
+def compile_system_prompt(app, agent_name):
+    """Build the system prompt for ``agent_name`` from ``app``'s current data."""
+    agents_data = getattr(app, "agents_data", {})
+    agent_settings = agents_data.get(agent_name, {})
+    if not agent_settings:
+        return ""
+    tool_use = agent_settings.get("tool_use", False)
+    parts = []
+    if tool_use:
+        parts.append(tool_protocol_message())
+    parts.append(agent_settings.get("system_prompt", ""))
+    if agent_settings.get("role") == "Coordinator":
+        managed_agents_info = [
+            f"{name}: {agents_data[name].get('description', 'No description available')}"
+            for name in agent_settings.get("managed_agents", [])
+            if agents_data.get(name)
+        ]
+        if managed_agents_info:
+            parts.append("You can choose from the following agents:\n" + "\n".join(managed_agents_info))
+    if tool_use:
+        parts.append(tool_catalog_message(app, agent_name))
+    return "\n".join(part for part in parts if part)
+
+
+def system_prompt_for(app, agent_name, debug_enabled=False):
+    """Return the cached system prompt for ``agent_name``, compiling it if needed."""
+    with _lock:
+        prompt = _prompts.get(agent_name)
+        generation = _generation
+    if prompt is not None:
+        return prompt
+    prompt = compile_system_prompt(app, agent_name)
+    with _lock:
+        if generation == _generation:
+            _prompts[agent_name] = prompt
+    if debug_enabled:
+        print(f"[Debug] Compiled system prompt for '{agent_name}' ({len(prompt)} chars)")
+    return prompt
+
+
+def invalidate_prompts(agent_name=None, debug_enabled=False):
+    """Drop the cached prompt for ``agent_name``, or for every agent if None.
+
+    Call after agents, tools, plugins or automations change. Coordinators'
+    prompts include other agents' descriptions, so agent edits clear all.
+    """
+    global _generation
+    with _lock:
+        _generation += 1
+        if agent_name is None:
+            _prompts.clear()
+        else:
+            _prompts.pop(agent_name, None)
+    if debug_enabled:
+        print(f"[Debug] System prompts invalidated for {agent_name or 'all agents'}")
@@ -0,0 +1,129 @@
+# resilience.py
+
+"""Retries and circuit breakers for Ollama requests.
+
+Requests that fail before Ollama has sent anything (connection refused,
+timeouts, 5xx while a model loads or the server restarts) are safe to send
+again. :func:`backoff_delay` spaces the retries out exponentially.
+
+Each endpoint has a :class:`CircuitBreaker`. After ``FAILURE_THRESHOLD``
+consecutive failures it opens and requests to that endpoint fail at once
+with :class:`CircuitOpenError` instead of queueing up behind a server that
+is down. After ``RESET_TIMEOUT`` seconds one request is let through as a
+probe (half-open); if it succeeds the breaker closes, otherwise it opens
+again. If the probe is cancelled, the next request becomes the probe.
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8.0
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to an endpoint that is down."""
+
+    def __init__(self, breaker):
+        self.endpoint = breaker.endpoint
+        self.retry_in = breaker.retry_in()
+        super().__init__(
+            f"Ollama at {self.endpoint} is unavailable; trying again in"
+            f" {self.retry_in:.0f} seconds"
+        )
+
+
+class CircuitBreaker:
+    """Tracks consecutive failures for one endpoint."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= RESET_TIMEOUT:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def abandon(self):
+        """Forget a request that was cancelled before it got a response.
+
+        A cancelled probe says nothing about the endpoint, so the next
+        request is let through as the probe instead.
+        """
+        with self._lock:
+            self._probing = False
+
+    def retry_in(self):
+        """Seconds until an open breaker lets a probe through."""
+        if self.state != OPEN:
+            return 0.0
+        return max(RESET_TIMEOUT - (time.monotonic() - self.opened_at), 0.0)
+
+
+_lock = threading.Lock()
+_breakers = {}
+
+
+def _endpoint(url):
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_breaker(url):
+    """Return the breaker for the server ``url`` belongs to."""
+    endpoint = _endpoint(url)
+    with _lock:
+        breaker = _breakers.get(endpoint)
+        if breaker is None:
+            breaker = _breakers[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def breaker_states():
+    """Return ``{endpoint: (state, failures, retry_in)}`` for the metrics tab."""
+    with _lock:
+        breakers = list(_breakers.values())
+    return {b.endpoint: (b.state, b.failures, b.retry_in()) for b in breakers}
+
+
+def backoff_delay(attempt):
+    """Seconds to wait before retry ``attempt`` (0-based), with jitter."""
+    delay = min(BACKOFF_BASE * (2 ** attempt), BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.0)
@@ -0,0 +1,154 @@
+# response_cache.py
+
+"""Opt-in cache of complete replies for repeated deterministic prompts.
+
+Scheduled tasks often send the same prompt to the same model at temperature
+0, which gives the same reply every time. When the cache is enabled,
+:class:`worker.AIWorker` looks the request up before calling Ollama and
+replays a hit through its normal streaming signals.
+
+Entries are keyed on a hash of the model, the messages' roles, content and
+images, the temperature, ``max_tokens`` and the Ollama options. Only
+requests at temperature 0 are cached. Entries expire after a TTL and the
+least recently used are evicted beyond ``max_entries``. The cache is kept in
+``CACHE_FILE`` and written through :mod:`persistence`.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from persistence import write_json, flush
+
+CACHE_FILE = "response_cache.json"
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 500
+
+_lock = threading.Lock()
+_enabled = False
+_ttl = DEFAULT_TTL
+_max_entries = DEFAULT_MAX_ENTRIES
+_entries = None  # key -> {"response", "created"}, least recently used first
+
+
+def configure_cache(enabled=None, ttl=None, max_entries=None, debug_enabled=False):
+    """Turn the cache on or off and set its TTL (seconds) and size."""
+    global _enabled, _ttl, _max_entries
+    with _lock:
+        if enabled is not None:
+            _enabled = bool(enabled)
+        if ttl:
+            _ttl = max(int(ttl), 1)
+        if max_entries:
+            _max_entries = max(int(max_entries), 1)
+        if _entries is not None:
+            _evict(time.time())
+    if debug_enabled:
+        state = "enabled" if _enabled else "disabled"
+        print(f"[Debug] Response cache {state} ({_max_entries} entries, {_ttl}s TTL)")
+
+
+def cache_enabled():
+    return _enabled
+
+
+def cache_key(payload):
+    """Return the cache key for an Ollama chat payload, or None if uncacheable."""
+    if not _enabled or payload.get("temperature") != 0:
+        return None
+    messages = [
+        {
+            "role": m.get("role"),
+            "content": m.get("content"),
+            "images": m.get("images", []),
+        }
+        for m in payload.get("messages", [])
+    ]
+    data = {
+        "model": payload.get("model"),
+        "messages": messages,
+        "temperature": payload.get("temperature"),
+        "max_tokens": payload.get("max_tokens"),
+        "options": payload.get("options", {}),
+    }
+    text = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _load(debug_enabled=False):
+    """Read the cache file once; callers hold ``_lock``."""
+    global _entries
+    if _entries is not None:
+        return _entries
+    _entries = OrderedDict()
+    flush(CACHE_FILE)
+    if os.path.exists(CACHE_FILE):
+        try:
+            with open(CACHE_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for key, entry in sorted(data.items(), key=lambda item: item[1].get("used", 0)):
+                _entries[key] = entry
+            if debug_enabled:
+                print(f"[Debug] Loaded {len(_entries)} cached responses")
+        except Exception as e:
+            print(f"[Error] Failed to load response cache: {e}")
+    return _entries
+
+
+def _evict(now):
+    for key in [k for k, e in _entries.items() if now - e.get("created", 0) > _ttl]:
+        del _entries[key]
+    while len(_entries) > _max_entries:
+        _entries.popitem(last=False)
+
+
+def _save(debug_enabled=False):
+    write_json(CACHE_FILE, dict(_entries), indent=None, debug_enabled=debug_enabled)
+
+
+def get_cached(key, debug_enabled=False):
+    """Return the cached reply for ``key``, or None on a miss."""
+    if key is None:
+        return None
+    with _lock:
+        entries = _load(debug_enabled)
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if now - entry.get("created", 0) > _ttl:
+            del entries[key]
+            _save(debug_enabled)
+            return None
+        entry["used"] = now
+        entries.move_to_end(key)
+        _save(debug_enabled)
+        return entry["response"]
+
+
+def store(key, response, debug_enabled=False):
+    """Cache ``response`` for ``key``."""
+    if key is None or not response:
+        return
+    with _lock:
+        entries = _load(debug_enabled)
+        now = time.time()
+        entries[key] = {"response": response, "created": now, "used": now}
+        entries.move_to_end(key)
+        _evict(now)
+        _save(debug_enabled)
+    if debug_enabled:
+        print(f"[Debug] Cached response {key[:12]}")
+
+
+def clear_cache(debug_enabled=False):
+    """Drop every cached reply."""
+    global _entries
+    with _lock:
+        _entries = OrderedDict()
+        _save(debug_enabled)
+    if debug_enabled:
+        print("[Debug] Response cache cleared")
@@ -0,0 +1,140 @@
+# stream_parser.py
+
+"""Spot protocol messages in a reply while it is still streaming.
+
+Agents ask for tools and tasks with a reply that is a single JSON object
+and nothing else, and a Coordinator hands the turn to a Specialist by
+ending its reply with ``Next Response By: <agent>``. Once either has been
+produced, anything the model generates afterwards is ignored, so
+:class:`AIWorker` feeds each streamed chunk to a :class:`ProtocolScanner`
+and stops reading as soon as the scanner is ``done``. Dropping the
+connection also stops Ollama generating the rest of the reply.
+
+The scanner runs on the inference engine's event loop for every chunk, so
+each chunk is scanned once: it keeps only the JSON object being read, or
+the tail of plain text that could still complete a handoff line.
+"""
+
+import json
+
+HANDOFF_MARKER = "Next Response By:"
+REQUEST_KEYS = ("tool_request", "tool_requests", "task_request")
+
+
+class ProtocolScanner:
+    """Incrementally scans a streamed reply.
+
+    ``request`` is set to the parsed object once a complete JSON reply with
+    a tool or task request has arrived, and ``handoff`` to the agent name
+    once a handoff line to one of ``handoff_targets`` is complete. Either
+    sets ``done`` and ``end``, the length of the reply text that matters;
+    ``length`` is the length of the text fed so far.
+    """
+
+    def __init__(self, handoff_targets=()):
+        self.handoff_targets = [t for t in handoff_targets if t]
+        self.length = 0
+        self.request = None
+        self.handoff = None
+        self.done = False
+        self.end = None
+        self._mode = None  # "json" or "text" once the first character is known
+        self._parts = []  # chunks of the JSON object being read
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._tail = ""  # plain text that may still hold a handoff line
+        self._tail_start = 0  # offset of ``_tail`` in the reply
+
+    def feed(self, chunk):
+        """Add streamed text. Returns True once the rest can be ignored."""
+        if self.done or not chunk:
+            return self.done
+        offset = self.length
+        self.length += len(chunk)
+        if self._mode is None:
+            stripped = chunk.lstrip()
+            if not stripped:
+                return False
+            offset += len(chunk) - len(stripped)
+            chunk = stripped
+            self._mode = "json" if chunk[0] == "{" else "text"
+        if self._mode == "json":
+            chunk, offset = self._scan_json(chunk, offset)
+        if self._mode == "text" and self.handoff_targets and chunk:
+            self._scan_handoff(chunk, offset)
+        return self.done
+
+    def _scan_json(self, chunk, offset):
+        """Scan ``chunk`` of the JSON reply; return any text left over as plain text."""
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._parts.append(chunk[:i + 1])
+                    obj_text = "".join(self._parts)
+                    self._parts = []
+                    self._object_closed(obj_text, offset + i + 1)
+                    if self.done:
+                        return "", offset
+                    # Not a protocol object; the reply continues as plain
+                    # text, which may include the object's own text
+                    return obj_text + chunk[i + 1:], offset + i + 1 - len(obj_text)
+        self._parts.append(chunk)
+        return "", offset
+
+    def _object_closed(self, obj_text, end):
+        try:
+            parsed = json.loads(obj_text)
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict) and any(k in parsed for k in REQUEST_KEYS):
+            self.request = parsed
+            self.end = end
+            self.done = True
+        else:
+            self._mode = "text"
+
+    def _scan_handoff(self, chunk, offset):
+        # The tail always ends where ``chunk`` begins
+        self._tail_start = offset - len(self._tail)
+        self._tail += chunk
+        while True:
+            index = self._tail.find(HANDOFF_MARKER)
+            if index < 0:
+                # Keep only what could be the start of a marker
+                keep = len(HANDOFF_MARKER) - 1
+                if len(self._tail) > keep:
+                    self._tail_start += len(self._tail) - keep
+                    self._tail = self._tail[-keep:]
+                return
+            if index:
+                self._tail_start += index
+                self._tail = self._tail[index:]
+            rest = self._tail[len(HANDOFF_MARKER):].lstrip()
+            line_ended = "\n" in rest
+            name = rest.split("\n", 1)[0].strip()
+            if name in self.handoff_targets:
+                # Without a line break, wait while another target could still match
+                if line_ended or not any(t != name and t.startswith(name) for t in self.handoff_targets):
+                    self.handoff = name
+                    newline = self._tail.find("\n", len(self._tail) - len(rest))
+                    self.end = self._tail_start + (newline if newline >= 0 else len(self._tail))
+                    self.done = True
+                    return
+            if not line_ended and any(t.startswith(name) for t in self.handoff_targets):
+                return  # the name may still be arriving
+            # Not a handoff to a target; look for another marker after it
+            self._tail_start += len(HANDOFF_MARKER)
+            self._tail = self._tail[len(HANDOFF_MARKER):]
@@ -2,7 +2,6 @@
 import os
 import json
 import copy
-import requests
 import tts
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QPushButton,
@@ -11,6 +10,8 @@ from PyQt5.QtWidgets import (
     QListWidget, QListWidgetItem, QMessageBox, QStackedWidget, QTabWidget, QToolButton
 )
 from PyQt5.QtCore import Qt
+from context_builder import DEFAULT_CONTEXT_TOKENS, MIN_CONTEXT_TOKENS
+from ollama_client import get_session
 
 class AgentsTab(QWidget):
     def __init__(self, parent_app):
@@ -193,6 +194,17 @@ class AgentsTab(QWidget):
         self.max_tokens_input.setToolTip("Maximum number of tokens in the response.")
         self.prompt_settings_layout.addRow(self.max_tokens_label, self.max_tokens_input)
 
+        self.context_tokens_label = QLabel("Context Tokens:")
+        self.context_tokens_input = QSpinBox()
+        self.context_tokens_input.setMinimum(MIN_CONTEXT_TOKENS)
+        self.context_tokens_input.setMaximum(262144)
+        self.context_tokens_input.setSingleStep(1024)
+        self.context_tokens_input.setToolTip(
+            "Context window size for this agent's model. Prompts are filled up to"
+            " this many tokens, minus room for the response."
+        )
+        self.prompt_settings_layout.addRow(self.context_tokens_label, self.context_tokens_input)
+
         self.system_prompt_label = QLabel("Custom System Prompt:")
         self.system_prompt_input = QTextEdit()
         self.system_prompt_input.setMinimumHeight(150)
@@ -213,6 +225,24 @@ class AgentsTab(QWidget):
         self.thinking_steps_input.setToolTip("Number of thinking iterations before responding.")
         self.advanced_form.addRow(self.thinking_steps_label, self.thinking_steps_input)
 
+        self.thinking_samples_label = QLabel("Parallel Samples:")
+        self.thinking_samples_input = QSpinBox()
+        self.thinking_samples_input.setMinimum(1)
+        self.thinking_samples_input.setMaximum(8)
+        self.thinking_samples_input.setToolTip(
+            "Think with this many independent samples at once and combine them,"
+            " instead of thinking in steps. 1 thinks in steps."
+        )
+        self.advanced_form.addRow(self.thinking_samples_label, self.thinking_samples_input)
+
+        self.thinking_aggregation_combo = QComboBox()
+        self.thinking_aggregation_combo.addItem("Synthesize", "synthesize")
+        self.thinking_aggregation_combo.addItem("Majority Vote", "vote")
+        self.thinking_aggregation_combo.setToolTip(
+            "How parallel samples are combined into the final answer."
+        )
+        self.advanced_form.addRow("Sample Aggregation:", self.thinking_aggregation_combo)
+
         self.tts_checkbox = QCheckBox("Text-to-Speech Enabled")
         self.tts_checkbox.setToolTip("Speak this agent's replies aloud.")
         self.advanced_form.addRow("", self.tts_checkbox)
@@ -241,6 +271,7 @@ class AgentsTab(QWidget):
         self.model_combo.currentIndexChanged.connect(self.mark_unsaved)
         self.temperature_input.valueChanged.connect(self.mark_unsaved)
         self.max_tokens_input.valueChanged.connect(self.mark_unsaved)
+        self.context_tokens_input.valueChanged.connect(self.mark_unsaved)
         self.system_prompt_input.textChanged.connect(self.mark_unsaved)
         self.enabled_checkbox.stateChanged.connect(self.mark_unsaved)
         self.description_input.textChanged.connect(self.mark_unsaved)
@@ -251,6 +282,8 @@ class AgentsTab(QWidget):
         self.automations_list.itemSelectionChanged.connect(self.mark_unsaved)
         self.thinking_checkbox.stateChanged.connect(self.mark_unsaved)
         self.thinking_steps_input.valueChanged.connect(self.mark_unsaved)
+        self.thinking_samples_input.valueChanged.connect(self.mark_unsaved)
+        self.thinking_aggregation_combo.currentIndexChanged.connect(self.mark_unsaved)
         self.tts_checkbox.stateChanged.connect(self.mark_unsaved)
         self.voice_combo.currentIndexChanged.connect(self.mark_unsaved)
         self.name_input.textChanged.connect(self.mark_unsaved)
@@ -279,6 +312,7 @@ class AgentsTab(QWidget):
         self.model_combo.blockSignals(True)
         self.temperature_input.blockSignals(True)
         self.max_tokens_input.blockSignals(True)
+        self.context_tokens_input.blockSignals(True)
         self.system_prompt_input.blockSignals(True)
         self.enabled_checkbox.blockSignals(True)
         self.description_input.blockSignals(True)
@@ -288,6 +322,8 @@ class AgentsTab(QWidget):
         self.tools_list.blockSignals(True)
         self.thinking_checkbox.blockSignals(True)
         self.thinking_steps_input.blockSignals(True)
+        self.thinking_samples_input.blockSignals(True)
+        self.thinking_aggregation_combo.blockSignals(True)
         self.tts_checkbox.blockSignals(True)
         self.voice_combo.blockSignals(True)
         
@@ -303,6 +339,9 @@ class AgentsTab(QWidget):
             self.model_combo.setCurrentIndex(self.model_combo.count() - 1)
         self.temperature_input.setValue(agent_settings.get("temperature", 0.7))
         self.max_tokens_input.setValue(agent_settings.get("max_tokens", 512))
+        self.context_tokens_input.setValue(
+            agent_settings.get("context_tokens", DEFAULT_CONTEXT_TOKENS)
+        )
         self.system_prompt_input.setText(agent_settings.get("system_prompt", ""))
         self.enabled_checkbox.setChecked(agent_settings.get("enabled", True))
         self.description_input.setText(agent_settings.get("description", ""))
@@ -331,6 +370,11 @@ class AgentsTab(QWidget):
 
         self.thinking_checkbox.setChecked(agent_settings.get("thinking_enabled", False))
         self.thinking_steps_input.setValue(agent_settings.get("thinking_steps", 3))
+        self.thinking_samples_input.setValue(agent_settings.get("thinking_samples", 1))
+        idx = self.thinking_aggregation_combo.findData(
+            agent_settings.get("thinking_aggregation", "synthesize")
+        )
+        self.thinking_aggregation_combo.setCurrentIndex(max(idx, 0))
         self.tts_checkbox.setChecked(agent_settings.get("tts_enabled", False))
         voice_name = agent_settings.get("tts_voice", "")
         if voice_name:
@@ -368,6 +412,7 @@ class AgentsTab(QWidget):
         self.model_combo.blockSignals(False)
         self.temperature_input.blockSignals(False)
         self.max_tokens_input.blockSignals(False)
+        self.context_tokens_input.blockSignals(False)
         self.system_prompt_input.blockSignals(False)
         self.enabled_checkbox.blockSignals(False)
         self.description_input.blockSignals(False)
@@ -378,6 +423,8 @@ class AgentsTab(QWidget):
         self.automations_list.blockSignals(False)
         self.thinking_checkbox.blockSignals(False)
         self.thinking_steps_input.blockSignals(False)
+        self.thinking_samples_input.blockSignals(False)
+        self.thinking_aggregation_combo.blockSignals(False)
         self.tts_checkbox.blockSignals(False)
         self.voice_combo.blockSignals(False)
         
@@ -444,6 +491,7 @@ class AgentsTab(QWidget):
             "model": self.model_combo.currentText(),
             "temperature": self.temperature_input.value(),
             "max_tokens": self.max_tokens_input.value(),
+            "context_tokens": self.context_tokens_input.value(),
             "system_prompt": self.system_prompt_input.toPlainText(),
             "enabled": self.enabled_checkbox.isChecked(),
             "description": self.description_input.text(),
@@ -451,6 +499,8 @@ class AgentsTab(QWidget):
             "tool_use": self.tool_use_checkbox.isChecked(),
             "thinking_enabled": self.thinking_checkbox.isChecked(),
             "thinking_steps": self.thinking_steps_input.value(),
+            "thinking_samples": self.thinking_samples_input.value(),
+            "thinking_aggregation": self.thinking_aggregation_combo.currentData(),
             "tts_enabled": self.tts_checkbox.isChecked(),
             "tts_voice": self.voice_combo.currentText() if self.voice_combo.currentIndex() > 0 else "",
         }
@@ -587,9 +637,10 @@ class AgentsTab(QWidget):
 
     def fetch_available_models(self):
         """Fetch installed Ollama models via the tags API."""
-        url = "http://localhost:11434/api/tags"
+        port = getattr(self.parent_app, "ollama_port", 11434)
+        url = f"http://localhost:{port}/api/tags"
         try:
-            response = requests.get(url, timeout=5)
+            response = get_session().get(url, timeout=5)
             response.raise_for_status()
             data = response.json()
             return [m.get("name") for m in data.get("models", []) if m.get("name")]
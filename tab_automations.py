@@ -37,6 +37,8 @@ from automation_sequences import (
 
 from typing import Union # Added for type hinting
 
+from prompt_cache import invalidate_prompts
+
 class AskAgentDialog(QDialog):
     def __init__(self, agent_name: str, prompt: str, screenshot_path: Union[str, None] = None, parent=None):
         super().__init__(parent)
@@ -853,6 +855,7 @@ class AutomationsTab(QWidget):
             QMessageBox.warning(self, "Error", "Recording failed or pynput not installed.")
             return
         add_automation(self.parent_app.automations, name, events, self.parent_app.debug_enabled)
+        invalidate_prompts(debug_enabled=self.parent_app.debug_enabled)
         self.automations = self.parent_app.automations # This line seems duplicated, already in __init__ and add_automation
         self.refresh_automations_list()
 
@@ -864,6 +867,7 @@ class AutomationsTab(QWidget):
         if QMessageBox.question(self, "Confirm Delete", f"Delete recorded automation '{name}'?", QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
             return
         delete_automation(self.parent_app.automations, name, self.parent_app.debug_enabled)
+        invalidate_prompts(debug_enabled=self.parent_app.debug_enabled)
         # self.automations = self.parent_app.automations # This line seems duplicated
         self.refresh_automations_list()
 
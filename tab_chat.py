@@ -20,10 +20,15 @@ from PyQt5.QtWidgets import (
     QFileDialog, QToolTip
 )
 
+from PyQt5.QtGui import QTextCharFormat, QTextCursor
 from dialogs import SearchDialog, HistorySearchDialog
-from transcripts import load_history
+from transcripts import load_full_history
 import voice_input
 
+# Streaming replies are redrawn at most once per frame (about 30 per second)
+STREAM_FRAME_MS = 33
+
+
 class ChatTab(QWidget):
     """
     Encapsulates the chat UI: display, input, send/clear buttons.
@@ -38,6 +43,14 @@ class ChatTab(QWidget):
         self.last_user_message_id = None
         self.typing_name = "Assistant"
         self.last_date = None
+        # Replies being streamed, keyed by agent name
+        self.streams = {}
+        self.stream_timer = QTimer(self)
+        self.stream_timer.setInterval(STREAM_FRAME_MS)
+        self.stream_timer.timeout.connect(self.flush_streams)
+        # Tool calls still running, keyed by the id begin_tool_block returned
+        self.tool_blocks = {}
+        self.tool_block_counter = 0
 
         self.layout = QVBoxLayout(self)
         self.layout.setContentsMargins(0, 0, 0, 0)
@@ -188,6 +201,14 @@ class ChatTab(QWidget):
         self.send_button.setToolTip("Send the message (Enter)")
         btn_layout.addWidget(self.send_button)
 
+        # Stop button cancels responses that are still streaming
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setObjectName("stopButton")
+        self.stop_button.setEnabled(False)
+        self.stop_button.setIcon(self.style().standardIcon(QStyle.SP_MediaStop))
+        self.stop_button.setToolTip("Stop waiting for agent responses (Esc)")
+        btn_layout.addWidget(self.stop_button)
+
         # Voice input button
         self.voice_button = QPushButton("\U0001F3A4")
         self.voice_button.setObjectName("voiceButton")
@@ -211,6 +232,7 @@ class ChatTab(QWidget):
         self.send_button.clicked.connect(self.on_send_clicked)
         self.clear_chat_button.clicked.connect(self.on_clear_chat_clicked)
         self.voice_button.clicked.connect(self.on_voice_clicked)
+        self.stop_button.clicked.connect(self.on_stop_clicked)
         self.user_input.textChanged.connect(self.adjust_input_height)
         self.user_input.textChanged.connect(self.update_send_button_state)
         search_btn.clicked.connect(self.show_search)
@@ -237,6 +259,9 @@ class ChatTab(QWidget):
                     return True  # Event handled, don't proceed to send
                 self.on_send_clicked()
                 return True
+            if event.key() == QtCore.Qt.Key_Escape and self.stop_button.isEnabled():
+                self.on_stop_clicked()
+                return True
         return super().eventFilter(obj, event)
 
     def update_send_button_state(self):
@@ -282,6 +307,12 @@ class ChatTab(QWidget):
         """
         self.parent_app.clear_chat()
 
+    def on_stop_clicked(self):
+        """
+        Cancel agent responses that are still in progress.
+        """
+        self.parent_app.stop_responses()
+
     def on_voice_clicked(self):
         """Capture voice input and act on commands."""
         text = voice_input.recognize_speech()
@@ -301,12 +332,8 @@ class ChatTab(QWidget):
                 self.user_input.setPlainText(text)
             self.adjust_input_height()
 
-    def append_message_html(self, html_text, from_user=False):
-        """Append a new message with simple avatar styling.
-
-        If ``from_user`` is True a status span will be added and the message id
-        returned so the status can be updated later.
-        """
+    def format_message_html(self, html_text):
+        """Return ``html_text`` styled as a chat bubble if it names a sender."""
         import re
         pattern1 = r'<span style="color:(#[0-9A-Fa-f]{6});">\[([0-9:]+)\]\s*(.+?):</span>\s*(.*)'
         pattern2 = r'\[([0-9:]+)\]\s*<span style=\'color:(#[0-9A-Fa-f]{6});\'>(.+?):</span>\s*(.*)'
@@ -327,12 +354,7 @@ class ChatTab(QWidget):
                 f"<div style='font-size:20px;margin-{'left' if is_user else 'right'}:6px;'>{avatar}</div>"
             )
             msg_time = datetime.now()
-            if self.last_date != msg_time.date():
-                label = self.format_date_label(msg_time.date())
-                self.chat_display.append(
-                    f"<div style='text-align:center;color:gray;margin:4px 0;'>--- {label} ---</div>"
-                )
-                self.last_date = msg_time.date()
+            self.append_date_label(msg_time)
             ts_label, ts_title = self.format_timestamp(msg_time)
             bubble_html = (
                 f"<div style='background-color:{bubble_bg};color:{text_color};padding:6px;border-radius:10px;max-width:80%;'>"
@@ -343,6 +365,25 @@ class ChatTab(QWidget):
             else:
                 html_text = f"<div style='display:flex;justify-content:{align};margin:4px;'>{avatar_html}{bubble_html}</div>"
 
+        return html_text
+
+    def append_date_label(self, msg_time):
+        """Add a date separator when ``msg_time`` starts a new day."""
+        if self.last_date != msg_time.date():
+            label = self.format_date_label(msg_time.date())
+            self.chat_display.append(
+                f"<div style='text-align:center;color:gray;margin:4px 0;'>--- {label} ---</div>"
+            )
+            self.last_date = msg_time.date()
+
+    def append_message_html(self, html_text, from_user=False):
+        """Append a new message with simple avatar styling.
+
+        If ``from_user`` is True a status span will be added and the message id
+        returned so the status can be updated later.
+        """
+        html_text = self.format_message_html(html_text)
+
         msg_id = None
         if from_user:
             self.message_counter += 1
@@ -354,10 +395,140 @@ class ChatTab(QWidget):
         self.chat_display.verticalScrollBar().setValue(self.chat_display.verticalScrollBar().maximum())
         return msg_id
 
+    def append_stream(self, agent_name, chunk, color="#000000", thinking=False):
+        """Show part of a reply that is still streaming.
+
+        The first chunk opens a bubble for ``agent_name``; later chunks are
+        buffered and drawn at most once per ``STREAM_FRAME_MS``. Replies that
+        start with ``{`` are tool or task requests and are not shown.
+        ``thinking`` chunks go to a separate bubble that is removed once the
+        reply is finished.
+        """
+        if thinking:
+            agent_name = f"{agent_name} (thinking)"
+        stream = self.streams.get(agent_name)
+        if stream is None:
+            if not chunk.strip():
+                return
+            hidden = not thinking and chunk.lstrip().startswith("{")
+            stream = self._begin_stream(agent_name, color, hidden)
+        if stream["hidden"]:
+            return
+        stream["pending"].append(chunk)
+        if not self.stream_timer.isActive():
+            # Draw the first chunk right away, then throttle
+            self.flush_streams()
+            self.stream_timer.start()
+
+    def _begin_stream(self, agent_name, color, hidden):
+        stream = {"hidden": hidden, "pending": [], "first": None, "last": None}
+        self.streams[agent_name] = stream
+        if hidden:
+            return stream
+        self.append_date_label(datetime.now())
+        self.chat_display.append(
+            f"<span style='color:{color};'><b>{agent_name}:</b></span> "
+        )
+        # Track the bubble by its first and last text blocks. Block handles
+        # stay valid when other messages are appended after the bubble.
+        block = self.chat_display.document().lastBlock()
+        stream["first"] = stream["last"] = block
+        return stream
+
+    def _stream_cursor(self, stream):
+        """Return a cursor selecting the streamed bubble."""
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(stream["first"].position())
+        last = stream["last"]
+        cursor.setPosition(last.position() + last.length() - 1, QTextCursor.KeepAnchor)
+        return cursor
+
+    def flush_streams(self):
+        """Draw text buffered by :meth:`append_stream`."""
+        drew = False
+        for stream in self.streams.values():
+            if not stream["pending"]:
+                continue
+            text = "".join(stream["pending"])
+            stream["pending"] = []
+            cursor = self._stream_cursor(stream)
+            cursor.clearSelection()
+            cursor.setCharFormat(QTextCharFormat())
+            cursor.insertText(text)
+            stream["last"] = cursor.block()
+            drew = True
+        if drew:
+            bar = self.chat_display.verticalScrollBar()
+            bar.setValue(bar.maximum())
+        else:
+            self.stream_timer.stop()
+
+    def finish_stream(self, agent_name, html_text):
+        """Replace the streamed bubble for ``agent_name`` with the final message.
+
+        If nothing was streamed the message is appended as usual.
+        """
+        self.discard_stream(f"{agent_name} (thinking)")
+        stream = self.streams.pop(agent_name, None)
+        if stream is None or stream["hidden"]:
+            self.append_message_html(html_text)
+            return
+        cursor = self._stream_cursor(stream)
+        cursor.removeSelectedText()
+        cursor.insertHtml(self.format_message_html(html_text))
+
+    def discard_stream(self, agent_name):
+        """Remove a streamed bubble that will not be finalized."""
+        if not agent_name.endswith(" (thinking)"):
+            self.discard_stream(f"{agent_name} (thinking)")
+        stream = self.streams.pop(agent_name, None)
+        if stream and not stream["hidden"]:
+            cursor = self._stream_cursor(stream)
+            end = cursor.position()
+            # Take the line break before the bubble with it
+            cursor.setPosition(max(cursor.anchor() - 1, 0))
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+
+    def reset_streams(self):
+        """Forget streamed bubbles, e.g. after the display was cleared."""
+        self.streams.clear()
+        self.tool_blocks.clear()
+        self.stream_timer.stop()
+
+    def begin_tool_block(self, html_text):
+        """Show a tool call that is still running and return its block id.
+
+        :meth:`finish_tool_block` later replaces it with the call's result.
+        """
+        html_text = self.format_message_html(html_text)
+        before = self.chat_display.document().lastBlock()
+        self.chat_display.append(html_text)
+        self.chat_display.verticalScrollBar().setValue(self.chat_display.verticalScrollBar().maximum())
+        self.tool_block_counter += 1
+        block_id = self.tool_block_counter
+        self.tool_blocks[block_id] = {
+            "first": before.next(),
+            "last": self.chat_display.document().lastBlock(),
+        }
+        return block_id
+
+    def finish_tool_block(self, block_id, html_text):
+        """Replace the running tool block ``block_id`` with ``html_text``.
+
+        If the block is gone, e.g. the chat was cleared, the message is
+        appended instead.
+        """
+        block = self.tool_blocks.pop(block_id, None)
+        if block is None:
+            self.append_message_html(html_text)
+            return
+        cursor = self._stream_cursor(block)
+        cursor.removeSelectedText()
+        cursor.insertHtml(self.format_message_html(html_text))
+
     def update_message_status(self, message_id, status):
         """Update the status icon for a message."""
-        import re
-
         icons = {
             "sending": "\u23F3",  # hourglass not done
             "sent": "\u2713",
@@ -372,12 +543,24 @@ class ChatTab(QWidget):
             "read": "Read by all recipients",
             "failed": "Failed to send",
         }
-        html = self.chat_display.toHtml()
-        pattern = rf"<a name=\"{message_id}\"></a>[^<]*"
-        replacement = f"<a name=\"{message_id}\"></a>{icons.get(status, '')}"
-        new_html, count = re.subn(pattern, replacement, html)
-        if count:
-            self.chat_display.setHtml(new_html)
+        # Edit the status icon in place. Rebuilding the whole document with
+        # setHtml would be slow and would break replies being streamed.
+        doc = self.chat_display.document()
+        block = doc.lastBlock()
+        while block.isValid():
+            it = block.begin()
+            while not it.atEnd():
+                fragment = it.fragment()
+                if message_id in fragment.charFormat().anchorNames():
+                    cursor = QTextCursor(doc)
+                    cursor.setPosition(fragment.position())
+                    cursor.setPosition(
+                        block.position() + block.length() - 1, QTextCursor.KeepAnchor
+                    )
+                    cursor.insertHtml(f"<a name=\"{message_id}\"></a>{icons.get(status, '')}")
+                    return
+                it += 1
+            block = block.previous()
     
     def show_search(self):
         """Display a dialog to search conversation history."""
@@ -390,11 +573,12 @@ class ChatTab(QWidget):
 
     def show_history_search(self):
         """Display a dialog to search persisted chat history."""
-        history = load_history()
+        history = load_full_history()
         if not history:
             self.parent_app.show_notification("No stored history", "info")
             return
-        dialog = HistorySearchDialog(self, history)
+        agents = list(getattr(self.parent_app, "agents_data", {}).keys())
+        dialog = HistorySearchDialog(self, history, agents)
         dialog.exec_()
     
     def copy_conversation(self):
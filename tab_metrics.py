@@ -1,5 +1,8 @@
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QWidget, QVBoxLayout, QLabel
-from metrics import average_response_time
+from metrics import average_response_time, average_queue_wait
+from inference_engine import dispatch_stats
+from resilience import breaker_states, OPEN
 
 
 class MetricsTab(QWidget):
@@ -15,13 +18,33 @@ class MetricsTab(QWidget):
         self.tool_usage_label = QLabel()
         self.task_completion_label = QLabel()
         self.response_time_label = QLabel()
+        self.queue_label = QLabel()
+        self.cache_label = QLabel()
+        self.breaker_label = QLabel()
 
         self.layout.addWidget(self.tool_usage_label)
         self.layout.addWidget(self.task_completion_label)
         self.layout.addWidget(self.response_time_label)
+        self.layout.addWidget(self.queue_label)
+        self.layout.addWidget(self.cache_label)
+        self.layout.addWidget(self.breaker_label)
+
+        # Queue depth and endpoint health change between responses, so poll
+        # them while visible
+        self.queue_timer = QTimer(self)
+        self.queue_timer.setInterval(1000)
+        self.queue_timer.timeout.connect(self.refresh_queue)
 
         self.refresh_metrics()
 
+    def showEvent(self, event):
+        self.queue_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.queue_timer.stop()
+        super().hideEvent(event)
+
     def refresh_metrics(self):
         metrics = self.parent_app.metrics
 
@@ -46,3 +69,37 @@ class MetricsTab(QWidget):
         if len(resp_lines) == 1:
             resp_lines.append("None recorded")
         self.response_time_label.setText("\n".join(resp_lines))
+
+        cache_lines = ["Response Cache:"]
+        for agent, entry in metrics.get("response_cache", {}).items():
+            cache_lines.append(f"- {agent}: {entry['hits']} hits, {entry['misses']} misses")
+        if len(cache_lines) == 1:
+            cache_lines.append("None recorded")
+        self.cache_label.setText("\n".join(cache_lines))
+
+        self.refresh_queue()
+
+    def refresh_queue(self):
+        metrics = self.parent_app.metrics
+        stats = dispatch_stats()
+        queue_lines = [
+            "Request Queue:",
+            f"- Running: {stats['running']}, queued: {stats['queued']}",
+            f"- Wait this session: {stats['average_wait']:.2f}s average, {stats['max_wait']:.2f}s max",
+        ]
+        for agent in metrics.get("queue_waits", {}).keys():
+            avg = average_queue_wait(metrics, agent)
+            queue_lines.append(f"- {agent}: {avg:.2f}s average wait")
+        self.queue_label.setText("\n".join(queue_lines))
+
+        breaker_lines = ["Ollama Endpoints:"]
+        for endpoint, (state, failures, retry_in) in breaker_states().items():
+            line = f"- {endpoint}: {state}"
+            if state == OPEN:
+                line += f", next try in {retry_in:.0f}s"
+            if failures:
+                line += f" ({failures} failures in a row)"
+            breaker_lines.append(line)
+        if len(breaker_lines) == 1:
+            breaker_lines.append("No requests yet")
+        self.breaker_label.setText("\n".join(breaker_lines))
@@ -10,6 +10,7 @@ from tools import (
     set_plugin_enabled,
 )
 import tools
+from prompt_cache import invalidate_prompts
 
 
 class PluginsTab(QWidget):
@@ -54,6 +55,7 @@ class PluginsTab(QWidget):
         self.plugins_list.blockSignals(False)
         # Update loaded tools without triggering notifications
         self.parent_app.tools = tools.load_tools(self.parent_app.debug_enabled)
+        invalidate_prompts(debug_enabled=self.parent_app.debug_enabled)
         if hasattr(self.parent_app.tools_tab, "refresh_tools_list"):
             self.parent_app.tools_tab.tools = self.parent_app.tools
             self.parent_app.tools_tab.refresh_tools_list()
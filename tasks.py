@@ -7,6 +7,7 @@ import sys
 import platform
 import subprocess
 from datetime import datetime
+from persistence import write_json, flush
 
 TASKS_FILE = "tasks.json"
 TEMPLATES_FILE = "task_templates.json"
@@ -112,6 +113,7 @@ def _remove_os_task(task_id, debug_enabled=False):
                 print(f"[Debug] Failed to remove cron job: {e}")
 
 def load_tasks(debug_enabled=False):
+    flush(TASKS_FILE)
     if not os.path.exists(TASKS_FILE):
         return []
     try:
@@ -130,17 +132,14 @@ def load_tasks(debug_enabled=False):
         return []
 
 def save_tasks(tasks, debug_enabled=False):
-    try:
-        with open(TASKS_FILE, "w", encoding="utf-8") as f:
-            json.dump(tasks, f, indent=2)
-        if debug_enabled:
-            print("[Debug] Tasks saved.")
-    except Exception as e:
-        print(f"[Error] Failed to save tasks: {e}")
+    write_json(TASKS_FILE, tasks, debug_enabled=debug_enabled)
+    if debug_enabled:
+        print("[Debug] Tasks save queued.")
 
 
 def load_task_templates(debug_enabled=False):
     """Return a list of saved task templates."""
+    flush(TEMPLATES_FILE)
     if not os.path.exists(TEMPLATES_FILE):
         return []
     try:
@@ -156,13 +155,9 @@ def load_task_templates(debug_enabled=False):
 
 def save_task_templates(templates, debug_enabled=False):
     """Persist task templates to disk."""
-    try:
-        with open(TEMPLATES_FILE, "w", encoding="utf-8") as f:
-            json.dump(templates, f, indent=2)
-        if debug_enabled:
-            print("[Debug] Task templates saved.")
-    except Exception as e:
-        print(f"[Error] Failed to save task templates: {e}")
+    write_json(TEMPLATES_FILE, templates, debug_enabled=debug_enabled)
+    if debug_enabled:
+        print("[Debug] Task templates save queued.")
 
 
 def add_task_template(
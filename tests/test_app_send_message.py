@@ -29,6 +29,9 @@ class TestAppSendMessage(unittest.TestCase):
             thread.quit()
             thread.wait()
         self.app.active_worker_threads.clear()
+        for request in self.app.active_requests.values():
+            request.cancel()
+        self.app.active_requests.clear()
         del self.app
 
     @patch('app.AIWorker')
@@ -97,6 +100,9 @@ class TestAppSendMessage(unittest.TestCase):
             thread.quit()
             thread.wait()
         self.app.active_worker_threads.clear()
+        for request in self.app.active_requests.values():
+            request.cancel()
+        self.app.active_requests.clear()
         del self.app
 
     @patch('app.AIWorker')
@@ -228,5 +234,56 @@ class TestAppSendMessage(unittest.TestCase):
         self.app.chat_tab.send_button.setEnabled.assert_any_call(False)
         self.app.chat_tab.send_button.setEnabled.assert_any_call(True)
 
+    @patch('app.submit_request')
+    @patch('app.AIWorker')
+    @patch('app.QMessageBox')
+    def test_parallel_dispatch_starts_all_assistants(self, mock_qmessagebox, mock_aiworker_class, mock_submit):
+        mock_aiworker_class.side_effect = aiworker_side_effect_func
+        self.app.parallel_dispatch = True
+        self.app.agents_data = {
+            "A1": {"enabled": True, "role": "Assistant", "model": "m1"},
+            "A2": {"enabled": True, "role": "Assistant", "model": "m2"},
+            "A3": {"enabled": True, "role": "Assistant", "model": "m3"},
+        }
+        finished = []
+        self.app.worker_finished_sequential = MagicMock(
+            side_effect=lambda w, r, name, index, next_agent, order=None: finished.append((name, index, order))
+        )
+
+        self.app.send_message("Everyone at once")
+
+        # All three requests were submitted before any reply arrived
+        self.assertEqual(mock_submit.call_count, 3)
+        workers = [call[0][0] for call in mock_submit.call_args_list]
+        callbacks = [w.finished.connect.call_args[0][0] for w in workers]
+
+        # Replies finish out of order
+        callbacks[2]()
+        callbacks[0]()
+        self.app.chat_tab.send_button.setEnabled.assert_called_with(False)
+        callbacks[1]()
+
+        self.assertEqual([f[0] for f in finished], ["A3", "A1", "A2"])
+        self.assertEqual([f[2]["position"] for f in finished], [3, 1, 2])
+        self.assertEqual([f[2]["finished"] for f in finished], [1, 2, 3])
+        self.assertTrue(all(f[1] is None for f in finished))
+        self.app.chat_tab.send_button.setEnabled.assert_called_with(True)
+
+    @patch('app.submit_request')
+    @patch('app.AIWorker')
+    @patch('app.QMessageBox')
+    def test_sequential_dispatch_waits_for_each_agent(self, mock_qmessagebox, mock_aiworker_class, mock_submit):
+        mock_aiworker_class.side_effect = aiworker_side_effect_func
+        self.app.parallel_dispatch = False
+        self.app.agents_data = {
+            "A1": {"enabled": True, "role": "Assistant", "model": "m1"},
+            "A2": {"enabled": True, "role": "Assistant", "model": "m2"},
+        }
+
+        self.app.send_message("One after another")
+
+        self.assertEqual(mock_submit.call_count, 1)
+
+
 if __name__ == "__main__":
     unittest.main()
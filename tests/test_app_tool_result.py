@@ -2,12 +2,8 @@ import types
 import app
 import tts
 
-class DummyThread:
-    def quit(self):
-        pass
-    def wait(self):
-        pass
-    def deleteLater(self):
+class DummyRequest:
+    def cancel(self):
         pass
 
 class DummyWorker:
@@ -32,7 +28,14 @@ def test_worker_finished_sends_result_back(monkeypatch):
             'color': '#000'
         }
     }
-    dummy.chat_tab = types.SimpleNamespace(append_message_html=lambda *a, **k: None)
+    dummy.chat_tab = types.SimpleNamespace(
+        append_message_html=lambda *a, **k: None,
+        finish_stream=lambda *a, **k: None,
+        discard_stream=lambda *a, **k: None,
+        begin_tool_block=lambda *a, **k: 1,
+        finish_tool_block=lambda *a, **k: None,
+        stop_button=types.SimpleNamespace(setEnabled=lambda enabled: None),
+    )
     dummy.tools = [{'name': 'echo-plugin', 'description': 'Echo', 'args': []}]
     dummy.metrics = {}
     dummy.refresh_metrics_display = lambda: None
@@ -43,18 +46,22 @@ def test_worker_finished_sends_result_back(monkeypatch):
         sent['msg'] = msg
     dummy.send_message_to_agent = fake_send
     dummy.response_start_times = {}
-    dummy.active_worker_threads = []
-    thread = DummyThread()
+    dummy.active_requests = {}
+    request = DummyRequest()
     worker = DummyWorker()
-    dummy.active_worker_threads.append((worker, thread))
+    dummy.active_requests[worker] = request
     dummy.response_start_times[worker] = 0
 
-    monkeypatch.setattr(app, 'run_tool', lambda *a, **k: 'ok')
+    def run_now(tools, calls, on_result, on_done, debug_enabled=False):
+        on_result(0, 'ok')
+        on_done(['ok'])
+
+    monkeypatch.setattr(app, 'run_tools_async', run_now)
     monkeypatch.setattr(app, 'append_message', lambda *a, **k: None)
     monkeypatch.setattr(app, 'record_tool_usage', lambda *a, **k: None)
     monkeypatch.setattr(tts, 'speak_text', lambda *a, **k: None)
 
-    app.AIChatApp.worker_finished_sequential(dummy, worker, thread, 'agent1', None, None)
+    app.AIChatApp.worker_finished_sequential(dummy, worker, request, 'agent1', None, None)
 
     assert sent['agent'] == 'agent1'
     assert sent['msg'] == 'ok'
@@ -84,13 +84,11 @@ class TestStepBasedHelperFunctions(unittest.TestCase):
 
 
 class TestStepBasedSaveLoad(unittest.TestCase):
-    @patch("builtins.open", new_callable=mock_open)
-    @patch("json.dump")
-    def test_save_step_automations(self, mock_json_dump, mock_file_open):
+    @patch("automation_sequences.write_json")
+    def test_save_step_automations(self, mock_write_json):
         automations = [{"name": "TestAuto", "steps": [{"type": "Wait", "params": {"duration": 1}}]}]
         save_step_automations(automations, debug_enabled=False)
-        mock_file_open.assert_called_once_with(STEP_AUTOMATIONS_FILE, "w", encoding="utf-8")
-        mock_json_dump.assert_called_once_with(automations, mock_file_open(), indent=2)
+        mock_write_json.assert_called_once_with(STEP_AUTOMATIONS_FILE, automations, debug_enabled=False)
 
     @patch("os.path.exists", return_value=True)
     @patch("builtins.open", new_callable=mock_open, read_data='[{"name": "LoadedAuto"}]')
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import socket
+import time
+
+from PyQt5.QtWidgets import QApplication
+
+import backends
+import inference_engine
+import worker
+from fake_ollama import FakeOllama, start_fake_server
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def _unused_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{s.getsockname()[1]}"
+
+
+def _serve(engine, *fakes):
+    async def start():
+        return [await start_fake_server(fake) for fake in fakes]
+    return asyncio.run_coroutine_threadsafe(start(), engine.loop).result(5)
+
+
+def _stop(engine, servers):
+    async def stop():
+        for runner, _ in servers:
+            await runner.cleanup()
+    asyncio.run_coroutine_threadsafe(stop(), engine.loop).result(5)
+    engine.shutdown()
+
+
+def test_select_prefers_least_loaded_healthy_host(monkeypatch):
+    monkeypatch.setattr(backends, "_backends", [])
+    backends.configure_backends([
+        {"url": "http://a:1", "models": ["llama3"]},
+        {"url": "http://b:1"},
+        {"url": "http://c:1", "models": ["phi4"]},
+    ])
+    a, b, c = backends.get_backends()
+    backends.acquire(b)
+    assert backends.select_backend("llama3:latest") is a
+    backends.acquire(a)
+    backends.acquire(a)
+    assert backends.select_backend("llama3") is b
+    assert backends.select_backend("phi4") is c
+    backends.mark_failed(c)
+    assert backends.select_backend("phi4") is b
+    backends.mark_failed(b)
+    assert backends.select_backend("llama3") is a
+    assert backends.select_backend("llama3", exclude=[a, b]) is c
+    assert backends.select_backend("llama3", exclude=[a, b, c]) is None
+
+
+def test_probe_marks_health_and_learns_models(monkeypatch):
+    engine = inference_engine.InferenceEngine()
+    servers = _serve(engine, FakeOllama(["llama3", "phi4"]))
+    try:
+        dead = _unused_url()
+        monkeypatch.setattr(backends, "_backends", [])
+        backends.configure_backends([servers[0][1], dead])
+        backends.probe_backends()
+        live, down = backends.get_backends()
+        assert live.healthy and live.discovered == ["llama3", "phi4"]
+        assert not down.healthy
+        assert not live.serves("mistral") and live.serves("phi4")
+    finally:
+        _stop(engine, servers)
+
+
+def test_worker_fails_over_to_next_host(monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine()
+    fake = FakeOllama(["m"], reply="from live host")
+    servers = _serve(engine, fake)
+    try:
+        monkeypatch.setattr(backends, "_backends", [])
+        backends.configure_backends([_unused_url(), servers[0][1]])
+        down, live = backends.get_backends()
+
+        def ask():
+            w = worker.AIWorker("m", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                                False, "a", {"a": {}})
+            chunks = []
+            finished = []
+            w.response_received.connect(lambda chunk, name: chunks.append(chunk))
+            w.finished.connect(lambda: finished.append(True))
+            engine.submit(w)
+            deadline = time.time() + 5
+            while not finished and time.time() < deadline:
+                app.processEvents()
+                time.sleep(0.01)
+            return "".join(chunks).strip()
+
+        assert ask() == "from live host"
+        assert not down.healthy and live.healthy
+        assert down.inflight == live.inflight == 0
+        assert len(fake.requests) == 1
+
+        # Later requests skip the host that is down
+        failed = []
+        monkeypatch.setattr(worker, "mark_failed", lambda backend, debug=False: failed.append(backend))
+        assert ask() == "from live host"
+        assert len(fake.requests) == 2 and failed == []
+    finally:
+        _stop(engine, servers)
+
+
+def test_cancelled_requests_release_their_host(monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine()
+    fake = FakeOllama(["m"], delay=5)
+    servers = _serve(engine, fake)
+    try:
+        monkeypatch.setattr(backends, "_backends", [])
+        backends.configure_backends([servers[0][1]])
+        agents = {"a": {"thinking_enabled": True, "thinking_samples": 2}}
+        w = worker.AIWorker("m", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                            False, "a", agents)
+        finished = []
+        w.finished.connect(lambda: finished.append(True))
+        # Times out while both samples wait for Ollama
+        engine.submit(w, timeout=0.3)
+        deadline = time.time() + 5
+        while not finished and time.time() < deadline:
+            app.processEvents()
+            time.sleep(0.01)
+        assert finished and len(fake.requests) == 2
+        assert backends.get_backends()[0].inflight == 0
+    finally:
+        _stop(engine, servers)
@@ -0,0 +1,65 @@
+import context_builder
+
+
+def test_estimate_tokens_is_cached(monkeypatch):
+    text = "Hello, world! An extraordinarily long word."
+    count = context_builder.estimate_tokens(text)
+    assert count > len(text.split())
+
+    def fail(text):
+        raise AssertionError("should use the cache")
+
+    monkeypatch.setattr(context_builder, "_count_tokens", fail)
+    assert context_builder.estimate_tokens(text) == count
+    assert context_builder.estimate_tokens("") == 0
+
+
+def test_truncate_to_tokens():
+    text = "word " * 1000
+    truncated = context_builder.truncate_to_tokens(text, 50)
+    assert truncated.endswith(context_builder.TRUNCATION_NOTE)
+    assert context_builder.estimate_tokens(truncated) <= 50
+    assert context_builder.truncate_to_tokens("short", 50) == "short"
+
+
+def test_context_budget_reserves_response():
+    assert context_builder.context_budget({}) == (4096, 4096 - 512)
+    assert context_builder.context_budget({"context_tokens": 8192, "max_tokens": 1024}) == (8192, 7168)
+    assert context_builder.context_budget({"context_tokens": 1024, "max_tokens": 4000}) == (1024, 512)
+
+
+def test_build_context_keeps_priority_messages():
+    messages = [{"role": "user", "content": f"old message {i}"} for i in range(50)]
+    messages.append({"role": "assistant", "content": "result " * 2000, "agent": "a", "tool": "web"})
+    messages.append({"role": "user", "content": "latest question"})
+    pinned = context_builder.priority_indexes(messages)
+    assert pinned == {50, 51}
+
+    context = context_builder.build_context("system", messages, 400, pinned)
+    assert context[0] == {"role": "system", "content": "system"}
+    assert context[-1]["content"] == "latest question"
+    tool_msg = next(m for m in context if m.get("tool"))
+    assert tool_msg["content"].endswith(context_builder.TRUNCATION_NOTE)
+    assert sum(context_builder.message_tokens(m) for m in context) <= 400
+    # Older messages fill what is left, newest first and without gaps.
+    kept = [m["content"] for m in context if m["content"].startswith("old message")]
+    assert kept and kept[-1] == "old message 49"
+    assert len(kept) < 50
+
+
+def test_build_context_summarizes_dropped_messages():
+    messages = [{"role": "user", "content": f"message number {i}"} for i in range(100)]
+    calls = []
+
+    def summarize(first_index):
+        calls.append(first_index)
+        return {"role": "system", "content": f"Summary of {first_index} messages"}
+
+    context = context_builder.build_context("sys", messages, 200, summarize=summarize)
+    assert context[1]["content"] == f"Summary of {calls[-1]} messages"
+    assert context[2] == messages[calls[-1]]
+    assert sum(context_builder.message_tokens(m) for m in context) <= 200
+
+    short = context_builder.build_context("sys", messages[:3], 200, summarize=summarize)
+    assert len(calls) == 2
+    assert short[1:] == messages[:3]
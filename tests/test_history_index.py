@@ -0,0 +1,123 @@
+import sqlite3
+
+import history_index
+import transcripts
+
+
+def make_history():
+    return [
+        {"role": "user", "content": "hello there", "timestamp": "2024-05-20T10:00:00"},
+        {"role": "assistant", "content": "Hi user, hello!", "agent": "agent1", "timestamp": "2024-05-20T10:01:00"},
+        {"role": "assistant", "content": "unrelated", "agent": "agent2", "timestamp": "2024-05-20T10:02:00"},
+        {"role": "assistant", "content": "hello from agent2", "agent": "agent2", "timestamp": "2024-05-20T10:03:00"},
+    ]
+
+
+def use_tmp_index(monkeypatch, tmp_path):
+    monkeypatch.setattr(history_index, "INDEX_FILE", str(tmp_path / "chat_history.db"))
+    history_index.close_index()
+
+
+def test_search_filters_by_role_and_agent(monkeypatch, tmp_path):
+    use_tmp_index(monkeypatch, tmp_path)
+    history = make_history()
+
+    assert len(history_index.search(history, "hello")) == 3
+    assert history_index.search(history, "HELLO", role="user") == [history[0]]
+    assert history_index.search(history, "hello", agent="agent2") == [history[3]]
+    assert history_index.search(history, "missing") == []
+    assert history_index.search(history, "") == []
+    history_index.close_index()
+
+
+def test_search_short_query_and_pagination(monkeypatch, tmp_path):
+    use_tmp_index(monkeypatch, tmp_path)
+    history = make_history()
+
+    assert history_index.search(history, "hi") == [history[1]]
+    first = history_index.search(history, "hello", limit=2)
+    second = history_index.search(history, "hello", limit=2, offset=2)
+    assert len(first) == 2 and len(second) == 1
+    assert {id(m) for m in first + second} == {id(history[0]), id(history[1]), id(history[3])}
+    history_index.close_index()
+
+
+def test_sync_index_is_incremental_and_rebuilds(monkeypatch, tmp_path):
+    use_tmp_index(monkeypatch, tmp_path)
+    history = make_history()
+    history_index.search(history, "hello")
+
+    history.append({"role": "user", "content": "new hello", "timestamp": "2024-05-20T10:04:00"})
+    assert history[-1] in history_index.search(history, "new hello")
+
+    # A cleared and rewritten history no longer matches the indexed rows.
+    rewritten = [{"role": "user", "content": "fresh start", "timestamp": "2024-05-21T09:00:00"}]
+    assert history_index.search(rewritten, "hello") == []
+    assert history_index.search(rewritten, "fresh") == [rewritten[0]]
+    conn = sqlite3.connect(str(tmp_path / "chat_history.db"))
+    assert conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 1
+    conn.close()
+    history_index.close_index()
+
+
+def test_sync_index_rebuilds_after_earlier_edit(monkeypatch, tmp_path):
+    use_tmp_index(monkeypatch, tmp_path)
+    monkeypatch.setattr(transcripts, "HISTORY_FILE", str(tmp_path / "chat_history.json"))
+    monkeypatch.setattr(transcripts, "JOURNAL_FILE", str(tmp_path / "chat_history.jsonl"))
+    history = make_history()
+    history_index.search(history, "hello")
+
+    # The last message is unchanged, but an earlier one was rewritten...
+    history[1] = dict(history[1], content="Hi user, goodbye!")
+    transcripts.save_history(history)
+    assert history_index.search(history, "goodbye") == [history[1]]
+    assert history[1] not in history_index.search(history, "hello")
+
+    # ...or removed, with a new message appended to keep the count.
+    del history[2]
+    history.append({"role": "user", "content": "late hello", "timestamp": "2024-05-20T10:05:00"})
+    transcripts.save_history(history)
+    assert history_index.search(history, "unrelated") == []
+    assert history_index.search(history, "late hello") == [history[-1]]
+    history_index.close_index()
+
+
+def test_sync_index_checksums_only_appended_rows(monkeypatch, tmp_path):
+    use_tmp_index(monkeypatch, tmp_path)
+    history = make_history()
+    history_index.search(history, "hello")
+    checked = []
+    checksum = history_index._checksum
+    monkeypatch.setattr(
+        history_index, "_checksum",
+        lambda history, start, end, crc=0: checked.append((start, end)) or checksum(history, start, end, crc),
+    )
+
+    history.append({"role": "user", "content": "new hello", "timestamp": "2024-05-20T10:04:00"})
+    history_index.search(history, "hello")
+    history_index.search(history, "hello there")
+    assert checked == [(4, 5)]
+
+    # Reopening the index checks every row against the history once
+    history_index.close_index()
+    history_index.search(history, "hello")
+    assert checked[1:] == [(0, 5)]
+    history_index.close_index()
+
+
+def test_search_falls_back_without_index(monkeypatch, tmp_path):
+    use_tmp_index(monkeypatch, tmp_path)
+    history = make_history()
+
+    def broken(history, debug_enabled=False):
+        raise sqlite3.OperationalError("no such module: fts5")
+
+    monkeypatch.setattr(history_index, "sync_index", broken)
+    assert history_index.search(history, "hello", agent="agent1") == [history[1]]
+
+
+def test_clear_index_removes_file(monkeypatch, tmp_path):
+    use_tmp_index(monkeypatch, tmp_path)
+    history_index.search(make_history(), "hello")
+    history_index.clear_index()
+    assert not (tmp_path / "chat_history.db").exists()
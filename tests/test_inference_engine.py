@@ -0,0 +1,221 @@
+import asyncio
+import json
+import os
+import time
+
+from aiohttp import web
+from PyQt5.QtWidgets import QApplication
+
+import inference_engine
+import worker
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+async def _chat(request):
+    resp = web.StreamResponse()
+    await resp.prepare(request)
+    for chunk in ("Hel", "lo"):
+        line = json.dumps({"message": {"content": chunk}}) + "\n"
+        await resp.write(line.encode())
+    await resp.write(b'{"done": true}\n')
+    return resp
+
+
+_concurrency = {"current": 0, "peak": 0}
+_started_models = []
+
+
+async def _busy(request):
+    _started_models.append((await request.json())["model"])
+    _concurrency["current"] += 1
+    _concurrency["peak"] = max(_concurrency["peak"], _concurrency["current"])
+    await asyncio.sleep(0.1)
+    _concurrency["current"] -= 1
+    return web.Response(text='{"message": {"content": "ok"}}\n{"done": true}\n')
+
+
+async def _slow(request):
+    await asyncio.sleep(30)
+    return web.Response(text="")
+
+
+def _start_server(engine):
+    async def start():
+        app = web.Application()
+        app.router.add_post("/api/chat", _chat)
+        app.router.add_post("/slow", _slow)
+        app.router.add_post("/busy", _busy)
+        runner = web.AppRunner(app, shutdown_timeout=0.1)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}"
+
+    return asyncio.run_coroutine_threadsafe(start(), engine.loop).result(5)
+
+
+def _make_worker(url, model="model"):
+    w = worker.AIWorker(model, [{"role": "user", "content": "Hi"}], 0.7, 10,
+                        False, "a", {"a": {}}, url)
+    events = {"chunks": [], "errors": [], "finished": 0}
+    w.response_received.connect(lambda chunk, name: events["chunks"].append(chunk))
+    w.error_occurred.connect(events["errors"].append)
+    w.finished.connect(lambda: events.__setitem__("finished", events["finished"] + 1))
+    return w, events
+
+
+def _wait_finished(app, events):
+    deadline = time.time() + 5
+    while not events["finished"] and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_engine_streams_chunks_to_qt():
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine()
+    runner, base = _start_server(engine)
+    try:
+        w, events = _make_worker(f"{base}/api/chat")
+        request = engine.submit(w)
+        _wait_finished(app, events)
+        assert request.done()
+        assert "".join(events["chunks"]) == "Hello"
+        assert events["errors"] == []
+        assert events["finished"] == 1
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_engine_times_out_requests():
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine()
+    runner, base = _start_server(engine)
+    try:
+        w, events = _make_worker(f"{base}/slow")
+        engine.submit(w, timeout=0.2)
+        _wait_finished(app, events)
+        assert events["finished"] == 1
+        assert "timed out" in events["errors"][0]
+        assert not w.cancelled
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_engine_cancels_requests():
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine()
+    runner, base = _start_server(engine)
+    try:
+        w, events = _make_worker(f"{base}/slow")
+        request = engine.submit(w)
+        time.sleep(0.1)
+        assert request.cancel()
+        _wait_finished(app, events)
+        assert events["finished"] == 1
+        assert events["errors"] == []
+        assert w.cancelled
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_dispatcher_caps_concurrency_per_model():
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine(max_requests=4, model_concurrency=2)
+    runner, base = _start_server(engine)
+    _concurrency.update(current=0, peak=0)
+    try:
+        started = [_make_worker(f"{base}/busy") for _ in range(5)]
+        for w, _ in started:
+            engine.submit(w)
+        for _, events in started:
+            _wait_finished(app, events)
+        assert all(events["finished"] == 1 for _, events in started)
+        assert _concurrency["peak"] == 2
+        waits = [w.queue_wait for w, _ in started]
+        assert all(wait < 0.05 for wait in waits[:2])
+        assert all(wait > 0.05 for wait in waits[2:])
+        stats = engine.stats()
+        assert stats["running"] == 0 and stats["queued"] == 0
+        assert stats["max_wait"] >= max(waits) > 0
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_cancel_removes_queued_request():
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine(max_requests=1)
+    runner, base = _start_server(engine)
+    try:
+        first, first_events = _make_worker(f"{base}/slow")
+        queued, queued_events = _make_worker(f"{base}/busy")
+        first_request = engine.submit(first)
+        queued_request = engine.submit(queued)
+        time.sleep(0.1)
+        assert engine.stats()["queued"] == 1
+        queued_request.cancel()
+        _wait_finished(app, queued_events)
+        assert queued.cancelled
+        assert engine.stats()["queued"] == 0
+        first_request.cancel()
+        _wait_finished(app, first_events)
+        assert engine.stats()["running"] == 0
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def _run_after_blocker(engine, base, submissions, delay=0.0):
+    """Hold the only slot, queue ``submissions`` and return their start order."""
+    app = QApplication.instance() or QApplication([])
+    _started_models.clear()
+    blocker, blocker_events = _make_worker(f"{base}/slow")
+    blocker_request = engine.submit(blocker)
+    queued = []
+    for model, priority in submissions:
+        w, events = _make_worker(f"{base}/busy", model)
+        engine.submit(w, priority=priority)
+        queued.append(events)
+        time.sleep(delay)
+    time.sleep(0.1)
+    blocker_request.cancel()
+    for events in [blocker_events] + queued:
+        _wait_finished(app, events)
+    return list(_started_models)
+
+
+def test_interactive_requests_jump_the_queue():
+    engine = inference_engine.InferenceEngine(max_requests=1, model_concurrency=4)
+    runner, base = _start_server(engine)
+    try:
+        order = _run_after_blocker(engine, base, [
+            ("task-low", inference_engine.PRIORITY_LOW),
+            ("task-high", inference_engine.PRIORITY_HIGH),
+            ("chat", inference_engine.PRIORITY_INTERACTIVE),
+            ("tool", inference_engine.PRIORITY_FOLLOW_UP),
+        ])
+        assert order == ["chat", "tool", "task-high", "task-low"]
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_waiting_requests_age_ahead(monkeypatch):
+    monkeypatch.setattr(inference_engine, "AGING_SECONDS", 0.01)
+    engine = inference_engine.InferenceEngine(max_requests=1, model_concurrency=4)
+    runner, base = _start_server(engine)
+    try:
+        order = _run_after_blocker(engine, base, [
+            ("task-low", inference_engine.PRIORITY_LOW),
+            ("chat", inference_engine.PRIORITY_INTERACTIVE),
+        ], delay=0.3)
+        assert order == ["task-low", "chat"]
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
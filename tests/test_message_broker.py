@@ -1,6 +1,15 @@
 import message_broker
+import prompt_cache
 import tts
 
+def _run_tools_now(tools, calls, on_result, on_done, debug_enabled=False):
+    results = []
+    for i, call in enumerate(calls):
+        results.append(f"{call['name']} ok")
+        on_result(i, results[-1])
+    on_done(results)
+
+
 class DummyApp:
     def __init__(self):
         self.debug_enabled = False
@@ -22,13 +31,14 @@ def test_build_agent_chat_history(monkeypatch):
         {'role': 'user', 'content': 'Q'},
         {'role': 'assistant', 'content': 'A', 'agent': 'agent1'}
     ]
-    monkeypatch.setattr(message_broker, 'load_history', lambda debug=False: history)
+    monkeypatch.setattr(message_broker, 'get_history', lambda debug=False: history)
     monkeypatch.setattr(
         message_broker,
         'summarize_history',
-        lambda h, threshold=20: h
+        lambda h, threshold=20, key=None: h
     )
-    monkeypatch.setattr(message_broker, 'generate_tool_instructions_message', lambda app, name: 'tools')
+    monkeypatch.setattr(prompt_cache, '_prompts', {})
+    monkeypatch.setattr(prompt_cache, 'tool_catalog_message', lambda app, name: 'tools')
     monkeypatch.setattr(tts, 'speak_text', lambda *a, **k: None)
     broker = message_broker.MessageBroker(app)
     chat = broker.build_agent_chat_history('agent1')
@@ -43,7 +53,13 @@ def test_handle_worker_finished_runs_tool_for_assistant(monkeypatch):
     app = DummyApp()
     app.agents_data['agent1']['role'] = 'Assistant'
     app.agents_data['agent1']['tool_use'] = True
-    app.chat_tab = type('Tab', (), {'append_message_html': lambda self, html: None})()
+    app.chat_tab = type('Tab', (), {
+        'append_message_html': lambda self, html: None,
+        'finish_stream': lambda self, agent, html: None,
+        'discard_stream': lambda self, agent: None,
+        'begin_tool_block': lambda self, html: 1,
+        'finish_tool_block': lambda self, block_id, html: None,
+    })()
     app.current_responses = {
         'agent1': (
             '{"role": "assistant", "content": "hi", '
@@ -55,35 +71,30 @@ def test_handle_worker_finished_runs_tool_for_assistant(monkeypatch):
 
     called = {}
 
-    def fake_run_tool(tools, name, args, debug):
-        called['name'] = name
-        called['args'] = args
-        return 'ok'
+    def fake_run_tools_async(tools, calls, on_result, on_done, debug_enabled=False):
+        called['name'] = calls[0]['name']
+        called['args'] = calls[0]['args']
+        on_result(0, 'ok')
+        on_done(['ok'])
 
-    monkeypatch.setattr(message_broker, 'run_tool', fake_run_tool)
+    monkeypatch.setattr(message_broker, 'run_tools_async', fake_run_tools_async)
     monkeypatch.setattr(message_broker, 'append_message', lambda *a, **k: None)
 
-    class DummyThread:
-        def quit(self):
-            pass
-
-        def wait(self):
-            pass
-
-        def deleteLater(self):
+    class DummyRequest:
+        def cancel(self):
             pass
 
     class DummyWorker:
         def deleteLater(self):
             pass
 
-    thread = DummyThread()
+    request = DummyRequest()
     worker = DummyWorker()
-    broker.active_worker_threads = [(worker, thread)]
+    broker.active_requests = {worker: request}
 
     monkeypatch.setattr(tts, 'speak_text', lambda *a, **k: None)
     monkeypatch.setattr(tts, 'speak_text', lambda *a, **k: None)
-    broker.worker_finished_sequential(worker, thread, 'agent1')
+    broker.worker_finished_sequential(worker, request, 'agent1')
 
     assert called['name'] == 'echo-plugin'
     assert called['args'] == {'msg': 'hi'}
@@ -93,7 +104,13 @@ def test_delivers_tool_result(monkeypatch):
     app = DummyApp()
     app.agents_data['agent1']['role'] = 'Assistant'
     app.agents_data['agent1']['tool_use'] = True
-    app.chat_tab = type('Tab', (), {'append_message_html': lambda self, html: None})()
+    app.chat_tab = type('Tab', (), {
+        'append_message_html': lambda self, html: None,
+        'finish_stream': lambda self, agent, html: None,
+        'discard_stream': lambda self, agent: None,
+        'begin_tool_block': lambda self, html: 1,
+        'finish_tool_block': lambda self, block_id, html: None,
+    })()
     app.current_responses = {
         'agent1': (
             '{"role": "assistant", "content": "hi", '
@@ -104,7 +121,7 @@ def test_delivers_tool_result(monkeypatch):
     broker = message_broker.MessageBroker(app)
 
     monkeypatch.setattr(message_broker, 'append_message', lambda *a, **k: None)
-    monkeypatch.setattr(message_broker, 'run_tool', lambda *a, **k: 'ok')
+    monkeypatch.setattr(message_broker, 'run_tools_async', _run_tools_now)
 
     delivered = {}
 
@@ -115,27 +132,57 @@ def test_delivers_tool_result(monkeypatch):
 
     monkeypatch.setattr(broker, 'deliver_tool_result', fake_deliver)
 
-    class DummyThread:
-        def quit(self):
-            pass
-
-        def wait(self):
-            pass
-
-        def deleteLater(self):
+    class DummyRequest:
+        def cancel(self):
             pass
 
     class DummyWorker:
         def deleteLater(self):
             pass
 
-    thread = DummyThread()
+    request = DummyRequest()
     worker = DummyWorker()
-    broker.active_worker_threads = [(worker, thread)]
+    broker.active_requests = {worker: request}
 
-    broker.worker_finished_sequential(worker, thread, 'agent1')
+    broker.worker_finished_sequential(worker, request, 'agent1')
 
     assert delivered['agent'] == 'agent1'
     assert delivered['name'] == 'echo-plugin'
-    assert delivered['result'] == 'ok'
+    assert delivered['result'] == 'echo-plugin ok'
+
 
+def test_tool_requests_list_is_delivered_in_one_follow_up(monkeypatch):
+    app = DummyApp()
+    app.agents_data['agent1']['role'] = 'Assistant'
+    app.agents_data['agent1']['tools_enabled'] = ['echo-plugin', 'web-scraper']
+    html = []
+    app.chat_tab = type('Tab', (), {
+        'append_message_html': lambda self, h: html.append(h),
+        'finish_stream': lambda self, agent, h: None,
+        'discard_stream': lambda self, agent: None,
+        'begin_tool_block': lambda self, h: len(html),
+        'finish_tool_block': lambda self, block_id, h: html.append(h),
+    })()
+    app.current_responses = {
+        'agent1': (
+            '{"role": "assistant", "content": "fetching", "tool_requests": ['
+            '{"name": "web-scraper", "args": {"url": "a"}}, '
+            '{"name": "echo-plugin", "args": {"msg": "b"}}, '
+            '{"name": "math-solver", "args": {}}]}'
+        )
+    }
+    broker = message_broker.MessageBroker(app)
+    monkeypatch.setattr(message_broker, 'append_message', lambda *a, **k: None)
+    monkeypatch.setattr(message_broker, 'run_tools_async', _run_tools_now)
+    delivered = []
+    monkeypatch.setattr(broker, 'deliver_tool_result', lambda *a: delivered.append(a))
+    worker = type('Worker', (), {'deleteLater': lambda self: None})()
+    broker.active_requests = {}
+
+    broker.worker_finished_sequential(worker, None, 'agent1')
+
+    assert len(delivered) == 1
+    agent, names, result = delivered[0]
+    assert names == 'web-scraper, echo-plugin'
+    assert result.index('web-scraper ok') < result.index('echo-plugin ok')
+    assert any("'math-solver' is not enabled" in h for h in html)
@@ -28,3 +28,21 @@ def test_record_response_time(monkeypatch):
     metrics.record_response_time(data, "agent1", 1.0)
     avg = metrics.average_response_time(data, "agent1")
     assert abs(avg - 1.5) < 0.01
+
+
+def test_record_queue_wait(monkeypatch):
+    data = {}
+    monkeypatch.setattr(metrics, "save_metrics", noop_save)
+    metrics.record_queue_wait(data, "agent1", 0.5)
+    metrics.record_queue_wait(data, "agent1", 1.5)
+    assert abs(metrics.average_queue_wait(data, "agent1") - 1.0) < 0.01
+    assert metrics.average_queue_wait(data, "agent2") == 0.0
+
+
+def test_record_cache_lookup(monkeypatch):
+    data = {}
+    monkeypatch.setattr(metrics, "save_metrics", noop_save)
+    metrics.record_cache_lookup(data, "agent1", True)
+    metrics.record_cache_lookup(data, "agent1", False)
+    metrics.record_cache_lookup(data, "agent1", True)
+    assert data["response_cache"]["agent1"] == {"hits": 2, "misses": 1}
@@ -0,0 +1,117 @@
+import asyncio
+from collections import OrderedDict
+
+import backends
+import inference_engine
+import model_residency
+import worker
+from fake_ollama import FakeOllama, start_fake_server
+
+AGENTS = {
+    "Boss": {"model": "big", "role": "Coordinator", "managed_agents": ["Coder", "Off"]},
+    "Coder": {"model": "code", "role": "Specialist"},
+    "Off": {"model": "unused", "role": "Specialist", "enabled": False},
+    "Chat": {"model": "small", "role": "Assistant"},
+}
+
+
+def _reset(monkeypatch):
+    monkeypatch.setattr(model_residency, "_keep_alive", {})
+    monkeypatch.setattr(model_residency, "_num_ctx", {})
+    monkeypatch.setattr(model_residency, "_teams", {})
+    monkeypatch.setattr(model_residency, "_sizes", {})
+    monkeypatch.setattr(model_residency, "_resident", OrderedDict())
+    monkeypatch.setattr(model_residency, "_budget", 0)
+
+
+def _drain():
+    """Wait for queued load and unload jobs."""
+    model_residency._jobs.submit(lambda: None).result(5)
+
+
+def test_plan_keeps_team_models_longer(monkeypatch):
+    _reset(monkeypatch)
+    plan = model_residency.plan_residency(AGENTS)
+    assert plan == {
+        "big": model_residency.TEAM_KEEP_ALIVE,
+        "code": model_residency.TEAM_KEEP_ALIVE,
+        "small": model_residency.DEFAULT_KEEP_ALIVE,
+    }
+    w = worker.AIWorker("code", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                        False, "Coder", AGENTS)
+    assert w._payload(w.chat_history, True)["keep_alive"] == model_residency.TEAM_KEEP_ALIVE
+
+
+def test_coordinator_warms_team_and_budget_evicts_lru(monkeypatch):
+    _reset(monkeypatch)
+    engine = inference_engine.InferenceEngine()
+    fake = FakeOllama(["big", "code", "small"], size=4 * 1024 ** 3)
+    runner, base = asyncio.run_coroutine_threadsafe(start_fake_server(fake), engine.loop).result(5)
+    try:
+        monkeypatch.setattr(backends, "_backends", [])
+        backends.configure_backends([base])
+        model_residency.plan_residency(AGENTS)
+        model_residency._refresh_sizes()
+
+        model_residency.note_request("Boss", "big")
+        _drain()
+        assert fake.loaded == ["code"]  # ready before the handoff
+        assert model_residency.resident_models() == ["big", "code"]
+
+        model_residency.configure_residency(8)
+        model_residency.note_request("Chat", "small")
+        _drain()
+        # 12 GB would be loaded; the least recently used model goes
+        assert model_residency.resident_models() == ["code", "small"]
+        assert fake.unloaded == ["big"]
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_warm_up_respects_budget(monkeypatch):
+    _reset(monkeypatch)
+    engine = inference_engine.InferenceEngine()
+    fake = FakeOllama(["big", "code", "small"], size=4 * 1024 ** 3)
+    runner, base = asyncio.run_coroutine_threadsafe(start_fake_server(fake), engine.loop).result(5)
+    try:
+        monkeypatch.setattr(backends, "_backends", [])
+        backends.configure_backends([base])
+        model_residency.configure_residency(8)
+        model_residency.warm_up(AGENTS)
+        _drain()
+        # Team models first, then nothing beyond the budget
+        assert fake.loaded == ["big", "code"]
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_preload_uses_the_agents_context_size(monkeypatch):
+    _reset(monkeypatch)
+    engine = inference_engine.InferenceEngine()
+    fake = FakeOllama(["big", "code", "small"])
+    runner, base = asyncio.run_coroutine_threadsafe(start_fake_server(fake), engine.loop).result(5)
+    agents = {
+        "Boss": dict(AGENTS["Boss"], context_tokens=8192),
+        "Coder": AGENTS["Coder"],
+        "Chat": dict(AGENTS["Chat"], context_tokens=16384),
+        "Other": {"model": "small", "context_tokens": 16384},
+        "Odd": {"model": "small", "context_tokens": 2048},
+    }
+    try:
+        monkeypatch.setattr(backends, "_backends", [])
+        backends.configure_backends([base])
+        model_residency.warm_up(agents)
+        _drain()
+        sent = {p["model"]: p["options"]["num_ctx"] for p in fake.generate_requests}
+        # The same num_ctx the agents' chat requests send, so Ollama does
+        # not reload the model for their first turn
+        for name in ("Boss", "Coder", "Chat"):
+            w = worker.AIWorker(agents[name]["model"], [{"role": "user", "content": "Hi"}],
+                                0.7, 10, False, name, agents)
+            assert sent[w.model_name] == w._payload(w.chat_history, True)["options"]["num_ctx"]
+        assert sent["small"] == 16384
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
@@ -0,0 +1,24 @@
+import ollama_client
+
+
+def test_session_is_shared_and_pooled():
+    ollama_client.close_session()
+    session = ollama_client.get_session()
+    assert ollama_client.get_session() is session
+
+    adapter = session.get_adapter("http://localhost:11434/api/chat")
+    assert adapter._pool_maxsize == ollama_client._pool_size
+    assert adapter._pool_block is True
+
+
+def test_configure_pool_replaces_session():
+    session = ollama_client.get_session()
+    ollama_client.configure_pool(3)
+    new_session = ollama_client.get_session()
+    assert new_session is not session
+    assert new_session.get_adapter("http://localhost")._pool_maxsize == 3
+
+    # Same limits keep the existing session.
+    ollama_client.configure_pool(3)
+    assert ollama_client.get_session() is new_session
+    ollama_client.configure_pool(ollama_client.DEFAULT_POOL_SIZE)
@@ -0,0 +1,77 @@
+import json
+import time
+
+import persistence
+import tasks
+
+
+def test_write_json_coalesces_writes(monkeypatch, tmp_path):
+    path = str(tmp_path / "data.json")
+    writes = []
+    original = persistence._write
+    monkeypatch.setattr(
+        persistence, "_write", lambda *a: writes.append(a[0]) or original(*a)
+    )
+    monkeypatch.setattr(persistence, "FLUSH_DELAY", 0.05)
+
+    data = []
+    for i in range(20):
+        data.append(i)
+        persistence.write_json(path, data)
+    assert persistence.pending(path)
+
+    deadline = time.time() + 2
+    while persistence.pending(path) and time.time() < deadline:
+        time.sleep(0.01)
+    persistence.flush(path)
+    assert writes == [path]
+    assert json.loads((tmp_path / "data.json").read_text()) == list(range(20))
+    assert not (tmp_path / "data.json.tmp").exists()
+
+
+def test_write_json_snapshots_data(monkeypatch, tmp_path):
+    monkeypatch.setattr(persistence, "FLUSH_DELAY", 60)
+    path = tmp_path / "snapshot.json"
+    data = {"a": [1]}
+    persistence.write_json(str(path), data)
+    # Changes after the call, e.g. by the GUI, are not part of this write
+    data["a"].append(2)
+    data["b"] = 3
+    persistence.flush()
+    assert json.loads(path.read_text()) == {"a": [1]}
+
+
+def test_unserializable_data_keeps_pending_write(monkeypatch, tmp_path):
+    monkeypatch.setattr(persistence, "FLUSH_DELAY", 60)
+    path = tmp_path / "kept.json"
+    persistence.write_json(str(path), [1])
+    persistence.write_json(str(path), [object()])
+    persistence.flush()
+    assert json.loads(path.read_text()) == [1]
+
+
+def test_flush_writes_immediately(monkeypatch, tmp_path):
+    monkeypatch.setattr(persistence, "FLUSH_DELAY", 60)
+    path = tmp_path / "later.json"
+    persistence.write_json(str(path), {"a": 1})
+    assert not path.exists()
+    persistence.flush()
+    assert json.loads(path.read_text()) == {"a": 1}
+    assert not persistence.pending()
+
+
+def test_load_sees_pending_save(monkeypatch, tmp_path):
+    monkeypatch.setattr(persistence, "FLUSH_DELAY", 60)
+    monkeypatch.setattr(tasks, "TASKS_FILE", str(tmp_path / "tasks.json"))
+    tasks.save_tasks([{"id": "1", "prompt": "p", "due_time": "2024-01-01 10:00"}])
+    loaded = tasks.load_tasks()
+    assert [t["id"] for t in loaded] == ["1"]
+
+
+def test_discard_drops_pending_write(monkeypatch, tmp_path):
+    monkeypatch.setattr(persistence, "FLUSH_DELAY", 60)
+    path = tmp_path / "gone.json"
+    persistence.write_json(str(path), [1])
+    persistence.discard(str(path))
+    persistence.flush()
+    assert not path.exists()
@@ -0,0 +1,89 @@
+import prompt_cache
+
+
+class DummyApp:
+    def __init__(self):
+        self.agents_data = {
+            'Boss': {
+                'system_prompt': 'You coordinate.',
+                'role': 'Coordinator',
+                'tool_use': True,
+                'managed_agents': ['Coder'],
+                'tools_enabled': ['echo-plugin'],
+            },
+            'Coder': {
+                'system_prompt': 'You write code.',
+                'role': 'Specialist',
+                'description': 'Writes Python',
+                'tool_use': False,
+            },
+        }
+        self.tools = [{'name': 'echo-plugin', 'description': 'Echo', 'args': ['msg']}]
+        self.automations = []
+
+
+def _reset(monkeypatch):
+    monkeypatch.setattr(prompt_cache, '_prompts', {})
+    monkeypatch.setattr(prompt_cache, '_generation', 0)
+
+
+def test_compile_puts_stable_parts_first():
+    prompt = prompt_cache.compile_system_prompt(DummyApp(), 'Boss')
+    protocol = prompt.index(prompt_cache.tool_protocol_message())
+    own = prompt.index('You coordinate.')
+    team = prompt.index('Coder: Writes Python')
+    catalog = prompt.index('Available tools')
+    assert protocol == 0
+    assert protocol < own < team < catalog
+    assert 'echo-plugin' in prompt
+
+
+def test_compile_without_tools():
+    prompt = prompt_cache.compile_system_prompt(DummyApp(), 'Coder')
+    assert prompt == 'You write code.'
+    assert prompt_cache.compile_system_prompt(DummyApp(), 'Missing') == ''
+
+
+def test_prompt_is_cached_until_invalidated(monkeypatch):
+    _reset(monkeypatch)
+    app = DummyApp()
+    calls = []
+    real_compile = prompt_cache.compile_system_prompt
+
+    def counting(app, name):
+        calls.append(name)
+        return real_compile(app, name)
+
+    monkeypatch.setattr(prompt_cache, 'compile_system_prompt', counting)
+    first = prompt_cache.system_prompt_for(app, 'Coder')
+    app.agents_data['Coder']['system_prompt'] = 'You review code.'
+    assert prompt_cache.system_prompt_for(app, 'Coder') == first
+    assert calls == ['Coder']
+
+    prompt_cache.invalidate_prompts('Coder')
+    assert prompt_cache.system_prompt_for(app, 'Coder') == 'You review code.'
+    assert calls == ['Coder', 'Coder']
+
+
+def test_invalidate_all_refreshes_coordinator(monkeypatch):
+    _reset(monkeypatch)
+    app = DummyApp()
+    assert 'Writes Python' in prompt_cache.system_prompt_for(app, 'Boss')
+    app.agents_data['Coder']['description'] = 'Reviews pull requests'
+    prompt_cache.invalidate_prompts()
+    assert 'Reviews pull requests' in prompt_cache.system_prompt_for(app, 'Boss')
+
+
+def test_stale_compile_is_not_stored(monkeypatch):
+    _reset(monkeypatch)
+    app = DummyApp()
+    real_compile = prompt_cache.compile_system_prompt
+
+    def invalidated_while_compiling(app, name):
+        prompt = real_compile(app, name)
+        prompt_cache.invalidate_prompts()
+        return prompt
+
+    monkeypatch.setattr(prompt_cache, 'compile_system_prompt', invalidated_while_compiling)
+    assert prompt_cache.system_prompt_for(app, 'Coder') == 'You write code.'
+    assert prompt_cache._prompts == {}
@@ -0,0 +1,128 @@
+import asyncio
+
+import aiohttp
+
+import backends
+import resilience
+import worker
+from fake_ollama import FakeOllama, run_worker, start_fake_server
+
+
+def _setup(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    delays = []
+    # Record the backoff but retry at once
+    monkeypatch.setattr(
+        worker, "backoff_delay",
+        lambda attempt: delays.append(resilience.backoff_delay(attempt)) or 0,
+    )
+    return delays
+
+
+def _run(monkeypatch, fake=None, url=None):
+    """Run a worker routed to ``fake``, or to ``url`` if nothing listens there."""
+    chunks, errors = [], []
+
+    def make(*urls):
+        monkeypatch.setattr(backends, "_backends", [backends.Backend(urls[0] if urls else url)])
+        w = worker.AIWorker("m", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                            False, "a", {"a": {}})
+        w.response_received.connect(lambda chunk, name: chunks.append(chunk))
+        w.error_occurred.connect(errors.append)
+        return w
+
+    run_worker(make, *([fake] if fake else []))
+    return "".join(chunks), errors
+
+
+def test_breaker_opens_and_half_opens(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = resilience.CircuitBreaker("http://x")
+    for _ in range(resilience.FAILURE_THRESHOLD):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == resilience.OPEN
+    assert not breaker.allow()
+
+    now[0] += resilience.RESET_TIMEOUT
+    assert breaker.allow()  # the probe
+    assert breaker.state == resilience.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == resilience.OPEN
+
+    now[0] += resilience.RESET_TIMEOUT
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == resilience.CLOSED and breaker.allow()
+
+
+def test_backoff_is_bounded():
+    delays = [resilience.backoff_delay(n) for n in range(10)]
+    assert all(0 < d <= resilience.BACKOFF_MAX for d in delays)
+    assert resilience.backoff_delay(0) <= resilience.BACKOFF_BASE
+
+
+def test_worker_retries_before_first_token(monkeypatch):
+    delays = _setup(monkeypatch)
+    # A dropped connection, then a 5xx while the model loads, then a reply
+    fake = FakeOllama(["m"], reply=["hi"], statuses=[0, 503])
+    text, errors = _run(monkeypatch, fake)
+    assert (len(fake.requests), text, errors) == (3, "hi", [])
+    assert len(delays) == 2 and delays[0] <= delays[1] * 2
+    backend = backends.get_backends()[0]
+    state, failures, _ = resilience.breaker_states()[backend.url]
+    assert (state, failures) == (resilience.CLOSED, 0)
+    assert backend.healthy
+
+
+def test_open_breaker_sheds_requests(monkeypatch):
+    delays = _setup(monkeypatch)
+    fake = FakeOllama(["m"], statuses=[0] * (resilience.MAX_RETRIES + 1))
+    _, errors = _run(monkeypatch, fake)
+    assert len(fake.requests) == resilience.FAILURE_THRESHOLD
+    assert "unavailable" in errors[0]
+    url = backends.get_backends()[0].url
+    assert resilience.breaker_states()[url][0] == resilience.OPEN
+
+    # Later requests fail at once without touching the server
+    delays.clear()
+    _, errors = _run(monkeypatch, url=url)
+    assert delays == [] and "unavailable" in errors[0]
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    delays = _setup(monkeypatch)
+    fake = FakeOllama(["m"], statuses=[404])
+    _, errors = _run(monkeypatch, fake)
+    assert len(fake.requests) == 1 and delays == [] and errors
+
+
+def test_cancelled_probe_lets_the_next_request_probe(monkeypatch):
+    _setup(monkeypatch)
+    fake = FakeOllama(["m"], delay=5, reply="late")
+
+    async def run():
+        runner, url = await start_fake_server(fake)
+        try:
+            monkeypatch.setattr(backends, "_backends", [backends.Backend(url)])
+            breaker = resilience.get_breaker(url)
+            breaker.state = resilience.OPEN
+            breaker.opened_at = resilience.time.monotonic() - resilience.RESET_TIMEOUT
+            w = worker.AIWorker("m", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                                False, "a", {"a": {}})
+            async with aiohttp.ClientSession() as session:
+                post = w._post(session, w._payload(w.chat_history, stream=False))
+                try:
+                    await asyncio.wait_for(post, 0.2)
+                except asyncio.TimeoutError:
+                    pass
+            return breaker
+        finally:
+            await runner.cleanup()
+
+    breaker = asyncio.run(run())
+    assert len(fake.requests) == 1
+    assert breaker.state == resilience.HALF_OPEN
+    assert breaker.allow()
@@ -0,0 +1,53 @@
+import persistence
+import response_cache
+
+
+def _setup(monkeypatch, tmp_path, **config):
+    monkeypatch.setattr(response_cache, "CACHE_FILE", str(tmp_path / "cache.json"))
+    monkeypatch.setattr(response_cache, "_entries", None)
+    monkeypatch.setattr(response_cache, "_enabled", False)
+    response_cache.configure_cache(True, **config)
+
+
+def _payload(content, temperature=0, **extra):
+    return {
+        "model": "m",
+        "messages": [dict({"role": "user", "content": content}, **extra)],
+        "temperature": temperature,
+        "max_tokens": 10,
+        "options": {"num_ctx": 2048},
+    }
+
+
+def test_key_ignores_timestamps_and_skips_sampling(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path)
+    key = response_cache.cache_key(_payload("hi"))
+    assert key == response_cache.cache_key(_payload("hi", timestamp="2024-01-01"))
+    assert key != response_cache.cache_key(_payload("hello"))
+    assert response_cache.cache_key(_payload("hi", temperature=0.7)) is None
+    response_cache.configure_cache(False)
+    assert response_cache.cache_key(_payload("hi")) is None
+
+
+def test_lru_eviction_and_ttl(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path, max_entries=2)
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    response_cache.store("a", "A")
+    response_cache.store("b", "B")
+    assert response_cache.get_cached("a") == "A"  # a is now most recent
+    response_cache.store("c", "C")
+    assert response_cache.get_cached("b") is None
+    assert response_cache.get_cached("a") == "A"
+
+    response_cache.configure_cache(ttl=60)
+    now[0] += 61
+    assert response_cache.get_cached("c") is None
+
+
+def test_cache_persists(monkeypatch, tmp_path):
+    _setup(monkeypatch, tmp_path)
+    response_cache.store("a", "A")
+    persistence.flush(response_cache.CACHE_FILE)
+    monkeypatch.setattr(response_cache, "_entries", None)
+    assert response_cache.get_cached("a") == "A"
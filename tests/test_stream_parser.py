@@ -0,0 +1,62 @@
+import json
+
+from stream_parser import ProtocolScanner
+
+
+def _feed(scanner, chunks):
+    for i, chunk in enumerate(chunks):
+        if scanner.feed(chunk):
+            return i
+    return None
+
+
+def test_tool_request_is_found_when_object_closes():
+    request = {"role": "assistant", "content": "a } in {text", "tool_request": {"name": "t", "args": {"q": "\"}"}}}
+    text = json.dumps(request)
+    chunks = [text[i:i + 7] for i in range(0, len(text), 7)] + [" ignored", " words"]
+    scanner = ProtocolScanner()
+    stopped_at = _feed(scanner, chunks)
+    assert stopped_at == (len(text) - 1) // 7
+    assert scanner.request == request
+    assert scanner.end == len(text)
+
+
+def test_other_json_and_plain_text_do_not_stop():
+    scanner = ProtocolScanner(["Writer"])
+    assert _feed(scanner, ['{"answer": 4}', " and more"]) is None
+    scanner = ProtocolScanner()
+    assert _feed(scanner, ["Sure.", " Next Response By: Writer\n"]) is None
+
+
+def test_handoff_waits_for_an_unambiguous_name():
+    scanner = ProtocolScanner(["Writer", "Writer2"])
+    assert _feed(scanner, ["Plan ready.\nNext Response", " By: Writer"]) is None
+    assert scanner.feed("2") is True
+    assert scanner.handoff == "Writer2"
+
+    scanner = ProtocolScanner(["Writer", "Writer2"])
+    assert _feed(scanner, ["Next Response By: Writer", "\nThanks!"]) == 1
+    assert scanner.handoff == "Writer"
+    assert scanner.end == len("Next Response By: Writer")
+
+
+def test_handoff_after_other_text_and_markers():
+    scanner = ProtocolScanner(["Writer"])
+    prefix = "Intro. " * 50 + "Next Response By: Nobody\nMore. Next Resp"
+    assert _feed(scanner, [prefix, "onse By:", " Wri", "ter\n", "tail"]) == 3
+    assert scanner.handoff == "Writer"
+    assert scanner.end == len(prefix + "onse By: Writer")
+    # Only the text that could still hold a handoff line is kept
+    assert len(scanner._tail) < 40
+
+    scanner = ProtocolScanner(["Writer", "Writer2"])
+    assert _feed(scanner, ["Done.\nNext Response By:\nWriter", "\nBye"]) == 1
+    assert scanner.end == len("Done.\nNext Response By:\nWriter")
+
+
+def test_plain_text_without_targets_is_not_kept():
+    scanner = ProtocolScanner()
+    for _ in range(1000):
+        assert scanner.feed("word ") is False
+    assert scanner.length == 5000
+    assert scanner._tail == "" and scanner._parts == []
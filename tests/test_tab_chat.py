@@ -8,6 +8,8 @@ os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
 class DummyApp:
     def __init__(self):
         self.notifications = []
+        self.user_name = "User"
+        self.agents_data = {}
     def show_notification(self, message, type="info"):
         self.notifications.append((message, type))
     def export_chat_histories(self):
@@ -47,3 +49,70 @@ def test_format_helpers():
     assert ts_label == "5m ago"
     assert title.startswith(now.strftime("%Y-%m-%d"))
     app.quit()
+
+
+def test_stream_renders_incrementally_and_finalizes_in_place():
+    app = QApplication.instance() or QApplication([])
+    tab = tab_chat.ChatTab(DummyApp())
+    tab.append_stream("Alice", "Hel", "#ff0000")
+    # The first chunk is drawn immediately
+    assert tab.chat_display.toPlainText().endswith("Alice: Hel")
+    tab.append_stream("Alice", "lo")
+    assert tab.chat_display.toPlainText().endswith("Alice: Hel")
+    tab.flush_streams()
+    assert tab.chat_display.toPlainText().endswith("Alice: Hello")
+
+    # Messages appended mid-stream do not capture later chunks
+    tab.append_message_html("[00:01] <span style='color:#00ff00;'>Bob:</span> hi")
+    tab.append_stream("Alice", " there")
+    tab.flush_streams()
+    text = tab.chat_display.toPlainText()
+    assert text.index("Hello there") < text.index("hi")
+
+    tab.finish_stream("Alice", "[00:02] <span style='color:#ff0000;'>Alice:</span> Hello there!")
+    text = tab.chat_display.toPlainText()
+    assert "Alice: Hello" not in text
+    assert text.index("Hello there!") < text.index("hi")
+    assert not tab.streams
+    app.quit()
+
+
+def test_stream_hides_json_and_discards():
+    app = QApplication.instance() or QApplication([])
+    tab = tab_chat.ChatTab(DummyApp())
+    tab.append_stream("Alice", '{"tool_request": {}}')
+    assert "tool_request" not in tab.chat_display.toPlainText()
+    tab.append_stream("Bob", "partial")
+    tab.discard_stream("Bob")
+    tab.discard_stream("Alice")
+    assert "partial" not in tab.chat_display.toPlainText()
+    assert not tab.streams
+    app.quit()
+
+
+def test_thinking_stream_is_removed_with_reply():
+    app = QApplication.instance() or QApplication([])
+    tab = tab_chat.ChatTab(DummyApp())
+    tab.append_stream("Alice", "Step 1: {plan}", thinking=True)
+    assert "Alice (thinking): Step 1: {plan}" in tab.chat_display.toPlainText()
+    tab.append_stream("Alice", "Answer")
+    tab.flush_streams()
+    tab.finish_stream("Alice", "[00:02] <span style='color:#ff0000;'>Alice:</span> Answer")
+    text = tab.chat_display.toPlainText()
+    assert "Step 1" not in text
+    assert "Answer" in text
+    assert not tab.streams
+    app.quit()
+
+
+def test_tool_block_is_replaced_in_place():
+    app = QApplication.instance() or QApplication([])
+    tab = tab_chat.ChatTab(DummyApp())
+    block_id = tab.begin_tool_block("[00:01] <span style='color:#ff0000;'>Alice:</span> running fetch")
+    tab.append_message_html("[00:02] <span style='color:#00ff00;'>Bob:</span> hi")
+    tab.finish_tool_block(block_id, "[00:03] <span style='color:#ff0000;'>Alice:</span> fetched page")
+    text = tab.chat_display.toPlainText()
+    assert "running fetch" not in text
+    assert text.index("fetched page") < text.index("hi")
+    assert not tab.tool_blocks
+    app.quit()
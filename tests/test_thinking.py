@@ -1,47 +1,182 @@
-import worker
-import types
-
-class DummyResp:
-    def __init__(self, data, stream=False):
-        self._data = data
-        self.status_code = 200
-        self._stream = stream
+import asyncio
+import itertools
+import os
+import threading
+import time
 
-    def raise_for_status(self):
-        pass
+from PyQt5.QtWidgets import QApplication
 
-    def json(self):
-        return self._data
+import inference_engine
+import worker
+from fake_ollama import FakeOllama, run_worker, start_fake_server
 
-    def iter_lines(self, decode_unicode=True):
-        for line in self._data:
-            yield line
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
 
 
 def test_worker_thinking(monkeypatch):
-    steps_responses = [
-        {"message": {"content": "thought1"}},
-        {"message": {"content": "thought2"}},
-    ]
-    final_stream = [b'{"message":{"content":"final"}}', b'{"done":true}']
-    calls = {"count": 0}
-
-    def fake_post(url, json=None, stream=False, timeout=None):
-        if stream:
-            return DummyResp(final_stream, stream=True)
-        resp = steps_responses[calls["count"]]
-        calls["count"] += 1
-        return DummyResp(resp)
-
-    monkeypatch.setattr(worker.requests, "post", fake_post)
+    monkeypatch.setattr(worker, "FLUSH_INTERVAL", 0)
+    replies = iter([["thought1"], ["thought2"], ["final"]])
+    fake = FakeOllama(["model"], reply=lambda payload: next(replies))
 
     history = [{"role": "system", "content": ""}, {"role": "user", "content": "Hi"}]
     agents = {"a": {"thinking_enabled": True, "thinking_steps": 2}}
-    w = worker.AIWorker("model", history, 0.7, 10, False, "a", agents, "http://localhost:11434/api/chat")
+    collected = []
+    thoughts = []
+
+    def make(url):
+        w = worker.AIWorker("model", history, 0.7, 10, False, "a", agents, f"{url}/api/chat")
+        w.response_received.connect(lambda chunk, name: collected.append(chunk))
+        w.thought_received.connect(lambda chunk, name: thoughts.append(chunk))
+        return w
+
+    run_worker(make, fake)
+
+    sent = [payload["messages"] for payload in fake.requests]
+    assert all(payload["stream"] for payload in fake.requests)
+    assert len(sent) == 3  # two thinking steps and the answer
+    assert "".join(collected) == "final"
+    assert "".join(thoughts) == "Step 1: thought1\nStep 2: thought2\n"
+    # Every request extends the previous one so the prompt cache is reused
+    for before, after in zip(sent, sent[1:]):
+        assert after[:len(before)] == before
+    assert sent[2][-2] == {"role": "assistant", "content": "thought2"}
+    assert history[-1]["content"] == "Hi"
+
+
+def test_worker_thinking_stops_on_error():
+    fake = FakeOllama(["model"], reply=[{"error": "boom"}])
+    agents = {"a": {"thinking_enabled": True, "thinking_steps": 3}}
+    errors = []
+    finished = []
+
+    def make(url):
+        w = worker.AIWorker("model", [{"role": "user", "content": "Hi"}], 0.7, 10, False, "a",
+                            agents, f"{url}/api/chat")
+        w.error_occurred.connect(errors.append)
+        w.finished.connect(lambda: finished.append(True))
+        return w
+
+    run_worker(make, fake)
+
+    assert errors == ["[Error] boom"]
+    assert finished == [True]
+    assert len(fake.requests) == 1
+
+
+def _sample_replies():
+    ideas = itertools.count(1)
+    return lambda payload: ["final"] if payload["stream"] else f"idea{next(ideas)}"
 
+
+def test_worker_parallel_samples(monkeypatch):
+    monkeypatch.setattr(worker, "FLUSH_INTERVAL", 0)
+    fake = FakeOllama(["model"], delay=0.1, reply=_sample_replies())
+    history = [{"role": "user", "content": "Hi"}]
+    agents = {"a": {"thinking_enabled": True, "thinking_samples": 3,
+                    "thinking_aggregation": "vote"}}
     collected = []
-    w.response_received.connect(lambda chunk, name: collected.append(chunk))
-    w.run()
+    thoughts = []
+
+    def make(url):
+        w = worker.AIWorker("model", history, 0.7, 10, False, "a", agents, f"{url}/api/chat")
+        w.response_received.connect(lambda chunk, name: collected.append(chunk))
+        w.thought_received.connect(lambda chunk, name: thoughts.append(chunk))
+        return w
+
+    run_worker(make, fake)
+
+    assert fake.peak == 3  # samples ran side by side
+    assert "".join(collected) == "final"
+    assert len(thoughts) == 3
+    final = fake.requests[-1]["messages"]
+    assert final[:1] == history
+    for n in (1, 2, 3):
+        assert f"idea{n}" in final[-1]["content"]
+    assert worker.AGGREGATION_PROMPTS["vote"] in final[-1]["content"]
+
+
+def _run_samples_on_engine(engine, samples, fake_delay=0.05, requests=1):
+    app = QApplication.instance() or QApplication([])
+    fake = FakeOllama(["model"], delay=fake_delay, reply=_sample_replies())
+    runner, base = asyncio.run_coroutine_threadsafe(start_fake_server(fake), engine.loop).result(5)
+    try:
+        agents = {"a": {"thinking_enabled": True, "thinking_samples": samples}}
+        finished = []
+        errors = []
+        workers = []
+        for _ in range(requests):
+            w = worker.AIWorker("model", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                                False, "a", agents, f"{base}/api/chat")
+            w.finished.connect(lambda: finished.append(True))
+            w.error_occurred.connect(errors.append)
+            workers.append(w)
+        # Submitted together, every request is admitted before any fans out
+        engine.loop.call_soon_threadsafe(lambda: [engine.submit(w, timeout=5) for w in workers])
+        deadline = time.time() + 5
+        while len(finished) < requests and time.time() < deadline:
+            app.processEvents()
+            time.sleep(0.01)
+        assert len(finished) == requests
+        assert errors == []
+        assert len(fake.requests) == requests * (samples + 1)
+        return fake
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
+
+
+def test_parallel_samples_respect_dispatcher_caps():
+    # Samples of one request count against the per-model limit...
+    engine = inference_engine.InferenceEngine(max_requests=4, model_concurrency=2)
+    assert _run_samples_on_engine(engine, 5).peak == 2
+    # ...and against the total, and release their slots when done
+    engine = inference_engine.InferenceEngine(max_requests=3, model_concurrency=8)
+    assert _run_samples_on_engine(engine, 5).peak == 3
+    assert engine.stats()["running"] == 0
+
+
+def test_concurrent_sampling_requests_do_not_deadlock():
+    # Neither request waits for a slot the other holds; each runs its
+    # samples in the slots it has
+    engine = inference_engine.InferenceEngine(max_requests=8, model_concurrency=2)
+    assert _run_samples_on_engine(engine, 3, requests=2).peak == 2
+    assert engine.stats()["running"] == 0
+
+
+def test_parallel_samples_respect_pool_size(monkeypatch):
+    monkeypatch.setattr(inference_engine, "pool_limits", lambda: (2, 1))
+    engine = inference_engine.InferenceEngine(max_requests=8, model_concurrency=8)
+    assert _run_samples_on_engine(engine, 5).peak == 2
+
 
-    assert calls["count"] == 2  # two thinking steps
-    assert "final" in "".join(collected)
+def test_thoughts_are_saved_in_the_gui_thread(monkeypatch):
+    saved = []
+    monkeypatch.setattr(
+        worker, "append_message",
+        lambda history, role, content, agent=None, **kwargs:
+            saved.append((content, threading.current_thread())),
+    )
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine()
+    replies = iter([["one"], ["two"], ["final"]])
+    fake = FakeOllama(["model"], reply=lambda payload: next(replies))
+    runner, base = asyncio.run_coroutine_threadsafe(start_fake_server(fake), engine.loop).result(5)
+    try:
+        agents = {"a": {"thinking_enabled": True, "thinking_steps": 2}}
+        w = worker.AIWorker("model", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                            False, "a", agents, f"{base}/api/chat")
+        finished = []
+        w.finished.connect(lambda: finished.append(True))
+        engine.submit(w)
+        deadline = time.time() + 5
+        while not finished and time.time() < deadline:
+            app.processEvents()
+            time.sleep(0.01)
+        # Saved before the reply finishes, off the engine's event loop
+        assert [content for content, _ in saved] == [
+            "<thought>Step 1: one</thought>", "<thought>Step 2: two</thought>",
+        ]
+        assert all(thread is threading.main_thread() for _, thread in saved)
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
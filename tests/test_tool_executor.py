@@ -0,0 +1,87 @@
+import os
+import threading
+import time
+
+from PyQt5.QtWidgets import QApplication
+
+import tool_executor
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def _wait_for(app, condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def test_slow_tool_does_not_block_and_reports_in_gui_thread(monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    release = threading.Event()
+
+    def slow_tool(tools, name, args, debug):
+        release.wait(5)
+        return f"{name}:{args['x']}"
+
+    monkeypatch.setattr(tool_executor, "run_tool", slow_tool)
+    executor = tool_executor.ToolExecutor()
+    results = []
+
+    start = time.time()
+    executor.submit([], "slow", {"x": 1}, lambda r: results.append((r, threading.current_thread())))
+    assert time.time() - start < 0.5
+    assert executor.pending() == 1
+    assert results == []
+
+    release.set()
+    _wait_for(app, lambda: results)
+    assert results == [("slow:1", threading.main_thread())]
+    assert executor.pending() == 0
+    executor.shutdown()
+
+
+def test_tool_exception_becomes_tool_error(monkeypatch):
+    app = QApplication.instance() or QApplication([])
+
+    def broken(tools, name, args, debug):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(tool_executor, "run_tool", broken)
+    executor = tool_executor.ToolExecutor()
+    results = []
+    executor.submit([], "broken", {}, results.append)
+    _wait_for(app, lambda: results)
+    assert results[0].startswith("[Tool Error]")
+    assert "boom" in results[0]
+    executor.shutdown()
+
+
+def test_batch_runs_concurrently_up_to_cap_and_keeps_order(monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    lock = threading.Lock()
+    running = {"now": 0, "peak": 0}
+
+    def tool(tools, name, args, debug):
+        with lock:
+            running["now"] += 1
+            running["peak"] = max(running["peak"], running["now"])
+        time.sleep(args["delay"])
+        with lock:
+            running["now"] -= 1
+        return name
+
+    monkeypatch.setattr(tool_executor, "run_tool", tool)
+    executor = tool_executor.ToolExecutor(max_workers=4)
+    calls = [{"name": f"t{i}", "args": {"delay": 0.2 - i * 0.04}} for i in range(4)]
+    seen = []
+    done = []
+    start = time.time()
+    executor.submit_batch([], calls, lambda i, r: seen.append(i), done.append, max_parallel=2)
+    _wait_for(app, lambda: done)
+    assert done == [["t0", "t1", "t2", "t3"]]
+    assert sorted(seen) == [0, 1, 2, 3]
+    assert running["peak"] == 2
+    # Two at a time is faster than one after another
+    assert time.time() - start < sum(c["args"]["delay"] for c in calls)
+    executor.shutdown()
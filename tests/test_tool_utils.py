@@ -55,3 +55,17 @@ def test_format_tool_block_html():
     assert 'echo-plugin' in html
     assert 'toolBlock' in html
 
+
+def test_parse_tool_requests_accepts_single_and_list():
+    single = tool_utils.parse_tool_requests({'tool_request': {'name': 'a', 'args': {'x': 1}}})
+    assert single == [{'name': 'a', 'args': {'x': 1}}]
+    many = tool_utils.parse_tool_requests({'tool_requests': [{'name': 'a'}, 'junk', {'name': 'b', 'args': {}}]})
+    assert many == [{'name': 'a', 'args': {}}, {'name': 'b', 'args': {}}]
+    assert tool_utils.parse_tool_requests({'content': 'hi'}) == []
+
+
+def test_format_tool_results_message():
+    assert tool_utils.format_tool_results_message([('a', 'one')]) == 'one'
+    message = tool_utils.format_tool_results_message([('a', 'one'), ('b', 'two')])
+    assert 'Result 1 (a):\none' in message
+    assert message.index('one') < message.index('two')
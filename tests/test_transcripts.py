@@ -1,18 +1,119 @@
+import json
+
+import persistence
 import transcripts
 
 
-def noop_save(history, debug_enabled=False):
-    pass
+def use_tmp_history(monkeypatch, tmp_path):
+    monkeypatch.setattr(transcripts, "HISTORY_FILE", str(tmp_path / "chat_history.json"))
+    monkeypatch.setattr(transcripts, "JOURNAL_FILE", str(tmp_path / "chat_history.jsonl"))
+    monkeypatch.setattr(transcripts, "SUMMARY_FILE", str(tmp_path / "chat_history_summary.json"))
+    monkeypatch.setattr(transcripts, "ARCHIVE_DIR", str(tmp_path / "chat_history_archive"))
 
 
-def test_append_message(monkeypatch):
+def test_append_message(monkeypatch, tmp_path):
     history = []
-    monkeypatch.setattr(transcripts, "save_history", noop_save)
+    use_tmp_history(monkeypatch, tmp_path)
     entry = transcripts.append_message(history, "assistant", "hi", "agent1")
     assert history[0]["content"] == "hi"
     assert history[0]["agent"] == "agent1"
     assert entry["role"] == "assistant"
     assert "timestamp" in entry
+    transcripts.clear_history()
+
+
+def test_append_message_keeps_order(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    order = {"reply_to": "t0", "position": 2, "finished": 1}
+    transcripts.append_message([], "assistant", "fast", "agent2", order=order)
+    assert transcripts.load_history()[-1]["order"] == order
+    transcripts.clear_history()
+
+
+def test_append_message_journals_without_rewrite(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    transcripts.save_history([{"role": "user", "content": "old"}])
+    snapshot = (tmp_path / "chat_history.json").read_text()
+
+    history = transcripts.load_history()
+    transcripts.append_message(history, "user", "new")
+    transcripts.append_message(history, "assistant", "reply", "agent1")
+
+    assert (tmp_path / "chat_history.json").read_text() == snapshot
+    lines = (tmp_path / "chat_history.jsonl").read_text().splitlines()
+    assert [json.loads(line)["content"] for line in lines] == ["new", "reply"]
+    assert [m["content"] for m in transcripts.load_history()] == ["old", "new", "reply"]
+    transcripts.clear_history()
+
+
+def test_load_history_recovers_torn_tail(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    journal = tmp_path / "chat_history.jsonl"
+    journal.write_text('{"role": "user", "content": "ok"}\n{"role": "assis')
+
+    history = transcripts.load_history()
+    assert [m["content"] for m in history] == ["ok"]
+    assert journal.read_text() == '{"role": "user", "content": "ok"}\n'
+
+    transcripts.append_message(history, "user", "after")
+    assert [m["content"] for m in transcripts.load_history()] == ["ok", "after"]
+    transcripts.clear_history()
+
+
+def test_compact_history(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    monkeypatch.setattr(transcripts, "COMPACT_THRESHOLD", 3)
+    history = []
+    for i in range(4):
+        transcripts.append_message(history, "user", f"msg{i}")
+
+    snapshot = json.loads((tmp_path / "chat_history.json").read_text())
+    assert [m["content"] for m in snapshot] == ["msg0", "msg1", "msg2"]
+    assert [m["content"] for m in transcripts.load_history()] == [f"msg{i}" for i in range(4)]
+
+    transcripts.clear_history()
+    assert transcripts.load_history() == []
+
+
+def test_get_history_uses_cache(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    transcripts.save_history([{"role": "user", "content": "old"}])
+    history = transcripts.get_history()
+
+    calls = []
+    monkeypatch.setattr(transcripts, "load_history", lambda debug=False: calls.append(1) or [])
+    assert transcripts.get_history() is history
+    transcripts.append_message(history, "user", "new")
+    assert transcripts.get_history() is history
+    assert [m["content"] for m in history] == ["old", "new"]
+    assert calls == []
+    monkeypatch.undo()
+    use_tmp_history(monkeypatch, tmp_path)
+    transcripts.clear_history()
+
+
+def test_get_history_reloads_after_external_change(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    transcripts.save_history([{"role": "user", "content": "old"}])
+    history = transcripts.get_history()
+
+    # Another process (e.g. run_task.py) appends to the journal directly.
+    with open(tmp_path / "chat_history.jsonl", "a", encoding="utf-8") as f:
+        f.write(json.dumps({"role": "assistant", "content": "external"}) + "\n")
+
+    assert [m["content"] for m in transcripts.get_history()] == ["old", "external"]
+    assert transcripts.get_history() is history
+    transcripts.clear_history()
+
+
+def test_append_message_updates_cache(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    cached = transcripts.get_history()
+    generation = transcripts.history_generation()
+    transcripts.append_message([], "user", "hello")
+    assert [m["content"] for m in cached] == ["hello"]
+    assert transcripts.history_generation() != generation
+    transcripts.clear_history()
 
 
 def test_summarize_history():
@@ -34,3 +135,170 @@ def test_summarize_history_disabled():
 
     summarized = transcripts.summarize_history(history, threshold=0)
     assert summarized == history
+
+
+def test_summarize_history_checkpoint_is_incremental(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    history = transcripts.get_history()
+    for i in range(15):
+        transcripts.append_message(history, "user", f"msg{i}")
+
+    expected = transcripts.summarize_history(list(history), threshold=10)
+    assert transcripts.summarize_history(history, threshold=10) == expected
+    persistence.flush()
+    checkpoint = json.loads((tmp_path / "chat_history_summary.json").read_text())
+    assert checkpoint["checkpoints"][""]["count"] == 5
+
+    folded = []
+    original = transcripts._fold_summary
+
+    def record(text, messages, max_chars):
+        folded.append(len(messages))
+        return original(text, messages, max_chars)
+
+    monkeypatch.setattr(transcripts, "_fold_summary", record)
+    transcripts.append_message(history, "assistant", "reply", "agent1")
+    transcripts.append_message(history, "user", "again")
+    summary = transcripts.summarize_history(history, threshold=10)
+    assert folded == [2]
+    assert summary == transcripts.summarize_history(list(history), threshold=10)
+    assert "msg6" in summary[0]["content"]
+    transcripts.clear_history()
+
+
+def test_summarize_history_checkpoints_per_agent(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    history = transcripts.get_history()
+    for i in range(30):
+        transcripts.append_message(history, "user", f"msg{i}")
+
+    folded = []
+    original = transcripts._fold_summary
+
+    def record(text, messages, max_chars):
+        folded.append(len(messages))
+        return original(text, messages, max_chars)
+
+    monkeypatch.setattr(transcripts, "_fold_summary", record)
+    # Agents with different budgets summarize up to different points.
+    transcripts.summarize_history(history, threshold=10, key="big")
+    transcripts.summarize_history(history, threshold=20, key="small")
+    assert folded == [20, 10]
+
+    # Alternating turns only fold in the messages new to each agent.
+    transcripts.append_message(history, "user", "next")
+    for expected in ([1, 1], []):
+        folded.clear()
+        big = transcripts.summarize_history(history, threshold=10, key="big")
+        small = transcripts.summarize_history(history, threshold=20, key="small")
+        assert folded == expected
+    assert big == transcripts.summarize_history(list(history), threshold=10)
+    assert small == transcripts.summarize_history(list(history), threshold=20)
+    transcripts.clear_history()
+
+
+def test_summarize_history_checkpoint_invalidation(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    history = transcripts.get_history()
+    for i in range(12):
+        transcripts.append_message(history, "user", f"msg{i}")
+    transcripts.summarize_history(history, threshold=10)
+    persistence.flush()
+    assert (tmp_path / "chat_history_summary.json").exists()
+
+    # Editing a summarized message changes its fingerprint.
+    history[1]["content"] = "edited"
+    assert "edited" in transcripts.summarize_history(history, threshold=10)[0]["content"]
+
+    transcripts.save_history([{"role": "user", "content": "rewritten"}] * 12)
+    assert not (tmp_path / "chat_history_summary.json").exists()
+    assert "rewritten" in transcripts.summarize_history(history, threshold=10)[0]["content"]
+
+    transcripts.clear_history()
+    assert not (tmp_path / "chat_history_summary.json").exists()
+
+
+def test_append_message_strips_thoughts(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    history = []
+    entry = transcripts.append_message(history, "assistant", "<thought>hmm</thought> Answer", "a")
+    assert entry["content"] == "Answer"
+    assert entry["raw_content"] == "<thought>hmm</thought> Answer"
+    plain = transcripts.append_message(history, "assistant", "No thoughts", "a")
+    assert "raw_content" not in plain
+    kept = transcripts.append_message(history, "assistant", "Clean", "a", raw_content="<thought>x</thought>Clean")
+    assert kept["raw_content"] == "<thought>x</thought>Clean"
+    transcripts.clear_history()
+
+
+def test_agent_history_view_is_incremental(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    history = transcripts.get_history()
+    transcripts.append_message(history, "user", "hi")
+    transcripts.append_message(history, "assistant", "from coordinator", "coord")
+    transcripts.append_message(history, "assistant", "from specialist", "spec")
+    transcripts.append_message(history, "assistant", "from other", "other")
+
+    messages, positions = transcripts.agent_history(history, "coord", ["spec"])
+    assert [m["content"] for m in messages] == ["hi", "from coordinator", "from specialist"]
+    assert positions == [0, 1, 2]
+
+    calls = []
+    original = transcripts._visible_to
+    monkeypatch.setattr(
+        transcripts, "_visible_to", lambda *a: calls.append(a[0]) or original(*a)
+    )
+    transcripts.append_message(history, "user", "next")
+    again, positions = transcripts.agent_history(history, "coord", ["spec"])
+    assert again is messages
+    assert messages[-1]["content"] == "next" and positions[-1] == 4
+    # Only the new message was examined, once per existing view.
+    assert len(calls) == 1
+
+    # A plain list gets the same filtering without a view.
+    copy = list(history)
+    assert transcripts.agent_history(copy, "coord", ["spec"])[0] == messages
+    transcripts.clear_history()
+    assert transcripts.agent_history(history, "coord", ["spec"]) == ([], [])
+
+
+def test_agent_history_strips_legacy_thoughts(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    transcripts.save_history([
+        {"role": "assistant", "content": "<thought>old</thought>Reply", "agent": "a"},
+    ])
+    history = transcripts.get_history()
+    messages, _ = transcripts.agent_history(history, "a")
+    assert messages[0]["content"] == "Reply"
+    assert history[0]["content"] == "<thought>old</thought>Reply"
+    transcripts.clear_history()
+
+
+def test_compact_history_rotates_segments(monkeypatch, tmp_path):
+    use_tmp_history(monkeypatch, tmp_path)
+    monkeypatch.setattr(transcripts, "COMPACT_THRESHOLD", 1000)
+    monkeypatch.setattr(transcripts, "SEGMENT_MESSAGES", 4)
+    monkeypatch.setattr(transcripts, "KEEP_RECENT", 2)
+    history = transcripts.get_history()
+    for i in range(11):
+        transcripts.append_message(history, "user", f"msg{i}")
+    transcripts.compact_history()
+
+    archive = tmp_path / "chat_history_archive"
+    manifest = json.loads((archive / "manifest.json").read_text())
+    assert [seg["count"] for seg in manifest["segments"]] == [4, 4]
+    assert (archive / manifest["segments"][0]["file"]).name.endswith(".json.gz")
+
+    # Only the live window is loaded; archives are read for export and search.
+    assert [m["content"] for m in history] == ["msg8", "msg9", "msg10"]
+    assert [m["content"] for m in transcripts.load_history()] == ["msg8", "msg9", "msg10"]
+    full = transcripts.load_full_history()
+    assert [m["content"] for m in full] == [f"msg{i}" for i in range(11)]
+
+    dest = tmp_path / "export.json"
+    transcripts.export_history(str(dest))
+    assert len(json.loads(dest.read_text())) == 11
+
+    transcripts.clear_history()
+    assert not archive.exists()
+    assert transcripts.load_full_history() == []
@@ -15,7 +15,11 @@ class DummyApp:
                 'color': '#000'
             }
         }
-        self.chat_tab = type('Tab', (), {'append_message_html': lambda self, html: None})()
+        self.chat_tab = type('Tab', (), {
+            'append_message_html': lambda self, html: None,
+            'finish_stream': lambda self, agent, html: None,
+            'discard_stream': lambda self, agent: None,
+        })()
         self.current_responses = {'agent1': 'hello'}
         self.tools = []
         self.tasks = []
@@ -28,22 +32,18 @@ def test_tts_called(monkeypatch):
     called = {}
     monkeypatch.setattr(tts, 'speak_text', lambda text, voice=None: called.setdefault('text', text))
 
-    class DummyThread:
-        def quit(self):
-            pass
-        def wait(self):
-            pass
-        def deleteLater(self):
+    class DummyRequest:
+        def cancel(self):
             pass
 
     class DummyWorker:
         def deleteLater(self):
             pass
 
-    thread = DummyThread()
+    request = DummyRequest()
     worker = DummyWorker()
-    broker.active_worker_threads = [(worker, thread)]
+    broker.active_requests = {worker: request}
 
-    broker.worker_finished_sequential(worker, thread, 'agent1')
+    broker.worker_finished_sequential(worker, request, 'agent1')
 
     assert called['text'] == 'hello'
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import threading
+import time
+
+from PyQt5.QtWidgets import QApplication
+
+import inference_engine
+import response_cache
+import worker
+from fake_ollama import FakeOllama, run_worker, start_fake_server
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def _run_worker(fake, agents=None, history=None):
+    """Run agent "a" against ``fake`` and return the worker and its reply text."""
+    emitted = []
+
+    def make(url):
+        w = worker.AIWorker("model", history or [{"role": "user", "content": "Hi"}], 0.7, 10,
+                            False, "a", agents or {"a": {}}, api_url=f"{url}/api/chat")
+        w.response_received.connect(lambda chunk, name: emitted.append(chunk))
+        return w
+
+    w = run_worker(make, fake)
+    return w, emitted
+
+
+def test_stream_chunks_are_coalesced_by_size(monkeypatch):
+    monkeypatch.setattr(worker, "FLUSH_INTERVAL", 60)
+    _, emitted = _run_worker(FakeOllama(["model"], reply=["x"] * 1000))
+    assert "".join(emitted) == "x" * 1000
+    assert [len(c) for c in emitted] == [256, 256, 256, 232]
+
+
+def test_stream_chunks_flush_on_interval(monkeypatch):
+    monkeypatch.setattr(worker, "FLUSH_INTERVAL", 0)
+    _, emitted = _run_worker(FakeOllama(["model"], reply=["a", "b", "c"]))
+    assert emitted == ["a", "b", "c"]
+
+
+def test_cached_reply_is_replayed_without_request(monkeypatch, tmp_path):
+    monkeypatch.setattr(response_cache, "CACHE_FILE", str(tmp_path / "cache.json"))
+    monkeypatch.setattr(response_cache, "_entries", None)
+    monkeypatch.setattr(response_cache, "_enabled", True)
+    fake = FakeOllama(["model"], reply=["Hel", "lo"])
+    history = [{"role": "user", "content": "Hi"}]
+    agents = {"a": {}}
+
+    def run():
+        emitted = []
+
+        def make(url):
+            w = worker.AIWorker("model", history, 0, 10, False, "a", agents,
+                                api_url=f"{url}/api/chat")
+            w.response_received.connect(lambda chunk, name: emitted.append(chunk))
+            return w
+
+        return run_worker(make, fake), "".join(emitted)
+
+    first, text = run()
+    assert (first.cache_result, text) == ("miss", "Hello")
+    second, text = run()
+    assert (second.cache_result, text) == ("hit", "Hello")
+    assert len(fake.requests) == 1
+
+
+def test_cache_files_are_used_off_the_event_loop(monkeypatch):
+    monkeypatch.setattr(response_cache, "_enabled", True)
+    threads = []
+
+    def record(result):
+        return lambda *args: threads.append(threading.current_thread()) or result
+
+    monkeypatch.setattr(worker, "get_cached", record(None))
+    monkeypatch.setattr(worker, "store", record(None))
+    history = [{"role": "user", "content": "Hi"}]
+
+    def make(url):
+        return worker.AIWorker("model", history, 0, 10, False, "a", {"a": {}},
+                               api_url=f"{url}/api/chat")
+
+    run_worker(make, FakeOllama(["model"], reply=["Hello"]))
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_reply_stops_after_tool_request():
+    tokens = ['{"tool_request": {"name": "t", ', '"args": {}}}', " I hope", " that helps", " a lot"]
+    w, emitted = _run_worker(FakeOllama(["model"], reply=tokens), {"a": {"tool_use": True}})
+    assert "".join(emitted) == '{"tool_request": {"name": "t", "args": {}}}'
+    assert w.stopped_early
+
+
+def test_coordinator_handoff_warms_target_and_stops(monkeypatch):
+    warmed = []
+    monkeypatch.setattr(worker, "prefetch", lambda model, debug=False: warmed.append(model))
+    tokens = ["Over to you.", "\nNext Response By: Writer", "\nExtra", " words"]
+    agents = {
+        "a": {"role": "Coordinator", "managed_agents": ["Writer"]},
+        "Writer": {"role": "Specialist", "model": "writer-model"},
+    }
+    w, emitted = _run_worker(FakeOllama(["model"], reply=tokens), agents)
+    # "Writer" is the only managed agent, so the name alone ends the reply
+    assert "".join(emitted) == "Over to you.\nNext Response By: Writer"
+    assert warmed == ["writer-model"]
+    assert w.stopped_early
+
+
+def test_plain_reply_is_read_to_the_end():
+    w, emitted = _run_worker(FakeOllama(["model"], reply=["Hello", " there"]))
+    assert "".join(emitted) == "Hello there"
+    assert not w.stopped_early
+
+
+def test_async_reply_stops_generation_after_tool_request():
+    app = QApplication.instance() or QApplication([])
+    engine = inference_engine.InferenceEngine()
+    reply = '{"tool_request": {"name": "t", "args": {}}} ' + " ".join(["word"] * 40)
+    fake = FakeOllama(["m"], delay=0.05, reply=reply)
+    runner, base = asyncio.run_coroutine_threadsafe(start_fake_server(fake), engine.loop).result(5)
+    try:
+        w = worker.AIWorker("m", [{"role": "user", "content": "Hi"}], 0.7, 10,
+                            False, "a", {"a": {}}, api_url=f"{base}/api/chat")
+        chunks = []
+        finished = []
+        w.response_received.connect(lambda chunk, name: chunks.append(chunk))
+        w.finished.connect(lambda: finished.append(True))
+        start = time.time()
+        engine.submit(w)
+        while not finished and time.time() - start < 10:
+            app.processEvents()
+            time.sleep(0.01)
+        # The 40 words after the request would take another two seconds
+        assert time.time() - start < 1.5
+        assert "".join(chunks) == '{"tool_request": {"name": "t", "args": {}}}'
+        deadline = time.time() + 2
+        while not fake.disconnects and time.time() < deadline:
+            time.sleep(0.01)
+        assert fake.disconnects == 1
+    finally:
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), engine.loop).result(5)
+        engine.shutdown()
@@ -0,0 +1,147 @@
+# tool_executor.py
+
+"""Run tool calls on a thread pool instead of the GUI thread.
+
+Tools such as ``web-scraper`` wait on the network and ``math-solver`` can
+spend seconds in SymPy, so calling :func:`tools.run_tool` from
+``worker_finished_sequential`` froze the window until they returned.
+:func:`run_tool_async` hands the call to a :class:`ToolExecutor` and
+returns at once. When the tool finishes, its result is sent back through
+the ``tool_finished`` signal; the executor lives in the GUI thread, so Qt
+queues the signal and the completion callback runs there, where it may
+update widgets and send the follow-up message to the agent.
+
+An agent may ask for several tools in one reply. :func:`run_tools_async`
+runs them concurrently, at most ``MAX_PARALLEL_TOOLS`` at a time per turn,
+reports each result as it arrives and calls back once with all results in
+the order requested.
+"""
+
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from tools import run_tool
+
+DEFAULT_MAX_WORKERS = 4
+# Tools from one agent reply running at once
+MAX_PARALLEL_TOOLS = 3
+
+
+class ToolExecutor(QObject):
+    """Runs tools in background threads and reports results in the GUI thread."""
+
+    tool_finished = pyqtSignal(int, str)
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, debug_enabled=False):
+        super().__init__()
+        self.debug_enabled = debug_enabled
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._callbacks = {}
+        self._ids = itertools.count(1)
+        self.tool_finished.connect(self._deliver)
+
+    def submit(self, tools, tool_name, tool_args, callback):
+        """Run ``tool_name`` in the pool and pass its result to ``callback``.
+
+        ``callback(result)`` is called in the thread this executor lives in.
+        Returns an id for the call.
+        """
+        call_id = next(self._ids)
+        self._callbacks[call_id] = callback
+        if self.debug_enabled:
+            print(f"[Debug] Running tool '{tool_name}' in the background (call {call_id})")
+        self._pool.submit(self._run, call_id, tools, tool_name, tool_args)
+        return call_id
+
+    def submit_batch(self, tools, calls, on_result, on_done, max_parallel=MAX_PARALLEL_TOOLS):
+        """Run ``calls`` (``{"name", "args"}`` dicts), ``max_parallel`` at a time.
+
+        ``on_result(index, result)`` is called as each call finishes and
+        ``on_done(results)`` once all have, with results in call order.
+        """
+        results = [None] * len(calls)
+        waiting = list(range(len(calls)))
+        remaining = [len(calls)]
+
+        def start_next():
+            index = waiting.pop(0)
+            call = calls[index]
+            self.submit(tools, call["name"], call["args"], lambda result: finished(index, result))
+
+        def finished(index, result):
+            results[index] = result
+            remaining[0] -= 1
+            try:
+                on_result(index, result)
+            finally:
+                if waiting:
+                    start_next()
+                elif not remaining[0]:
+                    on_done(results)
+
+        if not calls:
+            on_done(results)
+            return
+        for _ in range(min(max(max_parallel, 1), len(calls))):
+            start_next()
+
+    def pending(self):
+        """Return the number of tool calls that have not reported back."""
+        return len(self._callbacks)
+
+    def _run(self, call_id, tools, tool_name, tool_args):
+        try:
+            result = run_tool(tools, tool_name, tool_args, self.debug_enabled)
+        except Exception as e:
+            result = f"[Tool Error] Exception running tool '{tool_name}': {e}"
+        self.tool_finished.emit(call_id, str(result))
+
+    def _deliver(self, call_id, result):
+        callback = self._callbacks.pop(call_id, None)
+        if callback is None:
+            return
+        try:
+            callback(result)
+        except Exception as e:
+            print(f"[Error] Tool completion handler failed: {e}")
+
+    def shutdown(self):
+        """Stop accepting calls; running tools finish in the background."""
+        self._callbacks.clear()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_lock = threading.Lock()
+_executor = None
+
+
+def get_tool_executor(debug_enabled=False):
+    """Return the shared executor, creating it in the calling (GUI) thread."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ToolExecutor(debug_enabled=debug_enabled)
+        return _executor
+
+
+def run_tool_async(tools, tool_name, tool_args, callback, debug_enabled=False):
+    """Run a tool on the shared executor. See :meth:`ToolExecutor.submit`."""
+    return get_tool_executor(debug_enabled).submit(tools, tool_name, tool_args, callback)
+
+
+def run_tools_async(tools, calls, on_result, on_done, max_parallel=MAX_PARALLEL_TOOLS,
+                    debug_enabled=False):
+    """Run several tool calls on the shared executor. See :meth:`ToolExecutor.submit_batch`."""
+    get_tool_executor(debug_enabled).submit_batch(tools, calls, on_result, on_done, max_parallel)
+
+
+def shutdown_tool_executor():
+    """Stop the shared executor if it was started."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown()
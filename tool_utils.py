@@ -1,46 +1,93 @@
 """Utility functions for tool handling."""
 
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
+
+# Tool calls accepted from one agent reply; extra calls are reported as errors
+MAX_TOOL_REQUESTS = 8
+
+
+def tool_protocol_message() -> str:
+    """Return the tool call instructions shared by every tool-using agent."""
+    return (
+        "You are a knowledgeable assistant. You can answer most questions directly.\n"
+        "ONLY use a tool if you cannot answer from your own knowledge. If you can answer directly, do so.\n"
+        "If using a tool, respond ONLY in the following exact JSON format and nothing else:\n"
+        "{\n"
+        ' "role": "assistant",\n'
+        ' "content": "<explanation>",\n'
+        ' "tool_request": {\n'
+        '     "name": "<tool_name>",\n'
+        '     "args": { ... }\n'
+        ' }\n'
+        '}\n'
+        "To call several tools at once, e.g. to fetch three pages, use a list instead:\n"
+        ' "tool_requests": [\n'
+        '     {"name": "<tool_name>", "args": { ... }},\n'
+        '     {"name": "<tool_name>", "args": { ... }}\n'
+        ' ]\n'
+        f"Only batch calls that do not depend on each other, at most {MAX_TOOL_REQUESTS} per reply.\n"
+        "No extra text outside this JSON when calling a tool.\n"
+        "After a non-silent tool call you will get the tool's result as the next user message.\n"
+        "The results of a tool_requests list come back together in one message, in the order requested.\n"
+        "Include that result in your reply if it's meant for the user.\n"
+    )
+
+
+def tool_catalog_message(app: Any, agent_name: str) -> str:
+    """Return the list of tools and automations enabled for an agent."""
+    agent_settings = getattr(app, 'agents_data', {}).get(agent_name, {})
+    enabled_tools = agent_settings.get("tools_enabled", [])
+    tool_list_str = ""
+    for t in getattr(app, 'tools', []):
+        if t['name'] in enabled_tools:
+            args = ", ".join(t.get("args", []))
+            if args:
+                tool_list_str += f"- {t['name']}({args}): {t['description']}\n"
+            else:
+                tool_list_str += f"- {t['name']}: {t['description']}\n"
+
+    for a in getattr(app, 'automations', []):
+        if a.get('name') in agent_settings.get("automations_enabled", []):
+            tool_list_str += f"- automation-playback(name={a['name']})\n"
+    return f"Available tools:\n{tool_list_str}"
 
 
 def generate_tool_instructions_message(app: Any, agent_name: str) -> str:
     """Return formatted tool usage instructions for an agent."""
     agent_settings = getattr(app, 'agents_data', {}).get(agent_name, {})
     if agent_settings.get("tool_use", False):
-        enabled_tools = agent_settings.get("tools_enabled", [])
-        tool_list_str = ""
-        for t in getattr(app, 'tools', []):
-            if t['name'] in enabled_tools:
-                args = ", ".join(t.get("args", []))
-                if args:
-                    tool_list_str += f"- {t['name']}({args}): {t['description']}\n"
-                else:
-                    tool_list_str += f"- {t['name']}: {t['description']}\n"
-
-        for a in getattr(app, 'automations', []):
-            if a.get('name') in agent_settings.get("automations_enabled", []):
-                tool_list_str += f"- automation-playback(name={a['name']})\n"
-        instructions = (
-            "You are a knowledgeable assistant. You can answer most questions directly.\n"
-            "ONLY use a tool if you cannot answer from your own knowledge. If you can answer directly, do so.\n"
-            "If using a tool, respond ONLY in the following exact JSON format and nothing else:\n"
-            "{\n"
-            ' "role": "assistant",\n'
-            ' "content": "<explanation>",\n'
-            ' "tool_request": {\n'
-            '     "name": "<tool_name>",\n'
-            '     "args": { ... }\n'
-            ' }\n'
-            '}\n'
-            "No extra text outside this JSON when calling a tool.\n"
-            "After a non-silent tool call you will get the tool's result as the next user message.\n"
-            "Include that result in your reply if it's meant for the user.\n"
-            f"Available tools:\n{tool_list_str}"
-        )
-        return instructions
+        return tool_protocol_message() + tool_catalog_message(app, agent_name)
     return ""
 
 
+def parse_tool_requests(parsed: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Return the tool calls in a parsed agent reply as ``{"name", "args"}`` dicts.
+
+    Accepts a single ``tool_request`` object or a ``tool_requests`` list.
+    """
+    requests = parsed.get("tool_requests", parsed.get("tool_request"))
+    if isinstance(requests, dict):
+        requests = [requests]
+    if not isinstance(requests, list):
+        return []
+    return [
+        {"name": r.get("name", ""), "args": r.get("args") or {}}
+        for r in requests
+        if isinstance(r, dict)
+    ]
+
+
+def format_tool_results_message(results: List[Tuple[str, str]]) -> str:
+    """Combine ``(tool_name, result)`` pairs into one follow-up message."""
+    if len(results) == 1:
+        return results[0][1]
+    parts = [
+        f"Result {i} ({tool_name}):\n{result}"
+        for i, (tool_name, result) in enumerate(results, 1)
+    ]
+    return "Results of your tool requests, in the order requested:\n\n" + "\n\n".join(parts)
+
+
 def format_tool_call_html(tool_name: str, tool_args: Dict[str, Any]) -> str:
     """Return HTML snippet representing a tool invocation."""
     arg_list = ", ".join(f"{k}={v!r}" for k, v in tool_args.items())
@@ -62,3 +109,14 @@ def format_tool_block_html(tool_name: str, tool_args: Dict[str, Any], result: st
         f"<div>{call_html}<br>{result_html}</div>"
         "</details>"
     )
+
+
+def format_tool_running_html(tool_name: str, tool_args: Dict[str, Any]) -> str:
+    """Return the block shown while a tool call is still running."""
+    call_html = format_tool_call_html(tool_name, tool_args)
+    return (
+        "<details class='toolBlock'>"
+        f"<summary>\ud83d\udd27 {tool_name} \u23f3 running\u2026</summary>"
+        f"<div>{call_html}</div>"
+        "</details>"
+    )
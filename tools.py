@@ -6,6 +6,7 @@ import sys
 import tempfile
 import importlib.util
 from importlib import metadata
+from persistence import write_json, flush
 
 TOOLS_FILE = "tools.json"
 PLUGIN_DIR = "tool_plugins"
@@ -16,6 +17,7 @@ ENTRY_POINT_GROUP = "cerebro_tools"
 
 def load_plugin_settings():
     """Return the plugin settings mapping plugin name to enabled flag."""
+    flush(PLUGINS_FILE)
     if os.path.exists(PLUGINS_FILE):
         try:
             with open(PLUGINS_FILE, "r", encoding="utf-8") as f:
@@ -27,11 +29,7 @@ def load_plugin_settings():
 
 def save_plugin_settings(data):
     """Persist plugin settings to disk."""
-    try:
-        with open(PLUGINS_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=2)
-    except Exception:
-        pass
+    write_json(PLUGINS_FILE, data)
 
 
 def set_plugin_enabled(name, enabled):
@@ -227,6 +225,7 @@ def discover_plugin_tools(debug_enabled=False):
 def load_tools(debug_enabled=False):
     """Load tools from tools.json and any installed plugins."""
     tools = []
+    flush(TOOLS_FILE)
     if os.path.exists(TOOLS_FILE):
         try:
             with open(TOOLS_FILE, "r", encoding="utf-8") as f:
@@ -240,13 +239,9 @@ def load_tools(debug_enabled=False):
     return tools
 
 def save_tools(tools, debug_enabled=False):
-    try:
-        with open(TOOLS_FILE, "w", encoding="utf-8") as f:
-            json.dump(tools, f, indent=2)
-        if debug_enabled:
-            print("[Debug] Tools saved.")
-    except Exception as e:
-        print(f"[Error] Failed to save tools: {e}")
+    write_json(TOOLS_FILE, tools, debug_enabled=debug_enabled)
+    if debug_enabled:
+        print("[Debug] Tools save queued.")
 
 def run_tool(tools, tool_name, args, debug_enabled=False):
     """Execute the specified tool with the provided arguments."""
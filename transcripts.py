@@ -1,61 +1,527 @@
 # transcripts.py
 
+import atexit
+import gzip
+import hashlib
 import json
 import os
+import re
+import shutil
+import threading
+import time
 from datetime import datetime
+from persistence import write_json, flush, discard
 
 HISTORY_FILE = "chat_history.json"
+JOURNAL_FILE = "chat_history.jsonl"
+SUMMARY_FILE = "chat_history_summary.json"
+ARCHIVE_DIR = "chat_history_archive"
+MANIFEST_NAME = "manifest.json"
 
-def load_history(debug_enabled=False):
-    """Load chat history from disk."""
-    if not os.path.exists(HISTORY_FILE):
-        return []
+# Journal tuning. Appends are flushed immediately but only fsynced in batches;
+# once the journal grows past COMPACT_THRESHOLD entries it is folded back into
+# the snapshot file.
+FSYNC_BATCH_SIZE = 20
+FSYNC_INTERVAL = 2.0
+COMPACT_THRESHOLD = 500
+
+# Segment rotation. When compaction finds more than SEGMENT_MESSAGES +
+# KEEP_RECENT messages in the live history, the oldest SEGMENT_MESSAGES are
+# moved to a gzip segment in ARCHIVE_DIR. Archived segments are listed in a
+# manifest and only read for export and search.
+SEGMENT_MESSAGES = 1000
+KEEP_RECENT = 250
+
+_lock = threading.RLock()
+_journal = None
+_journal_path = None
+_journal_entries = 0
+_unsynced = 0
+_last_sync = 0.0
+
+# Process-wide cache of the full history. ``_cache_signature`` records the
+# on-disk state the cache corresponds to so changes made by other processes
+# (e.g. ``run_task.py``) trigger a reload, while our own writes update the
+# cache in place.
+_cache = None
+_cache_signature = None
+_generation = 0
+# Bumped when the history changes other than by appending, so the search
+# index knows when it must check its rows against the whole history again.
+_rewrites = 0
+
+# Rolling summary checkpoints for the cached history: the summary text of the
+# first ``count`` messages plus a fingerprint of the last one, so each call to
+# summarize_history only folds in messages that newly left the window. Agents
+# with different context budgets summarize up to different points, so one
+# checkpoint is kept per key (the agent name), most recently used last.
+_summary = None
+_summary_path = None
+_SUMMARY_LIMIT = 16
+
+# Per-agent views of the cached history, keyed by (agent, visible agents).
+# Each view holds the messages that agent sees and their positions in the
+# history, and is extended as messages are appended. Any other change to the
+# cached history discards the views.
+_views = {}
+_VIEW_LIMIT = 64
+
+_THOUGHT_RE = re.compile(r"<thought>.*?</thought>", re.DOTALL)
+
+
+def _close_journal():
+    """Sync and close the open journal handle, if any."""
+    global _journal, _journal_path, _unsynced
+    if _journal is None:
+        return
     try:
-        with open(HISTORY_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        if debug_enabled:
-            print("[Debug] History loaded", data)
-        return data
+        _journal.flush()
+        os.fsync(_journal.fileno())
+        _journal.close()
     except Exception as e:
-        print(f"[Error] Failed to load history: {e}")
+        print(f"[Error] Failed to close history journal: {e}")
+    _journal = None
+    _journal_path = None
+    _unsynced = 0
+
+
+def _disk_signature():
+    """Return a cheap fingerprint of the history files on disk."""
+    signature = []
+    for path in (HISTORY_FILE, JOURNAL_FILE):
+        try:
+            st = os.stat(path)
+            signature.append((path, st.st_mtime_ns, st.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+def _cache_in_sync():
+    return _cache is not None and _cache_signature == _disk_signature()
+
+
+def _mark_cache_synced():
+    global _cache_signature, _generation
+    _cache_signature = _disk_signature()
+    _generation += 1
+
+
+def _read_snapshot():
+    """Return the messages stored in the compacted snapshot file."""
+    if not os.path.exists(HISTORY_FILE):
         return []
+    with open(HISTORY_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
 
-def save_history(history, debug_enabled=False):
-    """Save chat history to disk."""
-    try:
-        with open(HISTORY_FILE, "w", encoding="utf-8") as f:
-            json.dump(history, f, indent=2)
+
+def _read_journal(debug_enabled=False):
+    """Return the messages appended to the journal since the last compaction.
+
+    A partially written last line (e.g. after a crash mid-append) is dropped
+    and truncated away so later appends start on a clean line.
+    """
+    if not os.path.exists(JOURNAL_FILE):
+        return []
+    with open(JOURNAL_FILE, "rb") as f:
+        data = f.read()
+
+    entries = []
+    offset = 0
+    good_offset = 0
+    while offset < len(data):
+        end = data.find(b"\n", offset)
+        if end == -1:
+            # Torn tail: the last append never got its newline.
+            break
+        line = data[offset:end].strip()
+        offset = end + 1
+        if line:
+            try:
+                entries.append(json.loads(line.decode("utf-8")))
+            except ValueError:
+                if offset < len(data):
+                    print("[Error] Skipping corrupt history journal entry")
+                    good_offset = offset
+                    continue
+                # Corrupt final line is treated like a torn tail.
+                break
+        good_offset = offset
+
+    if good_offset < len(data):
+        _close_journal()
+        with open(JOURNAL_FILE, "r+b") as f:
+            f.truncate(good_offset)
         if debug_enabled:
-            print("[Debug] History saved")
-    except Exception as e:
-        print(f"[Error] Failed to save history: {e}")
+            print(f"[Debug] Recovered history journal, dropped {len(data) - good_offset} bytes")
+    return entries
 
-def append_message(history, role, content, agent=None, debug_enabled=False):
-    """Append a message to history and save it."""
+
+def load_history(debug_enabled=False):
+    """Load chat history from disk."""
+    global _journal_entries
+    with _lock:
+        try:
+            journal = _read_journal(debug_enabled)
+            _journal_entries = len(journal)
+            data = _read_snapshot() + journal
+            if debug_enabled:
+                print("[Debug] History loaded", data)
+            return data
+        except Exception as e:
+            print(f"[Error] Failed to load history: {e}")
+            return []
+
+
+def get_history(debug_enabled=False):
+    """Return the shared in-memory history, reloading it only if the files
+    on disk were changed outside this process.
+
+    The returned list is shared by every caller; pass it to
+    :func:`append_message` to add entries rather than mutating it directly.
+    """
+    global _cache, _rewrites
+    with _lock:
+        if not _cache_in_sync():
+            # Another process may have rewritten it rather than appended
+            _rewrites += 1
+            history = load_history(debug_enabled)
+            if _cache is None:
+                _cache = history
+            else:
+                _cache[:] = history
+            _views.clear()
+            _mark_cache_synced()
+            if debug_enabled:
+                print(f"[Debug] History cache reloaded ({len(_cache)} messages)")
+        return _cache
+
+
+def history_generation():
+    """Return a counter that changes whenever the cached history changes."""
+    return _generation
+
+
+def history_rewrites():
+    """Return a counter that changes when saved messages may have been
+    edited, removed or reordered rather than only appended to.
+
+    Moving old messages into archived segments does not count, since the
+    full history stays the same.
+    """
+    return _rewrites
+
+
+def _write_snapshot(history, debug_enabled=False):
+    """Atomically write ``history`` to the snapshot file and drop the journal."""
+    global _journal_entries
+    _close_journal()
+    tmp_path = HISTORY_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, HISTORY_FILE)
+    if os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+    _journal_entries = 0
+    if _cache is not None and history is not _cache:
+        _cache[:] = history
+    _mark_cache_synced()
+
+
+def save_history(history, debug_enabled=False):
+    """Save chat history to disk.
+
+    The full history is written atomically to the snapshot file and the
+    journal is discarded, since every journaled entry is now in the snapshot.
+    The saved history may differ from what was summarized before, so the
+    summary checkpoint is reset.
+    """
+    global _rewrites
+    with _lock:
+        try:
+            _reset_summary()
+            _views.clear()
+            _rewrites += 1
+            _write_snapshot(history, debug_enabled)
+            if debug_enabled:
+                print("[Debug] History saved")
+        except Exception as e:
+            print(f"[Error] Failed to save history: {e}")
+
+
+def _write_journal(entry, debug_enabled=False):
+    """Append one entry to the journal, batching fsync calls."""
+    global _journal, _journal_path, _journal_entries, _unsynced, _last_sync
+    if _journal is not None and _journal_path != JOURNAL_FILE:
+        _close_journal()
+    if _journal is None:
+        _journal = open(JOURNAL_FILE, "a", encoding="utf-8")
+        _journal_path = JOURNAL_FILE
+        _last_sync = time.monotonic()
+    _journal.write(json.dumps(entry) + "\n")
+    _journal.flush()
+    _journal_entries += 1
+    _unsynced += 1
+    now = time.monotonic()
+    if _unsynced >= FSYNC_BATCH_SIZE or now - _last_sync >= FSYNC_INTERVAL:
+        os.fsync(_journal.fileno())
+        _unsynced = 0
+        _last_sync = now
+
+
+def strip_thoughts(content):
+    """Return ``content`` without any ``<thought>...</thought>`` sections."""
+    if "<thought>" not in content:
+        return content
+    return _THOUGHT_RE.sub("", content).strip()
+
+
+def append_message(history, role, content, agent=None, debug_enabled=False,
+                   tool=None, raw_content=None, order=None):
+    """Append a message to history and journal it to disk.
+
+    Thought sections are removed from assistant messages here, once, with the
+    original text kept in ``raw_content`` (callers that already cleaned the
+    content may pass the original). ``tool`` marks the entry as the result of
+    the named tool. ``order`` records where a reply to a message sent to
+    several agents at once stands, since such replies are saved in the order
+    they finish.
+    """
     entry = {
         "timestamp": datetime.now().isoformat(),
         "role": role,
         "content": content,
     }
+    if role == "assistant" and isinstance(content, str):
+        clean = strip_thoughts(content)
+        if clean != content:
+            entry["content"] = clean
+            raw_content = raw_content or content
+    if raw_content and raw_content != entry["content"]:
+        entry["raw_content"] = raw_content
     if agent:
         entry["agent"] = agent
+    if tool:
+        entry["tool"] = tool
+    if order:
+        entry["order"] = order
     history.append(entry)
-    save_history(history, debug_enabled)
+    with _lock:
+        try:
+            in_sync = _cache_in_sync()
+            _write_journal(entry, debug_enabled)
+            if in_sync:
+                if history is not _cache:
+                    _cache.append(entry)
+                _mark_cache_synced()
+                for key, view in _views.items():
+                    _extend_view(view, key)
+            if _journal_entries >= COMPACT_THRESHOLD:
+                compact_history(debug_enabled)
+            if debug_enabled:
+                print("[Debug] History entry appended")
+        except Exception as e:
+            print(f"[Error] Failed to append history: {e}")
     return entry
 
+
+def _visible_to(msg, agent_name, include_agents):
+    """Return the view copy of ``msg`` if ``agent_name`` should see it."""
+    role = msg.get("role")
+    if role == "user":
+        return msg
+    if role != "assistant":
+        return None
+    sender = msg.get("agent")
+    if sender != agent_name and sender not in include_agents:
+        return None
+    content = msg.get("content", "")
+    if "<thought>" in content and "raw_content" not in msg:
+        # Written before thoughts were stripped on append.
+        msg = dict(msg, content=strip_thoughts(content))
+    return msg
+
+
+def _extend_view(view, key):
+    """Add messages appended to the cached history since the view was built."""
+    agent_name, include_agents = key
+    for position in range(view["scanned"], len(_cache)):
+        msg = _visible_to(_cache[position], agent_name, include_agents)
+        if msg is not None:
+            view["messages"].append(msg)
+            view["positions"].append(position)
+    view["scanned"] = len(_cache)
+
+
+def agent_history(history, agent_name, include_agents=()):
+    """Return ``(messages, positions)`` visible to ``agent_name``.
+
+    An agent sees every user message, its own replies and replies from the
+    agents in ``include_agents`` (a Coordinator's Specialists). ``positions``
+    gives each message's index in ``history``.
+
+    For the shared cached history the result comes from a view that is
+    maintained as messages are appended, so the cost is proportional to what
+    the agent sees. The returned lists are shared; copy them before mutating.
+    """
+    include_agents = frozenset(include_agents)
+    with _lock:
+        if history is not _cache:
+            messages, positions = [], []
+            for position, msg in enumerate(history):
+                visible = _visible_to(msg, agent_name, include_agents)
+                if visible is not None:
+                    messages.append(visible)
+                    positions.append(position)
+            return messages, positions
+        key = (agent_name, include_agents)
+        view = _views.get(key)
+        if view is None:
+            if len(_views) >= _VIEW_LIMIT:
+                _views.clear()
+            view = {"messages": [], "positions": [], "scanned": 0}
+            _views[key] = view
+        if view["scanned"] != len(_cache):
+            _extend_view(view, key)
+        return view["messages"], view["positions"]
+
+
+def sync_history():
+    """Force any batched journal writes to stable storage."""
+    global _unsynced, _last_sync
+    with _lock:
+        if _journal is None or not _unsynced:
+            return
+        try:
+            _journal.flush()
+            os.fsync(_journal.fileno())
+            _unsynced = 0
+            _last_sync = time.monotonic()
+        except Exception as e:
+            print(f"[Error] Failed to sync history: {e}")
+
+
+atexit.register(sync_history)
+
+
+def _manifest_path():
+    return os.path.join(ARCHIVE_DIR, MANIFEST_NAME)
+
+
+def _load_manifest():
+    """Return the list of archived segments, oldest first."""
+    path = _manifest_path()
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("segments", [])
+    except (OSError, ValueError) as e:
+        print(f"[Error] Failed to load history manifest: {e}")
+        return []
+
+
+def _archive_segment(messages, debug_enabled=False):
+    """Write ``messages`` to a new gzip segment and record it in the manifest."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    segments = _load_manifest()
+    name = f"segment_{len(segments) + 1:06d}.json.gz"
+    path = os.path.join(ARCHIVE_DIR, name)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(messages, f)
+    os.replace(tmp_path, path)
+    segments.append({
+        "file": name,
+        "count": len(messages),
+        "first_timestamp": messages[0].get("timestamp", ""),
+        "last_timestamp": messages[-1].get("timestamp", ""),
+    })
+    tmp_path = _manifest_path() + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"segments": segments}, f, indent=2)
+    os.replace(tmp_path, _manifest_path())
+    if debug_enabled:
+        print(f"[Debug] Archived {len(messages)} messages to {path}")
+
+
+def load_archived_history(debug_enabled=False):
+    """Return all messages from archived segments, oldest first."""
+    messages = []
+    for segment in _load_manifest():
+        path = os.path.join(ARCHIVE_DIR, segment["file"])
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                messages.extend(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"[Error] Failed to read history segment {path}: {e}")
+    if debug_enabled:
+        print(f"[Debug] Loaded {len(messages)} archived messages")
+    return messages
+
+
+def load_full_history(debug_enabled=False):
+    """Return archived and live history together, for search and export."""
+    with _lock:
+        return load_archived_history(debug_enabled) + list(get_history(debug_enabled))
+
+
+def compact_history(debug_enabled=False):
+    """Fold the journal into the snapshot file.
+
+    Old messages beyond the live window are rotated into archived segments
+    first. The segment and manifest are written before the shortened
+    snapshot, so an interruption can at worst leave messages in both places
+    rather than lose them.
+    """
+    with _lock:
+        try:
+            history = get_history()
+            if len(history) >= SEGMENT_MESSAGES + KEEP_RECENT:
+                while len(history) >= SEGMENT_MESSAGES + KEEP_RECENT:
+                    _archive_segment(history[:SEGMENT_MESSAGES], debug_enabled)
+                    del history[:SEGMENT_MESSAGES]
+                # Positions in the live history have shifted.
+                _reset_summary()
+                _views.clear()
+            _write_snapshot(history, debug_enabled)
+            if debug_enabled:
+                print(f"[Debug] History compacted ({len(history)} messages)")
+        except Exception as e:
+            print(f"[Error] Failed to compact history: {e}")
+
+
 def clear_history(debug_enabled=False):
     """Delete the saved history file."""
-    try:
-        if os.path.exists(HISTORY_FILE):
-            os.remove(HISTORY_FILE)
+    global _journal_entries, _rewrites
+    with _lock:
+        try:
+            _close_journal()
+            _journal_entries = 0
+            _rewrites += 1
+            _reset_summary()
+            for path in (HISTORY_FILE, JOURNAL_FILE):
+                if os.path.exists(path):
+                    os.remove(path)
+            if os.path.isdir(ARCHIVE_DIR):
+                shutil.rmtree(ARCHIVE_DIR)
+            _views.clear()
+            if _cache is not None:
+                _cache.clear()
+                _mark_cache_synced()
+            # Imported here because history_index depends on this module.
+            from history_index import clear_index
+            clear_index(debug_enabled)
             if debug_enabled:
                 print("[Debug] History cleared")
-    except Exception as e:
-        print(f"[Error] Failed to clear history: {e}")
+        except Exception as e:
+            print(f"[Error] Failed to clear history: {e}")
 
 def export_history(dest_path, debug_enabled=False):
-    """Export current history to the given path."""
-    history = load_history(debug_enabled)
+    """Export the full history, including archived segments, to the given path."""
+    history = load_full_history(debug_enabled)
     try:
         with open(dest_path, "w", encoding="utf-8") as f:
             json.dump(history, f, indent=2)
@@ -81,19 +547,122 @@ def search_history(history, query, role=None, agent=None):
             results.append(msg)
     return results
 
-def summarize_history(history, threshold=20, max_chars=1000):
+def _reset_summary():
+    """Discard the rolling summary checkpoint."""
+    global _summary, _summary_path
+    _summary = None
+    _summary_path = None
+    discard(SUMMARY_FILE)
+    if os.path.exists(SUMMARY_FILE):
+        os.remove(SUMMARY_FILE)
+
+
+def _load_summary():
+    global _summary, _summary_path
+    if _summary is None or _summary_path != SUMMARY_FILE:
+        _summary = None
+        _summary_path = SUMMARY_FILE
+        flush(SUMMARY_FILE)
+        if os.path.exists(SUMMARY_FILE):
+            try:
+                with open(SUMMARY_FILE, "r", encoding="utf-8") as f:
+                    _summary = json.load(f).get("checkpoints")
+            except (OSError, ValueError, AttributeError) as e:
+                print(f"[Error] Failed to load summary checkpoint: {e}")
+    return _summary
+
+
+def _store_summary(key, checkpoint):
+    global _summary, _summary_path
+    checkpoints = dict(_load_summary() or {})
+    checkpoints.pop(key, None)
+    checkpoints[key] = checkpoint
+    while len(checkpoints) > _SUMMARY_LIMIT:
+        checkpoints.pop(next(iter(checkpoints)))
+    _summary = checkpoints
+    _summary_path = SUMMARY_FILE
+    write_json(SUMMARY_FILE, {"checkpoints": checkpoints}, indent=None)
+
+
+def _fingerprint(msg):
+    data = json.dumps(msg, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def _fold_summary(text, messages, max_chars):
+    """Append ``messages`` to ``text``, stopping once it exceeds ``max_chars``.
+
+    Only ``max_chars + 1`` characters are kept; anything past the limit would
+    be truncated from the final summary anyway.
+    """
+    for msg in messages:
+        if len(text) > max_chars:
+            break
+        content = msg.get("content", "").strip()
+        if not content:
+            continue
+        if msg["role"] == "user":
+            part = f"User: {content}"
+        else:
+            agent = msg.get("agent", "assistant")
+            part = f"{agent}: {content}"
+        text = f"{text} {part}" if text else part
+    return text[:max_chars + 1]
+
+
+def _summary_text(history, count, max_chars, key=""):
+    """Return the folded summary text for ``history[:count]``.
+
+    For the shared cached history the result is checkpointed to
+    SUMMARY_FILE under ``key`` and later calls resume from the furthest
+    checkpoint, of any key, that does not pass ``count``. A checkpoint is
+    only reused if the message it ended on is unchanged.
+    """
+    persistent = history is _cache
+    with _lock:
+        checkpoints = (_load_summary() or {}) if persistent else {}
+        text, start = "", 0
+        candidates = sorted(
+            (c for c in checkpoints.values()
+             if c.get("max_chars") == max_chars and 0 < c.get("count", 0) <= count),
+            key=lambda c: c["count"],
+            reverse=True,
+        )
+        for checkpoint in candidates:
+            if checkpoint.get("fingerprint") == _fingerprint(history[checkpoint["count"] - 1]):
+                text, start = checkpoint["text"], checkpoint["count"]
+                break
+        if start == count:
+            return text
+        text = _fold_summary(text, history[start:count], max_chars)
+        if persistent:
+            _store_summary(key, {
+                "count": count,
+                "max_chars": max_chars,
+                "fingerprint": _fingerprint(history[count - 1]),
+                "text": text,
+            })
+        return text
+
+
+def summarize_history(history, threshold=20, max_chars=1000, key=None):
     """Condense older history into a single system message.
 
     If the number of messages exceeds ``threshold``, messages beyond the
     threshold are concatenated and truncated to ``max_chars`` characters. The
     condensed text is returned as a new system message prepended to the most
-    recent ``threshold`` messages.
+    recent ``threshold`` messages. When ``history`` is the cached history from
+    :func:`get_history`, the summary is built incrementally from saved
+    checkpoints, one per ``key``.
 
     Args:
         history (list): Full chat history.
         threshold (int, optional): Number of recent messages to keep. Defaults
             to 20.
         max_chars (int, optional): Maximum characters for the summary.
+        key (str, optional): Whose checkpoint to update, usually the agent
+            name; callers summarizing up to different points should use
+            different keys.
 
     Returns:
         list: Summarized chat history.
@@ -104,21 +673,9 @@ def summarize_history(history, threshold=20, max_chars=1000):
     if len(history) <= threshold:
         return history[:]
 
-    old_msgs = history[:-threshold]
     recent = history[-threshold:]
 
-    parts = []
-    for msg in old_msgs:
-        content = msg.get("content", "").strip()
-        if not content:
-            continue
-        if msg["role"] == "user":
-            parts.append(f"User: {content}")
-        else:
-            agent = msg.get("agent", "assistant")
-            parts.append(f"{agent}: {content}")
-
-    summary_text = " ".join(parts)
+    summary_text = _summary_text(history, len(history) - threshold, max_chars, key or "")
     if len(summary_text) > max_chars:
         summary_text = summary_text[:max_chars].rstrip() + "..."
 
@@ -1,21 +1,57 @@
 # worker.py
 
+import asyncio
+import contextlib
 import json
-import requests
 import logging
+import time
+import aiohttp
 from PyQt5.QtCore import QObject, pyqtSignal
 from transcripts import append_message
+from context_builder import context_budget
+from response_cache import cache_key, get_cached, store
+from backends import (
+    select_backend, acquire, release, mark_failed, mark_healthy, get_backends,
+)
+from resilience import get_breaker, backoff_delay, CircuitOpenError, MAX_RETRIES
+from model_residency import keep_alive_for, note_request, prefetch
+from stream_parser import ProtocolScanner
 
-# API Configuration
+# API Configuration. Workers without an api_url are routed by backends.py.
 OLLAMA_API_URL = "http://localhost:11434/api/chat"
 
+# Streamed tokens are batched into one response_received signal per
+# FLUSH_INTERVAL seconds or FLUSH_CHARS characters, whichever comes first.
+FLUSH_INTERVAL = 0.03
+FLUSH_CHARS = 256
+
+# Self-consistency thinking: each sample answers SAMPLE_PROMPT on its own,
+# then one request combines them using the agent's aggregation strategy.
+SAMPLE_PROMPT = "Think through the task above step by step, then give your answer."
+AGGREGATION_PROMPTS = {
+    "synthesize": (
+        "Combine the strongest reasoning from these attempts into one final"
+        " answer to the original prompt."
+    ),
+    "vote": (
+        "Reply with the answer most of these attempts agree on, without"
+        " mentioning the attempts."
+    ),
+}
+
 class AIWorker(QObject):
     response_received = pyqtSignal(str, str)
+    # Streamed thinking-step text, as (chunk, agent_name)
+    thought_received = pyqtSignal(str, str)
     error_occurred = pyqtSignal(str)
     finished = pyqtSignal()
+    # A finished thinking step or sample to save to the history. Workers
+    # live in the GUI thread, so the save runs there rather than blocking
+    # the engine's event loop or racing the GUI's reads of the history.
+    thought_saved = pyqtSignal(str)
 
     def __init__(self, model_name, chat_history, temperature, max_tokens,
-                 debug_enabled, agent_name, agents_data, api_url=OLLAMA_API_URL):
+                 debug_enabled, agent_name, agents_data, api_url=None):
         super().__init__()
         self.model_name = model_name
         self.chat_history = chat_history
@@ -24,137 +60,472 @@ class AIWorker(QObject):
         self.debug_enabled = debug_enabled
         self.agent_name = agent_name
         self.agents_data = agents_data  # Store a reference to agents_data
+        # Fixed endpoint, or None to pick a backend for every request
         self.api_url = api_url
+        self.thought_saved.connect(self._save_thought)
         settings = self.agents_data.get(self.agent_name, {})
         self.thinking_enabled = settings.get("thinking_enabled", False)
         self.thinking_steps = int(settings.get("thinking_steps", 0))
+        self.thinking_samples = int(settings.get("thinking_samples", 1))
+        self.thinking_aggregation = settings.get("thinking_aggregation", "synthesize")
+        # Ask Ollama for the same context size the prompt was budgeted for
+        self.context_tokens, _ = context_budget(settings)
+        # Set by the inference engine when the request is cancelled
+        self.cancelled = False
+        # Set by the inference engine: takes a count and returns a context
+        # manager holding up to that many more free dispatcher slots
+        self.extra_slots = None
+        # "hit" or "miss" when the reply was looked up in the response cache
+        self.cache_result = None
+        # Watches the reply for a finished tool request or handoff
+        self.scanner = None
+        # True if reading stopped once the scanner found one
+        self.stopped_early = False
+        self._pending_chunks = []
+        self._pending_chars = 0
+        self._pending_thought = False
+        self._last_flush = time.monotonic()
 
-    def run(self):
+    async def run_async(self, session):
+        """Process the request on the inference engine's event loop.
+
+        ``session`` is the engine's ``aiohttp.ClientSession``. Cancellation is
+        not caught here; the engine reports it and emits ``finished``.
+        """
         try:
             if self.debug_enabled:
-                print(f"[Debug] Worker run started for agent '{self.agent_name}'.")
+                print(f"[Debug] Async worker started for agent '{self.agent_name}'.")
+
+            if self._skip_turn():
+                self.finished.emit()
+                return
 
-            # Access agent settings using the provided agents_data
-            agent_settings = self.agents_data.get(self.agent_name, {})
+            note_request(self.agent_name, self.model_name, self.debug_enabled)
 
-            if agent_settings.get('role') == 'Specialist':
-                # Check if the last message indicates that this specialist should respond
-                if not self.chat_history[-1]['content'].endswith(f"Next Response By: {self.agent_name}"):
-                    if self.debug_enabled:
-                        print(f"[Debug] Specialist '{self.agent_name}' not addressed. Skipping response.")
+            messages = self.chat_history
+            if self.thinking_enabled and self.thinking_samples > 1:
+                messages = self._aggregate(await self._run_samples(session))
+                if messages is None:
                     self.finished.emit()
                     return
-
-            if self.thinking_enabled and self.thinking_steps > 0:
-                original_prompt = self.chat_history[-1]["content"]
-                thoughts = []
-
-                def single_request(history):
-                    payload = {
-                        "model": self.model_name,
-                        "messages": history,
-                        "temperature": self.temperature,
-                        "max_tokens": self.max_tokens,
-                        "stream": False,
-                    }
-                    resp = requests.post(self.api_url, json=payload, timeout=60)
-                    resp.raise_for_status()
-                    data = resp.json()
-                    return data.get("message", {}).get("content", "")
-
+            elif self.thinking_enabled and self.thinking_steps > 0:
+                messages = self._thinking_start()
                 for step in range(1, self.thinking_steps + 1):
-                    prompt = f"{original_prompt}\nStep {step} of {self.thinking_steps}: think about the task."
-                    if thoughts:
-                        previous = "\n".join(
-                            f"Step {i + 1}: {t}" for i, t in enumerate(thoughts)
-                        )
-                        prompt += f"\nPrevious steps:\n{previous}"
-                    step_history = self.chat_history[:-1] + [
-                        {"role": "user", "content": prompt}
-                    ]
-                    thought = single_request(step_history).strip()
-                    thoughts.append(thought)
-                    append_message(
-                        self.chat_history,
-                        "assistant",
-                        f"<thought>Step {step}: {thought}</thought>",
-                        self.agent_name,
-                        debug_enabled=self.debug_enabled,
-                    )
-
-                thinking_text = "\n".join(
-                    f"Step {i + 1}: {t}" for i, t in enumerate(thoughts)
-                )
-                final_prompt = (
-                    f"{original_prompt}\nHere is your thinking:\n{thinking_text}\n"
-                    "Answer the original prompt using this context."
-                )
-                self.chat_history[-1]["content"] = final_prompt
-
-            payload = {
-                "model": self.model_name,
-                "messages": self.chat_history,
-                "temperature": self.temperature,
-                "max_tokens": self.max_tokens,
-                "stream": True,
-                "options": {
-                    "stop": [
-                        "</s>",
-                        "<|im_end|>"
-                    ]
-                }
-            }
-
-            if self.debug_enabled:
-                payload_copy = json.loads(json.dumps(payload))
-                for message in payload_copy.get('messages', []):
-                    if 'images' in message:
-                        message['images'] = ['[Image data omitted in debug output]']
-                print("[Debug] Sending request to Ollama API:", json.dumps(payload_copy, indent=2))
+                    parts = []
+                    self._start_thought(step)
+                    if not await self._stream(session, messages, parts, thought=True):
+                        self.finished.emit()
+                        return
+                    messages = self._add_thought(step, parts, messages)
 
-            response = requests.post(self.api_url, json=payload, stream=True)
-            response.raise_for_status()  # Raise an exception for bad status codes
-
-            for line in response.iter_lines(decode_unicode=True):
-                if line:
-                    if self.debug_enabled:
-                        print(f"[Debug] Received line: {line}")
-                    try:
-                        line_data = json.loads(line)
-                        if "message" in line_data and "content" in line_data["message"]:
-                            chunk = line_data["message"]["content"]
-                            self.response_received.emit(chunk, self.agent_name)
-                        elif "error" in line_data:
-                            error_msg = line_data["error"]
-                            logging.error(error_msg)
-                            self.error_occurred.emit(f"[Error] {error_msg}")
-                            if self.debug_enabled:
-                                print(f"[Debug] Error in response: {error_msg}")
-                            break
-                        elif line_data.get("done"):
-                            if self.debug_enabled:
-                                print(f"[Debug] Stream finished for agent '{self.agent_name}'.")
-                            break
-                    except ValueError as e:
-                        error_msg = f"[Error] Failed to parse line as JSON: {e}"
-                        logging.error(error_msg)
-                        if self.debug_enabled:
-                            print(error_msg)
-                        self.error_occurred.emit(error_msg)
+            await self._stream(session, messages)
             self.finished.emit()
 
-        except requests.exceptions.RequestException as e:
-            error_msg = f"[Error] Request error: {e}"
-            logging.error(error_msg)
-            if self.debug_enabled:
-                print(error_msg)
-            self.error_occurred.emit(error_msg)
+        except (aiohttp.ClientError, CircuitOpenError) as e:
+            self._fail(f"[Error] Request error: {e}")
             self.finished.emit()
 
+        except asyncio.TimeoutError:
+            # Raised by the session's own socket timeouts; the engine's
+            # overall timeout arrives here as a cancellation instead.
+            self._fail("[Error] Request error: timed out waiting for Ollama")
+            self.finished.emit()
+
         except Exception as e:
-            error_msg = f"[Error] Exception in worker run: {e}"
+            self._fail(f"[Error] Exception in worker run: {e}")
+            self.finished.emit()
+
+    async def _stream(self, session, messages, parts=None, thought=False):
+        """Stream a chat request, emitting chunks as they arrive.
+
+        Chunks are collected in ``parts`` if given. ``thought`` chunks are
+        thinking output and are emitted as ``thought_received``; replies are
+        looked up in and added to the response cache. Reading stops early
+        once the reply's tool request or handoff is complete. Returns False
+        if the stream reported an error.
+        """
+        payload = self._payload(messages, stream=True)
+        key = None if thought else cache_key(payload)
+        if await self._replay(key):
+            return True
+        self._debug_payload(payload)
+        parts = [] if parts is None else parts
+        if not thought:
+            self._start_scan()
+        resp, backend = await self._post(session, payload)
+        try:
+            async with resp:
+                resp.raise_for_status()
+                try:
+                    # Ollama sends one JSON object per line
+                    async for raw_line in resp.content:
+                        line = raw_line.decode("utf-8").strip()
+                        if line and not self._handle_line(line, parts, thought):
+                            return False
+                        if self._stop_early(thought):
+                            break
+                finally:
+                    # Deliver buffered text even if cancelled or timed out
+                    self._flush_chunks()
+        finally:
+            release(backend)
+        if key is not None:
+            await self._in_thread(store, key, "".join(parts), self.debug_enabled)
+        return True
+
+    async def _post(self, session, payload):
+        """POST ``payload`` to Ollama and return ``(response, backend)``.
+
+        Unpinned workers are routed to the least loaded backend. Nothing has
+        been generated until a response arrives, so connection errors and
+        5xx replies are retried: first on the other hosts, then on all of
+        them after an exponential backoff. The response body has not been
+        read; the caller must ``release`` the backend when done with it. If
+        the request is cancelled first, the backend is released here.
+        """
+        attempt = 0
+        tried = []
+        while True:
+            backend, url = self._route(tried)
+            breaker = get_breaker(url)
+            if breaker.allow():
+                try:
+                    resp = await session.post(url, json=payload)
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    error = e
+                except BaseException:
+                    # Cancelled, e.g. by Stop or the engine's timeout
+                    breaker.abandon()
+                    release(backend)
+                    raise
+                else:
+                    if resp.status < 500:
+                        breaker.record_success()
+                        mark_healthy(backend)
+                        return resp, backend
+                    error = aiohttp.ClientResponseError(
+                        resp.request_info, resp.history, status=resp.status,
+                        message=resp.reason or "Server Error",
+                    )
+                    resp.release()
+                breaker.record_failure()
+            else:
+                error = CircuitOpenError(breaker)
+            attempt, delay = self._next_attempt(backend, tried, attempt, error)
+            await asyncio.sleep(delay)
+
+    def _next_attempt(self, backend, tried, attempt, error):
+        """Return ``(attempt, delay)`` for the next try, or raise ``error``.
+
+        Another host is tried straight away. Once every host has failed the
+        request is retried after a backoff, up to ``MAX_RETRIES`` times. An
+        open circuit breaker is not retried.
+        """
+        release(backend)
+        if backend is not None:
+            if not isinstance(error, CircuitOpenError):
+                mark_failed(backend, self.debug_enabled)
+            tried.append(backend)
+            if len(tried) < len(get_backends()):
+                return attempt, 0
+            tried.clear()
+        if isinstance(error, CircuitOpenError) or attempt >= MAX_RETRIES:
+            raise error
+        delay = backoff_delay(attempt)
+        if self.debug_enabled:
+            print(
+                f"[Debug] Request for '{self.agent_name}' failed ({error});"
+                f" retry {attempt + 1} of {MAX_RETRIES} in {delay:.1f}s"
+            )
+        return attempt + 1, delay
+
+    def _route(self, tried):
+        if self.api_url:
+            return None, self.api_url
+        backend = select_backend(self.model_name, tried)
+        acquire(backend)
+        if self.debug_enabled:
+            print(f"[Debug] Routing '{self.agent_name}' to {backend.url}")
+        return backend, backend.chat_url
+
+    async def _in_thread(self, fn, *args):
+        """Run blocking file work off the event loop and return its result."""
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    async def _replay(self, key):
+        """Emit a cached reply as if it were streamed. Returns True on a hit."""
+        if key is None:
+            return False
+        cached = await self._in_thread(get_cached, key, self.debug_enabled)
+        if cached is None:
+            self.cache_result = "miss"
+            return False
+        self.cache_result = "hit"
+        if self.debug_enabled:
+            print(f"[Debug] Replaying cached response for agent '{self.agent_name}'.")
+        for start in range(0, len(cached), FLUSH_CHARS):
+            self._queue_chunk(cached[start:start + FLUSH_CHARS])
+        self._flush_chunks()
+        return True
+
+    def _skip_turn(self):
+        """Return True if a Specialist was not addressed by the last message."""
+        agent_settings = self.agents_data.get(self.agent_name, {})
+        if agent_settings.get('role') == 'Specialist':
+            if not self.chat_history[-1]['content'].endswith(f"Next Response By: {self.agent_name}"):
+                if self.debug_enabled:
+                    print(f"[Debug] Specialist '{self.agent_name}' not addressed. Skipping response.")
+                return True
+        return False
+
+    def _payload(self, messages, stream):
+        options = {"num_ctx": self.context_tokens}
+        if stream:
+            options["stop"] = [
+                "</s>",
+                "<|im_end|>"
+            ]
+        return {
+            "model": self.model_name,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stream": stream,
+            "options": options,
+            # How long Ollama keeps the model loaded, by how soon it is reused
+            "keep_alive": keep_alive_for(self.model_name),
+        }
+
+    def _thinking_start(self):
+        """Return the conversation for the first thinking step.
+
+        Each step appends the previous thought and a short instruction, so
+        every request extends the one before it and Ollama can reuse its
+        cached prompt instead of re-reading a rewritten one.
+        """
+        original_prompt = self.chat_history[-1]["content"]
+        return self.chat_history[:-1] + [{
+            "role": "user",
+            "content": f"{original_prompt}\nStep 1 of {self.thinking_steps}: think about the task.",
+        }]
+
+    def _start_thought(self, step):
+        self._queue_chunk(f"Step {step}: ", thought=True)
+
+    def _add_thought(self, step, parts, messages):
+        """Record a finished thinking step and return the next conversation."""
+        thought = "".join(parts).strip()
+        self._queue_chunk("\n", thought=True)
+        self.thought_saved.emit(f"<thought>Step {step}: {thought}</thought>")
+        if step < self.thinking_steps:
+            instruction = f"Step {step + 1} of {self.thinking_steps}: think about the task."
+        else:
+            instruction = "Answer the original prompt using your thinking above."
+        return messages + [
+            {"role": "assistant", "content": thought},
+            {"role": "user", "content": instruction},
+        ]
+
+    def _sample_payload(self):
+        payload = self._payload(
+            self.chat_history + [{"role": "user", "content": SAMPLE_PROMPT}], stream=False
+        )
+        self._debug_payload(payload)
+        return payload
+
+    async def _run_samples(self, session):
+        """Request the thinking samples at once and return their texts.
+
+        The first sample uses the request's own dispatcher slot and others
+        run in whatever extra slots the engine has free, so samples count
+        against its request and per-model limits like separate requests.
+        Samples beyond those slots wait for one of them to finish rather
+        than for a new slot, so two requests cannot wait on each other.
+        Pending samples are cancelled if the request is.
+        """
+        payload = self._sample_payload()
+
+        async def fetch():
+            resp, backend = await self._post(session, payload)
+            try:
+                async with resp:
+                    resp.raise_for_status()
+                    data = await resp.json(content_type=None)
+            finally:
+                release(backend)
+            return data.get("message", {}).get("content", "")
+
+        async def sample(slots):
+            async with slots:
+                return await fetch()
+
+        extra_slots = self.extra_slots or contextlib.nullcontext
+        with extra_slots(self.thinking_samples - 1) as extra:
+            slots = asyncio.Semaphore(extra + 1)
+            tasks = [asyncio.ensure_future(sample(slots)) for _ in range(self.thinking_samples)]
+            samples = []
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    try:
+                        self._add_sample(await next_done, samples)
+                    except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+                        self._sample_failed(e)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                # Let cancelled samples clean up before their slots are released
+                await asyncio.gather(*tasks, return_exceptions=True)
+        return samples
+
+    def _add_sample(self, text, samples):
+        """Show and record a finished sample in the order samples complete."""
+        text = text.strip()
+        samples.append(text)
+        index = len(samples)
+        self._queue_chunk(f"Sample {index}: {text}\n", thought=True)
+        self.thought_saved.emit(f"<thought>Sample {index}: {text}</thought>")
+
+    def _save_thought(self, content):
+        """Append a thought to the history; runs in the worker's thread."""
+        append_message([], "assistant", content, self.agent_name, debug_enabled=self.debug_enabled)
+
+    def _sample_failed(self, error):
+        logging.error(f"[Error] Thinking sample failed: {error}")
+        if self.debug_enabled:
+            print(f"[Debug] Thinking sample for '{self.agent_name}' failed: {error}")
+
+    def _aggregate(self, samples):
+        """Return the conversation that combines ``samples`` into an answer.
+
+        The conversation starts with the same messages as the samples so
+        Ollama can reuse the cached prompt. Returns None if every sample
+        failed.
+        """
+        self._flush_chunks()
+        if not samples:
+            self._fail("[Error] Request error: every thinking sample failed")
+            return None
+        attempts = "\n\n".join(
+            f"Attempt {i + 1}:\n{text}" for i, text in enumerate(samples)
+        )
+        instruction = AGGREGATION_PROMPTS.get(
+            self.thinking_aggregation, AGGREGATION_PROMPTS["synthesize"]
+        )
+        return self.chat_history + [{
+            "role": "user",
+            "content": f"Independent attempts at the task above:\n\n{attempts}\n\n{instruction}",
+        }]
+
+    def _debug_payload(self, payload):
+        if self.debug_enabled:
+            payload_copy = json.loads(json.dumps(payload))
+            for message in payload_copy.get('messages', []):
+                if 'images' in message:
+                    message['images'] = ['[Image data omitted in debug output]']
+            print("[Debug] Sending request to Ollama API:", json.dumps(payload_copy, indent=2))
+
+    def _fail(self, error_msg):
+        logging.error(error_msg)
+        if self.debug_enabled:
+            print(error_msg)
+        self.error_occurred.emit(error_msg)
+
+    def _start_scan(self):
+        """Watch the next reply for a tool request or a Coordinator handoff."""
+        targets = []
+        settings = self.agents_data.get(self.agent_name, {})
+        if settings.get("role") == "Coordinator":
+            targets = settings.get("managed_agents", [])
+        self.scanner = ProtocolScanner(targets)
+
+    def _scan(self, chunk):
+        """Feed reply text to the scanner and return the part of ``chunk`` to keep.
+
+        Text after a finished request or handoff line is dropped. A handoff
+        starts loading the target agent's model.
+        """
+        scanner = self.scanner
+        if scanner is None or scanner.done or not scanner.feed(chunk):
+            return chunk
+        if scanner.handoff:
+            model = self.agents_data.get(scanner.handoff, {}).get("model", "").strip()
+            if model:
+                prefetch(model, self.debug_enabled)
+        return chunk[:max(len(chunk) - (scanner.length - scanner.end), 0)]
+
+    def _stop_early(self, thought):
+        """Return True if the rest of the reply can be dropped."""
+        if thought or self.scanner is None or not self.scanner.done:
+            return False
+        if not self.stopped_early and self.debug_enabled:
+            found = "handoff" if self.scanner.handoff else "request"
+            print(f"[Debug] Stopping reply of '{self.agent_name}' after its {found}.")
+        self.stopped_early = True
+        return True
+
+    def _queue_chunk(self, chunk, thought=False):
+        """Buffer a streamed chunk and emit the buffer when it is due."""
+        if not chunk:
+            return
+        if thought != self._pending_thought:
+            self._flush_chunks()
+            self._pending_thought = thought
+        self._pending_chunks.append(chunk)
+        self._pending_chars += len(chunk)
+        if (
+            self._pending_chars >= FLUSH_CHARS
+            or time.monotonic() - self._last_flush >= FLUSH_INTERVAL
+        ):
+            self._flush_chunks()
+
+    def _flush_chunks(self):
+        """Emit buffered chunks as one ``response_received`` signal."""
+        self._last_flush = time.monotonic()
+        if not self._pending_chunks:
+            return
+        text = "".join(self._pending_chunks)
+        self._pending_chunks = []
+        self._pending_chars = 0
+        if self._pending_thought:
+            self.thought_received.emit(text, self.agent_name)
+        else:
+            self.response_received.emit(text, self.agent_name)
+
+    def _handle_line(self, line, parts=None, thought=False):
+        """Handle one line of a streaming response.
+
+        Content is collected in ``parts`` if given and emitted as thinking
+        output if ``thought`` is set. Returns False if the stream reported an
+        error and reading should stop.
+        """
+        if self.debug_enabled:
+            print(f"[Debug] Received line: {line}")
+        try:
+            line_data = json.loads(line)
+            if "message" in line_data and "content" in line_data["message"]:
+                chunk = line_data["message"]["content"]
+                if not thought:
+                    chunk = self._scan(chunk)
+                if parts is not None:
+                    parts.append(chunk)
+                self._queue_chunk(chunk, thought=thought)
+            elif "error" in line_data:
+                self._flush_chunks()
+                error_msg = line_data["error"]
+                logging.error(error_msg)
+                self.error_occurred.emit(f"[Error] {error_msg}")
+                if self.debug_enabled:
+                    print(f"[Debug] Error in response: {error_msg}")
+                return False
+            elif line_data.get("done"):
+                if self.debug_enabled:
+                    print(f"[Debug] Stream finished for agent '{self.agent_name}'.")
+                # Keep reading to the end of the body so the
+                # connection can be reused by the pool.
+        except ValueError as e:
+            error_msg = f"[Error] Failed to parse line as JSON: {e}"
             logging.error(error_msg)
             if self.debug_enabled:
                 print(error_msg)
             self.error_occurred.emit(error_msg)
-            self.finished.emit()
+        return True
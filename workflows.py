@@ -3,11 +3,13 @@
 import os
 import json
 import uuid
+from persistence import write_json, flush
 
 WORKFLOWS_FILE = "workflows.json"
 
 
 def load_workflows(debug_enabled=False):
+    flush(WORKFLOWS_FILE)
     if not os.path.exists(WORKFLOWS_FILE):
         return []
     try:
@@ -22,13 +24,9 @@ def load_workflows(debug_enabled=False):
 
 
 def save_workflows(workflows, debug_enabled=False):
-    try:
-        with open(WORKFLOWS_FILE, "w", encoding="utf-8") as f:
-            json.dump(workflows, f, indent=2)
-        if debug_enabled:
-            print("[Debug] Workflows saved")
-    except Exception as e:
-        print(f"[Error] Failed to save workflows: {e}")
+    write_json(WORKFLOWS_FILE, workflows, debug_enabled=debug_enabled)
+    if debug_enabled:
+        print("[Debug] Workflows save queued")
 
 
 def add_workflow(